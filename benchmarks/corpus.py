@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+import os
+import random
+
+# Difficulties and game types that the generated charts pick from.
+DIFFICULTIES = ["Beginner", "Easy", "Medium", "Hard", "Challenge"]
+GAME_TYPES = [("dance-single", 4), ("dance-double", 8)]
+STEPPERS = ["Dossar", "Zaia", "Ryuu", "Mootz", "", "Aoreo"]
+WORDS = ["Night", "Fire", "Drive", "Heart", "Star", "Break", "Zero", "Blue", "Rush", "Ghost",
+         "Kaleido", "Phase", "Storm", "Echo", "Pulse", "Nova"]
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makeName(rng, wordCount):
+    return " ".join(rng.choice(WORDS) for i in range(wordCount))
+
+def makeBpmString(rng):
+    """
+    Returns a #BPMS value with up to four BPM changes.
+    """
+    beat = 0.0
+    changes = []
+    for i in range(rng.choice([1, 1, 1, 2, 4])):
+        changes.append("{0:.3f}={1:.3f}".format(beat, rng.uniform(80.0, 240.0)))
+        beat += rng.choice([32.0, 64.0, 128.0])
+    return ",\n".join(changes)
+
+def makeNoteRow(rng, columns, density):
+    """
+    Returns one row of note data. Mostly empty rows, with taps, holds, rolls and mines
+    mixed in depending on density.
+    """
+    row = []
+    for column in range(columns):
+        pick = rng.random()
+        if pick < density:
+            row.append("1")
+        elif pick < density * 1.15:
+            row.append("2")
+        elif pick < density * 1.2:
+            row.append("4")
+        elif pick < density * 1.3:
+            row.append("3")
+        elif pick < density * 1.4:
+            row.append("M")
+        else:
+            row.append("0")
+    return "".join(row)
+
+def makeChart(rng, gameType, columns, difficulty, measures):
+    """
+    Returns the lines of one #NOTES block.
+    """
+    stepper = rng.choice(STEPPERS)
+    density = 0.05 + DIFFICULTIES.index(difficulty) * 0.04
+    lines = ["//---------------" + gameType + " - " + stepper + "----------------",
+             "#NOTES:",
+             "     " + gameType + ":",
+             "     " + stepper + ":",
+             "     " + difficulty + ":",
+             "     " + str(rng.randint(1, 20)) + ":",
+             "     0.1,0.2,0.3,0.4,0.5:"]
+    for measure in range(measures):
+        rowsPerMeasure = rng.choice([4, 8, 16, 16, 24, 32])
+        for row in range(rowsPerMeasure):
+            lines.append(makeNoteRow(rng, columns, density))
+        if measure == measures - 1:
+            lines.append(";")
+        elif rng.random() < 0.2:
+            lines.append(",  // measure " + str(measure + 1))
+        else:
+            lines.append(",")
+    return lines
+
+def makeStepfile(rng, title, artist):
+    """
+    Returns the text of a whole .sm file. Some files get a BOM, CRLF line endings,
+    lower-case tags, several tags on one line or extra whitespace, like real packs do.
+    """
+    header = [("TITLE", title), ("SUBTITLE", rng.choice(["", "(Extended Mix)", "~EX~"])),
+              ("ARTIST", artist), ("BANNER", rng.choice(["bn.png", "./banner.png", ""])),
+              ("MUSIC", "song.ogg"), ("OFFSET", "{0:.3f}".format(rng.uniform(-0.1, 0.1))),
+              ("SAMPLESTART", "30.000"), ("BPMS", makeBpmString(rng)), ("STOPS", "")]
+    oddHeaders = rng.random() < 0.3
+    lines = []
+    for tag, value in header:
+        if oddHeaders and rng.random() < 0.3:
+            tag = tag.lower()
+        lines.append("#" + tag + ":" + value + ";")
+    if oddHeaders:
+        lines[0] = lines[0] + lines.pop(1)  # Two tags on one line
+        lines.insert(2, "   ")
+
+    # Pick which charts the song has. Keys are unique per game type and difficulty.
+    charts = [(gameType, columns, difficulty) for gameType, columns in GAME_TYPES for difficulty in DIFFICULTIES]
+    rng.shuffle(charts)
+    for gameType, columns, difficulty in charts[:rng.randint(1, 9)]:
+        lines.extend(makeChart(rng, gameType, columns, difficulty, rng.randint(16, 120)))
+
+    newline = "\r\n" if rng.random() < 0.2 else "\n"
+    text = newline.join(lines) + newline
+    if rng.random() < 0.2:
+        text = "\ufeff" + text
+    return text
+
+def generateCorpus(outputDirectory, seed=0, packCount=5, songsPerPack=20):
+    """
+    Writes a synthetic Songs directory to outputDirectory. The same seed always
+    gives the same files. Returns a dictionary describing the corpus.
+    """
+    rng = random.Random(seed)
+    songCount = 0
+    totalBytes = 0
+    for packIndex in range(packCount):
+        packPath = os.path.join(outputDirectory, "Pack " + str(packIndex) + " " + makeName(rng, 2))
+        for songIndex in range(songsPerPack):
+            title = makeName(rng, rng.randint(1, 3))
+            stepArtist = rng.choice(["[", "(", "{"]) + rng.choice(STEPPERS[:-2])
+            stepArtist += {"[": "]", "(": ")", "{": "}"}[stepArtist[0]]
+            songFolder = os.path.join(packPath, str(songIndex) + " " + title + " " + stepArtist)
+            os.makedirs(songFolder, exist_ok=True)
+            text = makeStepfile(rng, title, makeName(rng, 1))
+            with open(os.path.join(songFolder, title + ".sm"), 'w', encoding="utf-8", newline="") as smFile:
+                smFile.write(text)
+            songCount += 1
+            totalBytes += len(text.encode("utf-8"))
+    return {'seed': seed, 'packs': packCount, 'songs': songCount, 'bytes': totalBytes}
@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+
+from benchmarks.corpus import generateCorpus
+from containers.songpack import discoverSongPacks
+from containers.stepfile import tokenizeStepfile, countStepData
+from containers.serializer import writeJson
+from combinejsons import writeCombinedJsonStreaming
+import argparse
+import codecs
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def timeStage(setup, run, repeat):
+    """
+    Calls setup() and then times run(setupResult), repeat times.
+    Returns a dictionary with the best and median time and every run's time in seconds.
+    """
+    runTimes = []
+    for i in range(repeat):
+        setupResult = setup()
+        start = time.perf_counter()
+        run(setupResult)
+        runTimes.append(time.perf_counter() - start)
+    return {'best': min(runTimes), 'median': statistics.median(runTimes), 'runs': runTimes}
+
+def readNoteData(packs):
+    """
+    Returns the note data of every chart in the packs, for timing countStepData on its own.
+    The note data is bytes, tokenized the same way parseStepfile does it.
+    """
+    noteData = []
+    for pack in packs:
+        for stepfile in pack.getStepfiles():
+            with open(stepfile.stepfilePath, 'rb') as smFile:
+                smBytes = smFile.read()
+            if smBytes.startswith(codecs.BOM_UTF8):
+                smBytes = smBytes[len(codecs.BOM_UTF8):]
+            for tag, value in tokenizeStepfile(smBytes.splitlines()):
+                if tag == 'NOTES':
+                    noteData.append(value.split(b':', 5)[5])
+    return noteData
+
+def parsePacks(packs):
+    for pack in packs:
+        for stepfile in pack.getStepfiles():
+            stepfile.parseStepfile()
+
+def parsedPacks(songsDirectory):
+    packs = discoverSongPacks(songsDirectory)
+    for pack in packs:
+        pack.parseStepfiles()
+    return packs
+
+def writePackJsons(packs, jsonsDirectory):
+    for pack in packs:
+        writeJson(os.path.join(jsonsDirectory, pack.getPackName() + ".json"), pack.getSongs())
+
+def runBenchmarks(workDirectory, seed, packCount, songsPerPack, repeat):
+    """
+    Generates the synthetic corpus in workDirectory and times every stage of the parser
+    on it separately. Returns the results dictionary.
+    """
+    songsDirectory = os.path.join(workDirectory, "Songs")
+    jsonsDirectory = os.path.join(workDirectory, "jsons")
+    os.makedirs(jsonsDirectory)
+    corpus = generateCorpus(songsDirectory, seed, packCount, songsPerPack)
+
+    stages = {}
+    stages['discovery'] = timeStage(lambda: songsDirectory, discoverSongPacks, repeat)
+    stages['parsing'] = timeStage(lambda: discoverSongPacks(songsDirectory), parsePacks, repeat)
+    noteData = readNoteData(discoverSongPacks(songsDirectory))
+    stages['counting'] = timeStage(lambda: noteData, lambda allNoteData: [countStepData(data) for data in allNoteData], repeat)
+    packs = parsedPacks(songsDirectory)
+    stages['serialization'] = timeStage(lambda: packs, lambda allPacks: writePackJsons(allPacks, jsonsDirectory), repeat)
+    jsonsFiles = sorted(os.listdir(jsonsDirectory))
+    outputJson = os.path.join(workDirectory, "allSongPacksJson.json")
+    stages['combinejsons'] = timeStage(lambda: jsonsFiles,
+                                       lambda files: writeCombinedJsonStreaming(jsonsDirectory, files, outputJson), repeat)
+
+    return {'corpus': corpus,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'stages': stages}
+
+def findRegressions(results, baseline, threshold):
+    """
+    Compares the best time of every stage against a baseline results dictionary.
+    Returns a list of (stage, baselineSeconds, seconds) for stages that got slower
+    by more than threshold (0.2 means 20%).
+    """
+    regressions = []
+    for stage, timing in results['stages'].items():
+        baselineTiming = baseline.get('stages', {}).get(stage)
+        if baselineTiming is None:
+            continue
+        if timing['best'] > baselineTiming['best'] * (1.0 + threshold):
+            regressions.append((stage, baselineTiming['best'], timing['best']))
+    return regressions
+
+# MAIN
+# python3 -m benchmarks.runbenchmarks --output bench.json --baseline old_bench.json
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Time every stage of the parser on a seeded synthetic song library.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus.")
+    parser.add_argument("--packs", type=int, default=5, help="Number of song packs to generate.")
+    parser.add_argument("--songs", type=int, default=20, help="Number of songs per pack.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per stage. The best run is compared.")
+    parser.add_argument("--output", default=None, help="Write the results JSON to this file instead of stdout.")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Fail when a stage is this much slower than the baseline. Defaults to 0.2 (20%%).")
+    parser.add_argument("--keep", default=None, help="Generate the corpus in this directory and keep it.")
+    args = parser.parse_args()
+
+    workDirectory = args.keep
+    if workDirectory is None:
+        workDirectory = tempfile.mkdtemp(prefix="songpackbench")
+    try:
+        results = runBenchmarks(workDirectory, args.seed, args.packs, args.songs, args.repeat)
+    finally:
+        if args.keep is None:
+            shutil.rmtree(workDirectory)
+
+    for stage, timing in results['stages'].items():
+        print(">>> runbenchmarks.py: " + stage + ": best " + str(round(timing['best'], 4)) +
+              " seconds, median " + str(round(timing['median'], 4)) + " seconds.", file=sys.stderr)
+    if args.output is None:
+        print(json.dumps(results, indent=4))
+    else:
+        with open(args.output, 'w') as outFile:
+            json.dump(results, outFile, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = findRegressions(results, baseline, args.threshold)
+        for stage, baselineSeconds, seconds in regressions:
+            print(">>> runbenchmarks.py: REGRESSION: " + stage + " took " + str(round(seconds, 4)) +
+                  " seconds, baseline was " + str(round(baselineSeconds, 4)) + " seconds.", file=sys.stderr)
+        if regressions != []:
+            sys.exit(1)
@@ -1,11 +1,125 @@
 #!/usr/bin/python3
 
+from containers.searchindex import SearchIndexBuilder
+from containers.columnar import ColumnarCatalogBuilder
+from containers.idregistry import IdRegistry
+from containers.serializer import (COMPRESSION_SUFFIXES, JsonOutput, dumpsJson, getEncoderName, getJsonPath,
+                                   isJsonFile, readJson, writeJson)
+from containers.shards import ShardWriter, getPackEntry, DEFAULT_SHARD_BYTES
+from containers.metrics import RunMetrics, StageClock
+import argparse
 import pprint
-import json
 import os
 import sys
 import time
 
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def writeCombinedJsonStreaming(jsonsDirectory, jsonsFiles, outputJson, compact=False, searchIndex=None,
+                               columnarCatalog=None, registry=None, compression=None, metrics=None, shardWriter=None):
+    """
+    Combines the song pack JSONs into one big JSON while only ever holding one
+    song pack in memory. Every pack file is loaded, gets its Id's assigned and
+    is written straight into the output object before the next one is read.
+
+    Without compact, the output is the same as dumpsJson(allPacksJson).
+    With compact, no indentation or spacing is written at all.
+    compression is passed on to JsonOutput.
+    If a RunMetrics is given, the 'read' and 'serialization' time of every pack goes to it.
+    If a SearchIndexBuilder is given, every song is added to it once it has its Id.
+    If a ColumnarCatalogBuilder is given, every song that is written is added to it.
+    If an IdRegistry is given, it hands out the Id's instead of the running counter.
+    If a ShardWriter is given, every pack that is written is added to it as well.
+
+    Returns a tuple of the number of Id's assigned and the finished JsonOutput.
+    """
+    idCounter = 0 # Id's start at zero to make indexing easier.
+    packNames = set()
+    with JsonOutput(outputJson, compression) as jsonOut:
+        jsonOut.write(b"{")
+        firstPack = True
+        for jsonPath in jsonsFiles:
+            clock = StageClock()
+            clock.switch('read')
+            data = readJson(os.path.join(jsonsDirectory, jsonPath))
+            clock.switch()
+
+            # Packs that are skipped don't get any id's or go into the search index.
+            try:
+                packName = data[0]['pack']
+            except:
+                print(">>> combinejsons.py: COMBINE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                      str(sys.exc_info()[1])))
+                continue
+            if packName in packNames:
+                print(">>> combinejsons.py: COMBINE: Song Pack '" + packName + "' was already written. Skipping '" + jsonPath + "'.")
+                continue
+            packNames.add(packName)
+
+            # Assign id's to every chart. Skipping the same packs in the same order as the
+            # in-memory combine, this gives the same id's and the same output.
+            for chart in data:
+                if registry is not None:
+                    registry.assignIds(chart)
+                else:
+                    chart['idNum'] = idCounter
+                idCounter += 1
+                if searchIndex is not None:
+                    searchIndex.addSong(chart)
+            if columnarCatalog is not None:
+                for chart in data:
+                    columnarCatalog.addSong(chart)
+
+            # Write this pack's entry into the output object and let it go.
+            clock.switch('serialization')
+            packJson = dumpsJson(data, compact)
+            jsonOut.write(getPackEntry(packName, packJson, compact, firstPack))
+            if shardWriter is not None:
+                shardWriter.addPack(packName, data, packJson)
+            firstPack = False
+            del data
+            clock.switch()
+            if metrics is not None:
+                for stage, seconds in clock.timings.items():
+                    metrics.addTime(stage, seconds, packName, jsonPath)
+
+        if compact or firstPack:
+            jsonOut.write(b"}")
+        else:
+            jsonOut.write(b"\n}")
+    return idCounter, jsonOut
+
+def writeRegistryDelta(registry, deltaPath=None):
+    """
+    Ends the run of the IdRegistry, saves it and writes its delta to deltaPath if given.
+    """
+    delta = registry.finishRun()
+    registry.save()
+    print(">>> combinejsons.py: REGISTRY: " + str(len(delta['added'])) + " charts added, " + str(len(delta['changed'])) +
+          " changed, " + str(len(delta['removed'])) + " removed.")
+    if deltaPath is not None:
+        writeJson(deltaPath, delta)
+        print(">>> combinejsons.py: REGISTRY: Delta written to '" + deltaPath + "'.")
+
+def writeShardManifest(shardWriter):
+    """
+    Writes the last shard and the manifest of a ShardWriter.
+    """
+    manifest = shardWriter.finish()
+    print(">>> combinejsons.py: SHARDS: " + str(len(manifest['shards'])) + " shards with " + str(manifest['songs']) +
+          " songs, " + str(manifest['bytes']) + " bytes, written to '" + shardWriter.shardsDirectory + "'.")
+
+def writeMetricsReport(metrics, reportPath=None):
+    """
+    Prints the stage summary of the run and writes the metrics report to reportPath if given.
+    """
+    print(metrics)
+    if reportPath is not None:
+        metrics.writeReport(reportPath)
+        print(">>> combinejsons.py: METRICS: Report written to '" + reportPath + "'.")
+
 # MAIN
 # C:\dev\cs_site\site_idea\Songs\jsons
 if __name__ == "__main__":
@@ -13,6 +127,53 @@ if __name__ == "__main__":
     # Create prettyprinter object
     pp = pprint.PrettyPrinter(indent=4)
 
+    # Command line options.
+    parser = argparse.ArgumentParser(description="Combine the song pack JSONs of a jsons directory into one JSON.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Load, number and write one song pack at a time so memory stays flat.")
+    parser.add_argument("--compact", action="store_true",
+                        help="Write the combined JSON without indentation. Roughly halves the file size.")
+    parser.add_argument("--compress", choices=sorted(COMPRESSION_SUFFIXES), default=None,
+                        help="Compress the combined JSON with gzip or zstd (needs the zstandard package). "
+                             "The pack JSONs are read either way.")
+    parser.add_argument("--search-index", default=None,
+                        help="Also build a title/artist/pack/stepartist search index and write it to this path.")
+    parser.add_argument("--columnar", default=None,
+                        help="Also write a memory-mappable binary columnar catalog to this path.")
+    parser.add_argument("--metrics", default=None,
+                        help="Write a JSON report of the time spent reading and writing every pack to this path.")
+    parser.add_argument("--shards", default=None,
+                        help="Also split the catalog into shards of a few packs each and write them, with a manifest "
+                             "of their packs, Id ranges, sizes and hashes, to this directory.")
+    parser.add_argument("--shard-mb", type=float, default=DEFAULT_SHARD_BYTES / (1024 * 1024),
+                        help="Megabytes of JSON (before compression) a shard is closed at. Packs bigger than this are "
+                             "split by Id range. Defaults to " + str(DEFAULT_SHARD_BYTES // (1024 * 1024)) + ".")
+    parser.add_argument("--registry", default=None,
+                        help="Take Id's from the Id registry at this path, so unchanged songs and charts keep their Id's "
+                             "across runs. Charts also get a 'chartId'. The registry is created if it doesn't exist.")
+    parser.add_argument("--delta", default=None,
+                        help="With --registry, write the charts added, changed and removed since the last run to this path.")
+    args = parser.parse_args()
+    metrics = RunMetrics()
+    searchIndex = None
+    if args.search_index is not None:
+        searchIndex = SearchIndexBuilder()
+    columnarCatalog = None
+    if args.columnar is not None:
+        columnarCatalog = ColumnarCatalogBuilder()
+    shardWriter = None
+    if args.shards is not None:
+        shardWriter = ShardWriter(args.shards, int(args.shard_mb * 1024 * 1024), args.compact, args.compress)
+    registry = None
+    if args.registry is not None:
+        registry = IdRegistry(args.registry)
+        try:
+            registry.load()
+        except:
+            print(">>> combinejsons.py: REGISTRY: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                  str(sys.exc_info()[1])))
+            sys.exit(1)
+
     # Prompt the user for the jsons directory.
     print(">>> combinejsons.py looks through a jsons directory that has individual "
           "json files representing song pack charts and combines all of them into "
@@ -26,35 +187,101 @@ if __name__ == "__main__":
         try:
             # Retrieve Songs directory from user
             jsonsDirectory = (input(">>> Input full path to jsons directory: ")).strip()
-            outputJson = os.path.join(jsonsDirectory, "allSongPacksJson.json")
-            try:
-                os.remove(outputJson)
-            except:
-                pass
-            jsonsFiles = os.listdir(jsonsDirectory)
+            outputJson = getJsonPath(os.path.join(jsonsDirectory, "allSongPacksJson"), args.compress)
+            for compression in [None] + list(COMPRESSION_SUFFIXES):
+                try:
+                    os.remove(getJsonPath(os.path.join(jsonsDirectory, "allSongPacksJson"), compression))
+                except:
+                    pass
+            jsonsFiles = [jsonFile for jsonFile in os.listdir(jsonsDirectory) if isJsonFile(jsonFile)]
             break
         except:
             print(">>> combinejsons.py: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                          str(sys.exc_info()[1])))
 
+    # In streaming mode, every pack is numbered and written on its own.
+    if args.stream:
+        print(">>> combinejsons.py: STREAM: Combining " + str(len(jsonsFiles)) + " packs one at a time.")
+        start = time.time()
+        try:
+            idCounter, jsonOut = writeCombinedJsonStreaming(jsonsDirectory, jsonsFiles, outputJson, args.compact,
+                                                            searchIndex, columnarCatalog, registry, args.compress,
+                                                            metrics, shardWriter)
+            print(">>> combinejsons.py: STREAM: Assigned " + str(idCounter) + " Id's. Wrote " + str(jsonOut.bytesWritten) +
+                  " bytes with " + getEncoderName() + ".")
+        except:
+            # Nothing else is written and the registry isn't saved, or the packs not streamed yet would be
+            # dropped from it and come back with new Id's on the next run.
+            print(">>> combinejsons.py: STREAM: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                 str(sys.exc_info()[1])))
+            print(">>> combinejsons.py: STREAM: Combine failed, nothing else was written.")
+            sys.exit(1)
+        end = time.time()
+        elapsed = end - start
+        print(">>> combinejsons.py: STREAM: JSON written in " + str(round(elapsed,3)) + " seconds.")
+        if searchIndex is not None:
+            searchIndex.write(args.search_index)
+            print(">>> combinejsons.py: INDEX: Search index written to '" + args.search_index + "'.")
+        if columnarCatalog is not None:
+            columnarCatalog.write(args.columnar)
+            print(">>> combinejsons.py: COLUMNAR: Columnar catalog written to '" + args.columnar + "'.")
+        if shardWriter is not None:
+            writeShardManifest(shardWriter)
+        if registry is not None:
+            writeRegistryDelta(registry, args.delta)
+        writeMetricsReport(metrics, args.metrics)
+        print(">>> combinejsons.py: Total Elapsed Time: " + str(round(elapsed,3)) + " seconds.")
+        sys.exit(0)
+
     # For every listed json file, add it to the jsons list.
     print(">>> combinejsons.py: ASSIGN: Assigning Id's to " + str(len(jsonsFiles))+ " packs.")
     start = time.time()
     idCounter = 0 # Id's start at zero to make indexing easier.
+    packNames = set()
     for jsonPath in jsonsFiles:
-        jsonFilePath = os.path.join(jsonsDirectory, jsonPath)
-        with open(jsonFilePath) as jsonFile:
-            # Load in JSON contents.
-            data = json.load(jsonFile)
+        # Load in JSON contents, compressed or not.
+        clock = StageClock()
+        clock.switch('read')
+        try:
+            data = readJson(os.path.join(jsonsDirectory, jsonPath))
+        except:
+            print(">>> combinejsons.py: ASSIGN: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                 str(sys.exc_info()[1])))
+            print(">>> combinejsons.py: ASSIGN: Combine failed, nothing was written.")
+            sys.exit(1)
+        clock.switch()
+        metrics.addTime('read', clock.timings['read'], None, jsonPath)
 
-            # Before appending this json data, assign id's to every chart.
+        # Skip packs without a name and later copies of a pack, like the streaming combine does.
+        try:
+            packName = data[0]['pack']
+        except:
+            print(">>> combinejsons.py: COMBINE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                  str(sys.exc_info()[1])))
+            continue
+        if packName in packNames:
+            print(">>> combinejsons.py: COMBINE: Song Pack '" + packName + "' was already written. Skipping '" + jsonPath + "'.")
+            continue
+        packNames.add(packName)
+
+        # Before appending this json data, assign id's to every chart.
+        try:
             for chart in data:
-                chart['idNum'] = idCounter
+                if registry is not None:
+                    registry.assignIds(chart)
+                else:
+                    chart['idNum'] = idCounter
                 idCounter += 1
+                if searchIndex is not None:
+                    searchIndex.addSong(chart)
+        except:
+            print(">>> combinejsons.py: ASSIGN: '" + jsonPath + "': {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                                  str(sys.exc_info()[1])))
+            print(">>> combinejsons.py: ASSIGN: Combine failed, nothing was written.")
+            sys.exit(1)
 
-            # Now append the json.
-            jsons.append(data)
-        jsonFile.close()
+        # Now append the json.
+        jsons.append(data)
     end = time.time()
     elapsed = end - start
     overallTime += elapsed
@@ -65,12 +292,7 @@ if __name__ == "__main__":
     start = time.time()
     allPacksJson = {}
     for jsonPack in jsons:
-        try:
-            packName = jsonPack[0]['pack']
-            allPacksJson[packName] = jsonPack
-        except:
-            print(">>> combinejsons.py: COMBINE: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                  str(sys.exc_info()[1])))
+        allPacksJson[jsonPack[0]['pack']] = jsonPack
     end = time.time()
     elapsed = end - start
     overallTime += elapsed
@@ -79,14 +301,29 @@ if __name__ == "__main__":
     # Now that we've got all the keys for the song packs and each has its song charts, write out the json.
     print(">>> combinejsons.py: WRITE: Attempting to write all song packs JSON...")
     start = time.time()
-    with open(outputJson, 'w') as jsonOut:
-        json.dump(allPacksJson, jsonOut, indent=4) # Uncomment this line if you want a nicely formatted JSON.
-        ## json.dump(allPacksJson, jsonOut) # No nice spacing for JSON, results in smaller file size
-    jsonOut.close()
+    jsonOut = writeJson(outputJson, allPacksJson, args.compact, args.compress) # Compact has no spacing, results in smaller file size
+    metrics.addTime('serialization', jsonOut.seconds, None, outputJson)
     end = time.time()
     elapsed = end - start
     overallTime += elapsed
-    print(">>> combinejsons.py: WRITE: JSON written succesfully in " + str(round(elapsed,3)) + " seconds.")
+    print(">>> combinejsons.py: WRITE: JSON written succesfully in " + str(round(elapsed,3)) + " seconds. " +
+          str(jsonOut.bytesWritten) + " bytes with " + getEncoderName() + ".")
+    if searchIndex is not None:
+        searchIndex.write(args.search_index)
+        print(">>> combinejsons.py: INDEX: Search index written to '" + args.search_index + "'.")
+    if columnarCatalog is not None:
+        for packSongs in allPacksJson.values():
+            for song in packSongs:
+                columnarCatalog.addSong(song)
+        columnarCatalog.write(args.columnar)
+        print(">>> combinejsons.py: COLUMNAR: Columnar catalog written to '" + args.columnar + "'.")
+    if shardWriter is not None:
+        for packName, packSongs in allPacksJson.items():
+            shardWriter.addPack(packName, packSongs)
+        writeShardManifest(shardWriter)
+    if registry is not None:
+        writeRegistryDelta(registry, args.delta)
+    writeMetricsReport(metrics, args.metrics)
     print(">>> combinejsons.py: Total Elapsed Time: " + str(round(overallTime,3)) + " seconds.")
     
 
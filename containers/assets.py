@@ -0,0 +1,494 @@
+#!/usr/bin/python3
+
+from concurrent.futures import ThreadPoolExecutor
+from containers.serializer import readJson, writeJson
+import os
+import sys
+import json
+import time
+import struct
+import logging
+import threading
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+assetsLogger = logging.getLogger("ASSETS")
+assetsLogger.addHandler(logging.NullHandler())
+
+# Bump this whenever the probe results change so old asset caches are thrown away.
+ASSET_CACHE_VERSION = 1
+
+# Song dictionary fields filled by AssetIndex.
+ASSET_FIELDS = ('bannerInfo', 'musicInfo')
+
+# Files probed at once. Probing is almost all waiting on open() and small reads.
+DEFAULT_ASSET_THREADS = 8
+
+# Bytes read from the start of an image, enough for the PNG and GIF headers.
+IMAGE_HEADER_BYTES = 32
+
+# JPEG segments skipped at most while looking for the frame header.
+MAX_JPEG_SEGMENTS = 64
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+GIF_MAGICS = (b"GIF87a", b"GIF89a")
+JPEG_MAGIC = b"\xff\xd8"
+
+# JPEG start of frame markers. 0xC4, 0xC8 and 0xCC share the range but aren't frames.
+JPEG_FRAME_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# JPEG markers without a length field.
+JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+
+# What the probes give for a file they can't read anything from.
+EMPTY_IMAGE_PROBE = {'format': None, 'width': None, 'height': None}
+EMPTY_AUDIO_PROBE = {'format': None, 'duration': None, 'sampleRate': None, 'channels': None, 'bitrate': None}
+
+# Bytes read from the start of an audio file (after an ID3v2 tag) and from the
+# end of an OGG file. A page is at most about 64KB, so the end is read again
+# with OGG_MAX_PAGE_BYTES in the rare case the last page starts further back.
+AUDIO_HEADER_BYTES = 4096
+OGG_TAIL_BYTES = 8192
+OGG_MAX_PAGE_BYTES = 65307
+
+OGG_MAGIC = b"OggS"
+OPUS_GRANULE_RATE = 48000
+ID3V2_MAGIC = b"ID3"
+ID3V1_MAGIC = b"TAG"
+RIFF_MAGIC = b"RIFF"
+
+# MPEG audio version bits -> (version, sample rates). Version 1 is MPEG-1, 2 is MPEG-2 and 2.5 is MPEG-2.5.
+MPEG_VERSIONS = {3: (1, (44100, 48000, 32000)), 2: (2, (22050, 24000, 16000)), 0: (2.5, (11025, 12000, 8000))}
+
+# (version is MPEG-1, layer) -> kbps of the bitrate index.
+MPEG_BITRATES = {(True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+                 (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+                 (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+                 (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+                 (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+                 (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)}
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def probeJpeg(imageFile):
+    """
+    Walks the segments of a JPEG from right after its magic bytes, seeking
+    over every segment, until the frame header with the dimensions comes up.
+    Returns (width, height), or None if there's no frame header.
+    """
+    imageFile.seek(2)
+    for segment in range(MAX_JPEG_SEGMENTS):
+        marker = imageFile.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        markerType = marker[1]
+        while markerType == 0xFF: # Fill bytes
+            fill = imageFile.read(1)
+            if fill == b"":
+                return None
+            markerType = fill[0]
+        if markerType in JPEG_STANDALONE_MARKERS:
+            continue
+        segmentLength = struct.unpack(">H", imageFile.read(2))[0]
+        if markerType in JPEG_FRAME_MARKERS:
+            frameHeader = imageFile.read(5)
+            if len(frameHeader) < 5:
+                return None
+            height, width = struct.unpack(">xHH", frameHeader)
+            return width, height
+        imageFile.seek(segmentLength - 2, os.SEEK_CUR)
+    return None
+
+def probeImage(imagePath):
+    """
+    Reads only the header of a PNG, GIF or JPEG image, without decoding it,
+    and returns a dictionary with its 'format', 'width' and 'height'. All of
+    them are None for any other kind of file.
+    """
+    probe = dict(EMPTY_IMAGE_PROBE)
+    with open(imagePath, 'rb') as imageFile:
+        header = imageFile.read(IMAGE_HEADER_BYTES)
+        if header.startswith(PNG_MAGIC) and header[12:16] == b"IHDR":
+            probe['format'] = 'png'
+            probe['width'], probe['height'] = struct.unpack(">II", header[16:24])
+        elif header[:6] in GIF_MAGICS:
+            probe['format'] = 'gif'
+            probe['width'], probe['height'] = struct.unpack("<HH", header[6:10])
+        elif header.startswith(JPEG_MAGIC):
+            probe['format'] = 'jpeg'
+            try:
+                dimensions = probeJpeg(imageFile)
+            except struct.error: # Cut off in the middle of a segment
+                dimensions = None
+            if dimensions is not None:
+                probe['width'], probe['height'] = dimensions
+    return probe
+
+def probeOgg(audioFile, header, fileSize):
+    """
+    Reads the sample rate and channels of an OGG Vorbis or Opus file from the
+    identification header in its first page, and the duration from the
+    granule position (samples so far) of the last page, found by seeking to
+    the end of the file.
+    """
+    probe = dict(EMPTY_AUDIO_PROBE)
+    packetStart = 27 + header[26] # Page header plus its segment table
+    packet = header[packetStart:]
+    preSkip = 0
+    if packet.startswith(b"\x01vorbis") and len(packet) >= 24:
+        probe['format'] = 'ogg'
+        probe['channels'], probe['sampleRate'], nominalBitrate = struct.unpack("<BIxxxxi", packet[11:24])
+        if nominalBitrate > 0:
+            probe['bitrate'] = nominalBitrate // 1000
+        granuleRate = probe['sampleRate']
+    elif packet.startswith(b"OpusHead") and len(packet) >= 16:
+        probe['format'] = 'opus'
+        probe['channels'], preSkip, probe['sampleRate'] = struct.unpack("<BHI", packet[9:16])
+        granuleRate = OPUS_GRANULE_RATE
+    else:
+        return probe
+    serial = header[14:18]
+
+    for tailBytes in (OGG_TAIL_BYTES, OGG_MAX_PAGE_BYTES):
+        audioFile.seek(max(fileSize - tailBytes, 0))
+        tail = audioFile.read(tailBytes)
+        pageStart = tail.rfind(OGG_MAGIC)
+        while pageStart != -1 and (len(tail) - pageStart < 27 or tail[pageStart+14:pageStart+18] != serial):
+            pageStart = tail.rfind(OGG_MAGIC, 0, pageStart)
+        if pageStart != -1:
+            granule = struct.unpack("<q", tail[pageStart+6:pageStart+14])[0]
+            if granule > 0 and granuleRate:
+                probe['duration'] = round(max(granule - preSkip, 0) / granuleRate, 3)
+            break
+        if tailBytes >= fileSize:
+            break
+    if probe['bitrate'] is None and probe['duration']:
+        probe['bitrate'] = int(fileSize * 8 / probe['duration'] / 1000)
+    return probe
+
+def getMpegFrame(header, position):
+    """
+    Parses the MPEG audio frame header at position and returns (version,
+    layer, kbps, sample rate, channels, frame length), or None if there isn't
+    a valid one.
+    """
+    if position + 4 > len(header) or header[position] != 0xFF or header[position+1] & 0xE0 != 0xE0:
+        return None
+    versionBits = (header[position+1] >> 3) & 0x03
+    layer = 4 - ((header[position+1] >> 1) & 0x03)
+    bitrateIndex = header[position+2] >> 4
+    rateIndex = (header[position+2] >> 2) & 0x03
+    if versionBits not in MPEG_VERSIONS or layer == 4 or bitrateIndex in (0, 15) or rateIndex == 3:
+        return None
+    version, sampleRates = MPEG_VERSIONS[versionBits]
+    kbps = MPEG_BITRATES[(version == 1, layer)][bitrateIndex]
+    sampleRate = sampleRates[rateIndex]
+    padding = (header[position+2] >> 1) & 0x01
+    channels = 1 if header[position+3] >> 6 == 3 else 2
+    if layer == 1:
+        frameLength = (12000 * kbps // sampleRate + padding) * 4
+    elif layer == 3 and version != 1:
+        frameLength = 72000 * kbps // sampleRate + padding
+    else:
+        frameLength = 144000 * kbps // sampleRate + padding
+    return version, layer, kbps, sampleRate, channels, frameLength
+
+def probeMp3(audioFile, header, fileSize):
+    """
+    Finds the first MPEG audio frame of an MP3 file, skipping an ID3v2 tag by
+    seeking past it, and reads the duration from its Xing/Info or VBRI header.
+    Files without either are taken to be constant bitrate, and the duration
+    is estimated from the audio size and the bitrate of the first frame.
+    """
+    probe = dict(EMPTY_AUDIO_PROBE)
+    audioStart = 0
+    if header.startswith(ID3V2_MAGIC) and len(header) >= 10:
+        tagSize = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        audioStart = 10 + tagSize + (10 if header[5] & 0x10 else 0)
+        audioFile.seek(audioStart)
+        header = audioFile.read(AUDIO_HEADER_BYTES)
+
+    # A frame only counts if the next one follows right behind it (or the read ends first).
+    frame = None
+    position = header.find(b"\xff")
+    while position != -1:
+        frame = getMpegFrame(header, position)
+        if frame is not None:
+            nextPosition = position + frame[5]
+            if nextPosition + 4 > len(header) or getMpegFrame(header, nextPosition) is not None:
+                break
+            frame = None
+        position = header.find(b"\xff", position + 1)
+    if frame is None:
+        return probe
+    version, layer, kbps, sampleRate, channels, frameLength = frame
+    probe.update({'format': 'mp3', 'sampleRate': sampleRate, 'channels': channels, 'bitrate': kbps})
+    samplesPerFrame = 384 if layer == 1 else (576 if layer == 3 and version != 1 else 1152)
+
+    # The Xing/Info header sits right after the side information, VBRI always 32 bytes in.
+    if version == 1:
+        sideInfo = 17 if channels == 1 else 32
+    else:
+        sideInfo = 9 if channels == 1 else 17
+    xing = header[position+4+sideInfo:position+4+sideInfo+12]
+    vbri = header[position+36:position+36+18]
+    frames = None
+    if xing[:4] in (b"Xing", b"Info") and len(xing) == 12 and xing[7] & 0x01:
+        frames = struct.unpack(">I", xing[8:12])[0]
+    elif vbri.startswith(b"VBRI") and len(vbri) == 18:
+        frames = struct.unpack(">I", vbri[14:18])[0]
+
+    audioBytes = fileSize - audioStart - position
+    if frames:
+        probe['duration'] = round(frames * samplesPerFrame / sampleRate, 3)
+        probe['bitrate'] = int(audioBytes * 8 / probe['duration'] / 1000)
+    else:
+        audioFile.seek(max(fileSize - 128, 0))
+        if audioFile.read(3) == ID3V1_MAGIC:
+            audioBytes -= 128
+        probe['duration'] = round(audioBytes * 8 / (kbps * 1000), 3)
+    return probe
+
+def probeWav(audioFile, header, fileSize):
+    """
+    Walks the chunks of a RIFF WAVE file, seeking over them, and takes the
+    format from its 'fmt ' chunk and the duration from the size of its
+    'data' chunk. A data size past the end of the file (left by a recorder
+    that never finished the file) is cut to what is there.
+    """
+    probe = dict(EMPTY_AUDIO_PROBE)
+    byteRate = None
+    position = 12
+    audioFile.seek(position)
+    while position + 8 <= fileSize:
+        chunkHeader = audioFile.read(8)
+        if len(chunkHeader) < 8:
+            break
+        chunkId, chunkSize = struct.unpack("<4sI", chunkHeader)
+        if chunkId == b"fmt ":
+            fmtChunk = audioFile.read(min(chunkSize, 16))
+            if len(fmtChunk) < 16:
+                break
+            formatTag, probe['channels'], probe['sampleRate'], byteRate = struct.unpack("<HHII", fmtChunk[:12])
+            probe['format'] = 'wav'
+            probe['bitrate'] = byteRate * 8 // 1000
+        elif chunkId == b"data":
+            if byteRate:
+                dataSize = min(chunkSize, fileSize - position - 8)
+                probe['duration'] = round(dataSize / byteRate, 3)
+            break
+        position += 8 + chunkSize + (chunkSize & 1) # Chunks are padded to an even size.
+        audioFile.seek(position)
+    return probe
+
+def probeAudio(audioPath):
+    """
+    Reads the format, duration (seconds), sample rate, channels and bitrate
+    (kbps) of an OGG Vorbis/Opus, MP3 or WAV file from its container headers
+    only, without decoding any audio. Only a few KB of the file are read.
+    Fields that can't be told are None.
+    """
+    fileSize = os.path.getsize(audioPath)
+    with open(audioPath, 'rb') as audioFile:
+        header = audioFile.read(AUDIO_HEADER_BYTES)
+        try:
+            if header.startswith(OGG_MAGIC) and len(header) >= 28:
+                return probeOgg(audioFile, header, fileSize)
+            if header.startswith(RIFF_MAGIC) and header[8:12] == b"WAVE":
+                return probeWav(audioFile, header, fileSize)
+            return probeMp3(audioFile, header, fileSize)
+        except (struct.error, IndexError, ZeroDivisionError): # Cut off or broken headers
+            assetsLogger.debug("probeAudio: '%s': %s: %s", audioPath, sys.exc_info()[0].__name__, sys.exc_info()[1])
+            return dict(EMPTY_AUDIO_PROBE)
+
+def resolveAssetPath(songFolderPath, assetName):
+    """
+    Returns the full path of a file named by a tag like #BANNER, relative to
+    the song folder, or None if it doesn't exist. Packs are mostly made on
+    Windows, so if the exact name isn't there, a file whose name only differs
+    in case is taken instead.
+    """
+    if not assetName:
+        return None
+    assetPath = os.path.join(songFolderPath, assetName.replace("\\", "/"))
+    if os.path.isfile(assetPath):
+        return assetPath
+    assetFolder, fileName = os.path.split(assetPath)
+    try:
+        with os.scandir(assetFolder) as folderEntries:
+            for entry in folderEntries:
+                if entry.name.lower() == fileName.lower() and entry.is_file():
+                    return entry.path
+    except OSError:
+        pass
+    return None
+
+def getAssetsKey(songs):
+    """
+    Returns a string of the asset fields of a list of song dictionaries, for
+    ParseCache.getPackSignature, so a pack whose SM files are unchanged still
+    gets its JSON rewritten when one of its banners or music files changed.
+    """
+    return json.dumps([[song.get(field) for field in ASSET_FIELDS] for song in songs], sort_keys=True)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class AssetCache():
+    """
+    This class is a persistent cache of asset probe results, stored on disk as
+    JSON like the parse cache, so an unchanged file (same size and mtime) is
+    never opened again.
+
+    - cachePath: Full path to the cache file, or None to keep it in memory only.
+    - assets: Dictionary of file path -> {'size', 'mtime_ns', 'probe'}.
+    - seenPaths: File paths looked up during this run, used for pruning.
+    """
+
+    def __init__(self, cachePath=None):
+        self.cachePath = cachePath
+        self.assets = {}
+        self.seenPaths = set()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return """>>> ASSETCACHE INFORMATION
+- cachePath: {}
+- assets: {}
+- hits: {}
+- misses: {}""" \
+        .format(self.cachePath, len(self.assets), self.hits, self.misses)
+
+    def load(self):
+        """
+        Loads the cache from disk. A missing, unreadable or outdated cache
+        just leaves it empty.
+        """
+        if self.cachePath is None:
+            return
+        assetsLogger.info("load: Loading asset cache '%s'", self.cachePath)
+        try:
+            manifest = readJson(self.cachePath)
+            if manifest.get('version') == ASSET_CACHE_VERSION:
+                self.assets = manifest['assets']
+            else:
+                assetsLogger.info("load: Asset cache version changed, starting over.")
+        except FileNotFoundError:
+            assetsLogger.info("load: No asset cache found at '%s'", self.cachePath)
+        except:
+            assetsLogger.warning("load: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+
+    def save(self, prune=True):
+        """
+        Writes the cache back to disk atomically with writeJson. If prune is
+        True, files that weren't looked up during this run are dropped.
+        """
+        if self.cachePath is None:
+            return
+        if prune:
+            self.assets = {path: entry for path, entry in self.assets.items() if path in self.seenPaths}
+        assetsLogger.info("save: Saving %s assets to asset cache '%s'", len(self.assets), self.cachePath)
+        writeJson(self.cachePath, {'version': ASSET_CACHE_VERSION, 'assets': self.assets}, compact=True)
+
+    def getProbe(self, assetPath, fileStat, probeFunction):
+        """
+        Returns the probe result of assetPath, from the cache if the file's
+        size and mtime (from fileStat) match, or from probeFunction(assetPath)
+        otherwise, in which case it's stored for the next run.
+        """
+        with self.lock:
+            self.seenPaths.add(assetPath)
+            entry = self.assets.get(assetPath)
+            if entry is not None and entry['size'] == fileStat.st_size and entry['mtime_ns'] == fileStat.st_mtime_ns:
+                self.hits += 1
+                return entry['probe']
+            self.misses += 1
+        probe = probeFunction(assetPath)
+        with self.lock:
+            self.assets[assetPath] = {'size': fileStat.st_size, 'mtime_ns': fileStat.st_mtime_ns, 'probe': probe}
+        return probe
+
+class AssetIndex():
+    """
+    This class is the asset indexing stage: for every parsed song it looks up
+    the banner named by #BANNER and the music named by #MUSIC in the song
+    folder. bannerInfo gets whether the banner exists, its format, dimensions,
+    size and mtime, and musicInfo the same for the music, with the audio
+    format, duration, sample rate, channels and bitrate instead of dimensions.
+    Only the file headers are read, and only for files the AssetCache doesn't
+    know in their current state, so a run over an unchanged library costs one
+    stat per file. Songs are indexed on a small pool of threads.
+
+    - cache: AssetCache the probe results go through.
+    - threads: Songs indexed at once.
+    """
+
+    def __init__(self, cache=None, threads=DEFAULT_ASSET_THREADS):
+        self.cache = cache if cache is not None else AssetCache()
+        self.threads = max(threads, 1)
+
+    def __str__(self):
+        return """>>> ASSETINDEX INFORMATION
+- threads: {}
+{}""" \
+        .format(self.threads, self.cache)
+
+    def getAssetInfo(self, songFolderPath, assetName, probeFunction, emptyProbe):
+        """
+        Returns the info dictionary of a file named by a song's tag: 'file' (its
+        name relative to the song folder), 'exists', 'bytes', 'mtime' (seconds)
+        and the fields of probeFunction's result (see emptyProbe). Only 'file'
+        and 'exists' are set if the file isn't there.
+        """
+        assetInfo = {'file': assetName, 'exists': False, 'bytes': None, 'mtime': None}
+        assetInfo.update(emptyProbe)
+        assetPath = resolveAssetPath(songFolderPath, assetName)
+        if assetPath is None:
+            return assetInfo
+        try:
+            fileStat = os.stat(assetPath)
+            assetInfo['file'] = os.path.relpath(assetPath, songFolderPath).replace(os.sep, "/")
+            assetInfo['exists'] = True
+            assetInfo['bytes'] = fileStat.st_size
+            assetInfo['mtime'] = int(fileStat.st_mtime)
+            assetInfo.update(self.cache.getProbe(assetPath, fileStat, probeFunction))
+        except:
+            assetsLogger.warning("getAssetInfo: '%s': %s: %s", assetPath, sys.exc_info()[0].__name__, sys.exc_info()[1])
+        return assetInfo
+
+    def getImageInfo(self, songFolderPath, assetName):
+        return self.getAssetInfo(songFolderPath, assetName, probeImage, EMPTY_IMAGE_PROBE)
+
+    def getAudioInfo(self, songFolderPath, assetName):
+        return self.getAssetInfo(songFolderPath, assetName, probeAudio, EMPTY_AUDIO_PROBE)
+
+    def indexStepfile(self, stepfile):
+        """
+        Fills the asset information of a parsed Stepfile's song and keeps the
+        time it took as the Stepfile's 'assets' timing.
+        """
+        start = time.perf_counter()
+        song = stepfile.getSong()
+        song.bannerInfo = self.getImageInfo(stepfile.songFolderPath, song.bannerFile)
+        song.musicInfo = self.getAudioInfo(stepfile.songFolderPath, song.music)
+        stepfile.timings['assets'] = time.perf_counter() - start
+
+    def indexStepfiles(self, stepfiles):
+        """
+        Indexes the assets of every Stepfile in stepfiles.
+        """
+        if self.threads == 1:
+            for stepfile in stepfiles:
+                self.indexStepfile(stepfile)
+            return
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="Assets") as executor:
+            list(executor.map(self.indexStepfile, stepfiles))
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+import sqlite3
+import logging
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+catalogLogger = logging.getLogger("CATALOG")
+catalogLogger.addHandler(logging.NullHandler())
+
+# Tables and indexes of the catalog. Songs belong to a pack, charts belong to a song.
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    packId INTEGER NOT NULL REFERENCES packs(id) ON DELETE CASCADE,
+    title TEXT,
+    subtitle TEXT,
+    artist TEXT,
+    banner TEXT,
+    bpmMin REAL,
+    bpmMax REAL
+);
+CREATE TABLE IF NOT EXISTS charts (
+    id INTEGER PRIMARY KEY,
+    songId INTEGER NOT NULL REFERENCES songs(id) ON DELETE CASCADE,
+    difficultyKey TEXT,
+    game TEXT,
+    difficulty TEXT,
+    rating INTEGER,
+    stepper TEXT,
+    note INTEGER,
+    hold INTEGER,
+    roll INTEGER,
+    mine INTEGER
+);
+CREATE INDEX IF NOT EXISTS songsPack ON songs(packId);
+CREATE INDEX IF NOT EXISTS songsBpmMin ON songs(bpmMin);
+CREATE INDEX IF NOT EXISTS songsBpmMax ON songs(bpmMax);
+CREATE INDEX IF NOT EXISTS chartsSong ON charts(songId);
+CREATE INDEX IF NOT EXISTS chartsRating ON charts(rating);
+CREATE INDEX IF NOT EXISTS chartsGameDifficulty ON charts(game, difficulty, rating);
+CREATE INDEX IF NOT EXISTS chartsStepper ON charts(stepper);
+"""
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class SongCatalog():
+    """
+    This class is a SQLite catalog of parsed song packs, with one row per pack,
+    song and chart, and indexes for the usual catalog queries.
+
+    The constructor only requires the path to the database file, which is
+    created if it doesn't exist yet.
+
+    - databasePath: Path to the SQLite database file.
+    - connection: The open sqlite3 connection.
+    """
+
+    def __init__(self, databasePath):
+        self.databasePath = databasePath
+        self.connection = sqlite3.connect(databasePath)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(CATALOG_SCHEMA)
+
+    def __str__(self):
+        return """>>> CATALOG INFORMATION
+- databasePath: {}
+- packs: {}""" \
+        .format(self.databasePath, self.getPackNames())
+
+    def close(self):
+        self.connection.close()
+
+    def commit(self):
+        self.connection.commit()
+
+    # Getters
+    def getPackNames(self):
+        return [row['name'] for row in self.connection.execute("SELECT name FROM packs ORDER BY name")]
+
+    # Setters
+    def addPack(self, packName, songs):
+        """
+        Writes a song pack into the catalog, replacing whatever was stored for
+        it before. songs is the list of song dictionaries of the pack, as
+        written in the pack JSONs.
+        """
+        catalogLogger.debug("addPack: Adding %s songs for Song Pack '%s'", len(songs), packName)
+        with self.connection:
+            self.connection.execute("DELETE FROM packs WHERE name = ?", (packName,))
+            packId = self.connection.execute("INSERT INTO packs (name) VALUES (?)", (packName,)).lastrowid
+            for song in songs:
+                bpm = song.get('bpm') or [None]
+                songId = self.connection.execute(
+                    "INSERT INTO songs (packId, title, subtitle, artist, banner, bpmMin, bpmMax) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (packId, song.get('title'), song.get('subtitle'), song.get('artist'), song.get('banner'),
+                     bpm[0], bpm[-1])).lastrowid
+                self.connection.executemany(
+                    "INSERT INTO charts (songId, difficultyKey, game, difficulty, rating, stepper, note, hold, roll, mine) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(songId, difficultyKey, chart['game'], chart['difficulty'], chart['rating'], chart['stepper'],
+                      chart['note'], chart['hold'], chart['roll'], chart['mine'])
+                     for difficultyKey, chart in song.get('charts', {}).items()])
+
+    def removePacksExcept(self, packNames):
+        """
+        Deletes every pack (with its songs and charts) that isn't in packNames.
+        """
+        keepNames = set(packNames)
+        with self.connection:
+            for packName in self.getPackNames():
+                if packName not in keepNames:
+                    catalogLogger.info("removePacksExcept: Removing Song Pack '%s'", packName)
+                    self.connection.execute("DELETE FROM packs WHERE name = ?", (packName,))
+
+    # Queries
+    def queryCharts(self, game=None, difficulty=None, minRating=None, maxRating=None,
+                    minBpm=None, maxBpm=None, stepper=None, pack=None, limit=None):
+        """
+        Returns a list of dictionaries for the charts matching every given filter.
+        Filters left as None aren't applied. BPM filters apply to the whole BPM
+        range of the song, so minBpm=150, maxBpm=180 finds songs that stay within
+        150-180 BPM.
+
+        Every dictionary has the chart's fields plus the song's title, subtitle,
+        artist, banner, bpmMin, bpmMax and pack.
+        """
+        conditions = []
+        parameters = []
+        for column, operator, value in (("charts.game", "=", game),
+                                        ("charts.difficulty", "=", difficulty),
+                                        ("charts.rating", ">=", minRating),
+                                        ("charts.rating", "<=", maxRating),
+                                        ("songs.bpmMin", ">=", minBpm),
+                                        ("songs.bpmMax", "<=", maxBpm),
+                                        ("charts.stepper", "=", stepper),
+                                        ("packs.name", "=", pack)):
+            if value is not None:
+                conditions.append(column + " " + operator + " ?")
+                parameters.append(value)
+
+        query = ("SELECT charts.difficultyKey, charts.game, charts.difficulty, charts.rating, charts.stepper, "
+                 "charts.note, charts.hold, charts.roll, charts.mine, songs.title, songs.subtitle, songs.artist, "
+                 "songs.banner, songs.bpmMin, songs.bpmMax, packs.name AS pack "
+                 "FROM charts JOIN songs ON charts.songId = songs.id JOIN packs ON songs.packId = packs.id")
+        if conditions != []:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY packs.name, songs.title, charts.rating"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        return [dict(row) for row in self.connection.execute(query, parameters)]
@@ -0,0 +1,336 @@
+#!/usr/bin/python3
+
+from urllib.parse import urlsplit, parse_qs, unquote
+from containers.serializer import decompressJson, dumpsJson, loadsJson
+import os
+import sys
+import bisect
+import asyncio
+import hashlib
+import logging
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+catalogserverLogger = logging.getLogger("CATALOGSERVER")
+catalogserverLogger.addHandler(logging.NullHandler())
+
+# Header lines read at most per request. Longer lines than the StreamReader
+# limit (64KB) are refused as well.
+MAX_HEADER_LINES = 100
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+HTTP_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 503: "Service Unavailable"}
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getFileSignature(catalogPath):
+    """
+    Returns (size, mtime_ns) of catalogPath, or None if it doesn't exist.
+    """
+    try:
+        fileStat = os.stat(catalogPath)
+    except FileNotFoundError:
+        return None
+    return (fileStat.st_size, fileStat.st_mtime_ns)
+
+def loadCatalogIndex(catalogPath):
+    """
+    Loads the combined JSON written by combinejsons.py and returns a CatalogIndex,
+    versioned by a hash of the file's contents. The file signature is taken
+    before reading, so a write that lands while loading is picked up by the
+    next reload check.
+    """
+    signature = getFileSignature(catalogPath)
+    with open(catalogPath, 'rb') as catalogFile:
+        data = catalogFile.read()
+    version = hashlib.sha1(data).hexdigest()[:16]
+    return CatalogIndex(loadsJson(decompressJson(data)), signature, version)
+
+def getPage(items, query):
+    """
+    Returns the paginated result dictionary for the page of items asked for with
+    the 'page' (starting at 1) and 'pageSize' query parameters.
+    """
+    page = int(query.get('page', 1))
+    pageSize = min(int(query.get('pageSize', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    if page < 1 or pageSize < 1:
+        raise ValueError("page and pageSize must be at least 1")
+    start = (page - 1) * pageSize
+    return {'page': page, 'pageSize': pageSize, 'total': len(items), 'results': items[start:start + pageSize]}
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class CatalogIndex():
+    """
+    This class holds the combined catalog with the lookups the server needs
+    precomputed. Once built it's never changed, so a reload just swaps in a
+    new CatalogIndex.
+
+    - signature: (size, mtime_ns) of the file it was loaded from.
+    - version: Short hash of the catalog's contents (or of the signature if not
+      given), reported by /status and used as the ETag of every response.
+    - songsById: Dictionary of idNum -> song dictionary.
+    - packs: Dictionary of pack name -> list of idNums of its songs.
+    - charts: Dictionary of (game, difficulty) -> list of chart rows sorted by rating.
+    - chartRatings: Dictionary of (game, difficulty) -> the ratings of charts[key], for bisect.
+    """
+
+    def __init__(self, allPacksJson, signature=None, version=None):
+        self.signature = signature
+        self.version = version
+        if version is None:
+            self.version = hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()[:16]
+        self.songsById = {}
+        self.packs = {}
+        self.charts = {}
+        for packName, songs in allPacksJson.items():
+            self.packs[packName] = [song['idNum'] for song in songs]
+            for song in songs:
+                self.songsById[song['idNum']] = song
+                for difficultyKey, chart in song.get('charts', {}).items():
+                    chartRow = dict(chart)
+                    chartRow.update({'idNum': song['idNum'], 'difficultyKey': difficultyKey, 'title': song.get('title'),
+                                     'artist': song.get('artist'), 'pack': packName})
+                    self.charts.setdefault((chart.get('game'), chart.get('difficulty')), []).append(chartRow)
+        self.chartRatings = {}
+        for key, chartRows in self.charts.items():
+            chartRows.sort(key=lambda chartRow: (chartRow['rating'], chartRow['idNum'], chartRow['difficultyKey']))
+            self.chartRatings[key] = [chartRow['rating'] for chartRow in chartRows]
+
+    def getPackList(self):
+        return [{'pack': packName, 'songCount': len(idNums)} for packName, idNums in sorted(self.packs.items())]
+
+    def getPackSongs(self, packName):
+        return [self.songsById[idNum] for idNum in self.packs[packName]]
+
+    def findCharts(self, game=None, difficulty=None, minRating=None, maxRating=None):
+        """
+        Returns the chart rows matching every given filter, sorted by rating.
+        Filters left as None aren't applied.
+        """
+        found = []
+        for (chartGame, chartDifficulty), chartRows in sorted(self.charts.items()):
+            if game is not None and chartGame != game:
+                continue
+            if difficulty is not None and chartDifficulty != difficulty:
+                continue
+            ratings = self.chartRatings[(chartGame, chartDifficulty)]
+            low = 0 if minRating is None else bisect.bisect_left(ratings, minRating)
+            high = len(ratings) if maxRating is None else bisect.bisect_right(ratings, maxRating)
+            found.extend(chartRows[low:high])
+        if game is None or difficulty is None:
+            found.sort(key=lambda chartRow: (chartRow['rating'], chartRow['idNum'], chartRow['difficultyKey']))
+        return found
+
+class CatalogServer():
+    """
+    This class serves read-only JSON queries over the combined catalog with
+    asyncio, from one warm process. The catalog file is checked every
+    reloadInterval seconds and reloaded in a worker thread when it changed;
+    requests keep being answered from the old index until the new one is ready.
+
+    Routes (GET and HEAD):
+    - /status: Songs, packs and version of the loaded catalog.
+    - /packs: Every pack with its number of songs.
+    - /packs/<pack>: The songs of a pack, paginated.
+    - /songs/<idNum>: One song.
+    - /charts?game=&difficulty=&rating=&minRating=&maxRating=: Matching charts, paginated.
+    Paginated routes take 'page' (starting at 1) and 'pageSize' parameters.
+
+    Every 200 response has the version of the catalog as its ETag, so it only
+    changes on a reload; a request whose If-None-Match matches gets a 304.
+
+    - catalogPath: Path to the combined JSON.
+    - index: The CatalogIndex requests are answered from.
+    """
+
+    def __init__(self, catalogPath, host="127.0.0.1", port=8080, reloadInterval=2.0):
+        self.catalogPath = catalogPath
+        self.host = host
+        self.port = port
+        self.reloadInterval = reloadInterval
+        self.index = None
+        self.server = None
+        self.reloadTask = None
+
+    def __str__(self):
+        return """>>> CATALOGSERVER INFORMATION
+- catalogPath: {}
+- address: http://{}:{}/
+- songs: {}""" \
+        .format(self.catalogPath, self.host, self.port, 0 if self.index is None else len(self.index.songsById))
+
+    async def start(self):
+        """
+        Loads the catalog, starts listening and starts the reload checks.
+        With port 0 a free port is picked; self.port is updated to it.
+        """
+        await self.reloadIfChanged()
+        self.server = await asyncio.start_server(self.handleConnection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.reloadTask = asyncio.ensure_future(self.watchCatalog())
+        catalogserverLogger.info("start: Serving '%s' on http://%s:%s/", self.catalogPath, self.host, self.port)
+
+    async def stop(self):
+        if self.reloadTask is not None:
+            self.reloadTask.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def serveForever(self):
+        if self.server is None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def watchCatalog(self):
+        while True:
+            await asyncio.sleep(self.reloadInterval)
+            await self.reloadIfChanged()
+
+    async def reloadIfChanged(self):
+        """
+        Reloads the catalog if its file signature changed. A catalog that fails
+        to load (e.g. while combinejsons.py is still writing it) is tried again
+        at the next check, and the old index stays in use meanwhile.
+        """
+        signature = getFileSignature(self.catalogPath)
+        if signature is None or (self.index is not None and signature == self.index.signature):
+            return
+        try:
+            index = await asyncio.get_running_loop().run_in_executor(None, loadCatalogIndex, self.catalogPath)
+        except:
+            catalogserverLogger.warning("reloadIfChanged: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+            return
+        self.index = index
+        catalogserverLogger.info("reloadIfChanged: Loaded %s songs from '%s'", len(index.songsById), self.catalogPath)
+
+    async def readRequest(self, reader):
+        """
+        Reads the request line and headers of the next request. Returns a tuple
+        of (method, target, HTTP version) and the dictionary of headers (names
+        lower-cased), or None if the client closed the connection.
+
+        Raises ValueError for a malformed request line, too many headers or a
+        line over the reader's limit.
+        """
+        requestLine = await reader.readline()
+        if not requestLine:
+            return None
+        headers = {}
+        for headerCount in range(MAX_HEADER_LINES + 1):
+            headerLine = await reader.readline()
+            if headerLine in (b"\r\n", b"\n", b""):
+                break
+            if headerCount == MAX_HEADER_LINES:
+                raise ValueError("Too many header lines")
+            name, _, value = headerLine.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        requestParts = requestLine.decode("latin-1").split()
+        if len(requestParts) != 3:
+            raise ValueError("Malformed request line")
+        return tuple(requestParts), headers
+
+    async def handleConnection(self, reader, writer):
+        """
+        Answers requests on one connection until the client closes it or asks to.
+        A request that can't be read is answered with a 400 and the connection closed.
+        """
+        try:
+            while True:
+                try:
+                    request = await self.readRequest(reader)
+                except (ValueError, asyncio.LimitOverrunError):
+                    writer.write(self.buildResponse(400, {'error': str(sys.exc_info()[1])}, "HTTP/1.1", close=True))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                (method, target, httpVersion), headers = request
+                keepAlive = headers.get('connection', "").lower() != "close" and httpVersion == "HTTP/1.1"
+                index = self.index
+                status, body = self.route(method, target, index)
+                etag = None if index is None else '"' + index.version + '"'
+                writer.write(self.buildResponse(status, body, httpVersion, headers.get('if-none-match'),
+                                                method == "HEAD", not keepAlive, etag))
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method, target, index):
+        """
+        Returns (status, body object) for a request, answered from index.
+        """
+        if method not in ("GET", "HEAD"):
+            return 405, {'error': "Only GET and HEAD are supported"}
+        if index is None:
+            return 503, {'error': "Catalog not loaded yet"}
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.split("/") if part != ""]
+        try:
+            if parts == ["status"]:
+                return 200, {'catalogPath': self.catalogPath, 'version': index.version,
+                             'songs': len(index.songsById), 'packs': len(index.packs)}
+            if parts == ["packs"]:
+                return 200, index.getPackList()
+            if len(parts) == 2 and parts[0] == "packs":
+                if parts[1] not in index.packs:
+                    return 404, {'error': "No Song Pack '" + parts[1] + "'"}
+                return 200, getPage(index.getPackSongs(parts[1]), query)
+            if len(parts) == 2 and parts[0] == "songs":
+                song = index.songsById.get(int(parts[1]))
+                if song is None:
+                    return 404, {'error': "No song with idNum " + parts[1]}
+                return 200, song
+            if parts == ["charts"]:
+                minRating = query.get('minRating', query.get('rating'))
+                maxRating = query.get('maxRating', query.get('rating'))
+                charts = index.findCharts(query.get('game'), query.get('difficulty'),
+                                          None if minRating is None else int(minRating),
+                                          None if maxRating is None else int(maxRating))
+                return 200, getPage(charts, query)
+        except ValueError:
+            return 400, {'error': str(sys.exc_info()[1])}
+        return 404, {'error': "Unknown path '" + url.path + "'"}
+
+    def buildResponse(self, status, body, httpVersion, ifNoneMatch=None, headOnly=False, close=False, etag=None):
+        """
+        Returns the bytes of a response with body serialized as compact JSON.
+        A 200 response gets etag, and the body isn't serialized at all when
+        it's answered with a 304.
+        """
+        headers = ["Content-Type: application/json; charset=utf-8", "Cache-Control: no-cache"]
+        if status == 200 and etag is not None:
+            headers.append("ETag: " + etag)
+            if ifNoneMatch is not None:
+                matchTags = [tag.strip() for tag in ifNoneMatch.split(",")]
+                if etag in matchTags or "*" in matchTags:
+                    status = 304
+        payload = b""
+        if status == 304:
+            headOnly = True
+        else:
+            payload = dumpsJson(body, compact=True)
+            headers.append("Content-Length: " + str(len(payload)))
+        headers.append("Connection: " + ("close" if close else "keep-alive"))
+        head = "{0} {1} {2}\r\n{3}\r\n\r\n".format("HTTP/1.1" if httpVersion != "HTTP/1.0" else "HTTP/1.0", status,
+                                                  HTTP_REASONS.get(status, ""), "\r\n".join(headers))
+        return head.encode("latin-1") + (b"" if headOnly else payload)
@@ -0,0 +1,309 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import logging
+
+# NumPy is optional: without it, columns come back as memoryviews.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+columnarLogger = logging.getLogger("COLUMNAR")
+columnarLogger.addHandler(logging.NullHandler())
+
+# File layout, all little-endian:
+# - header: magic, version, column count, song count, chart count, string count
+# - column directory: one (name, type code, byte offset, item count) entry per column
+# - column data, every column starting on an 8 byte boundary
+# Strings are stored once in a string table (the 'stringOffsets' and 'stringData'
+# columns) and string columns hold indexes into it. JSON columns are string
+# columns holding the JSON text of a dictionary, "" for None.
+# bpm is kept as bpmMin/bpmMax for queries, with the number of values it had
+# (0 for None) in bpmCount and whether they were ints in bpmInt, so getSong can
+# give it back as it was. Charts without timing analytics have NaN as their
+# length and peakNps, -1 as their streamMeasures and breakMeasures and "" as
+# their breakdown, and getSong gives them back as None.
+COLUMNAR_MAGIC = b"SPKCOLS\0"
+COLUMNAR_VERSION = 6
+COLUMNAR_HEADER = struct.Struct("<8sIIIII")
+COLUMNAR_ENTRY = struct.Struct("<16s4sQQ")
+
+# Type codes are array/struct codes, with their NumPy dtype.
+COLUMN_DTYPES = {'i': '<i4', 'I': '<u4', 'd': '<f8', 'B': 'u1'}
+
+# Song columns have one item per song, chart columns one item per chart.
+# String columns ('I' with a name in STRING_COLUMNS) index the string table.
+SONG_COLUMNS = (('idNum', 'i'), ('bpmMin', 'd'), ('bpmMax', 'd'), ('bpmCount', 'B'), ('bpmInt', 'B'),
+                ('chartStart', 'I'), ('chartCount', 'I'), ('title', 'I'), ('subtitle', 'I'), ('artist', 'I'),
+                ('pack', 'I'), ('banner', 'I'), ('folder', 'I'), ('encoding', 'I'), ('bannerFile', 'I'), ('music', 'I'),
+                ('bannerInfo', 'I'), ('musicInfo', 'I'))
+CHART_COLUMNS = (('song', 'I'), ('rating', 'i'), ('note', 'i'), ('hold', 'i'), ('roll', 'i'), ('mine', 'i'),
+                 ('difficultyKey', 'I'), ('game', 'I'), ('difficulty', 'I'), ('stepper', 'I'), ('chartId', 'i'),
+                 ('length', 'd'), ('peakNps', 'd'), ('streamMeasures', 'i'), ('breakMeasures', 'i'), ('breakdown', 'I'))
+STRING_COLUMNS = ('title', 'subtitle', 'artist', 'pack', 'banner', 'folder', 'encoding', 'bannerFile', 'music',
+                  'bannerInfo', 'musicInfo', 'difficultyKey', 'game', 'difficulty', 'stepper', 'breakdown')
+JSON_COLUMNS = ('bannerInfo', 'musicInfo')
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def loadColumnarCatalog(catalogPath):
+    """
+    Maps a catalog file written by ColumnarCatalogBuilder and returns a ColumnarCatalog.
+    """
+    return ColumnarCatalog(catalogPath)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ColumnarCatalogBuilder():
+    """
+    This class builds a columnar binary catalog from the song dictionaries of
+    the combined JSON. Songs are added one at a time, like SearchIndexBuilder,
+    so it can be filled while streaming the combine.
+
+    - columns: Dictionary of column name -> array.array of its values.
+    - strings: Dictionary of string -> index in the string table.
+    """
+
+    def __init__(self):
+        self.columns = {name: array.array(typeCode) for name, typeCode in SONG_COLUMNS + CHART_COLUMNS}
+        self.strings = {}
+
+    def getStringIndex(self, text):
+        if text is None:
+            text = ""
+        index = self.strings.get(text)
+        if index is None:
+            index = len(self.strings)
+            self.strings[text] = index
+        return index
+
+    def addSong(self, song):
+        """
+        Adds a song dictionary from the combined JSON (it must have its idNum).
+        """
+        columns = self.columns
+        songRow = len(columns['idNum'])
+        bpm = song.get('bpm') or []
+        columns['idNum'].append(song['idNum'])
+        columns['bpmMin'].append(float(bpm[0]) if bpm != [] else float("nan"))
+        columns['bpmMax'].append(float(bpm[-1]) if bpm != [] else float("nan"))
+        columns['bpmCount'].append(min(len(bpm), 2))
+        columns['bpmInt'].append(all(isinstance(value, int) for value in bpm))
+        columns['chartStart'].append(len(columns['song']))
+        columns['chartCount'].append(len(song.get('charts', {})))
+        for field in ('title', 'subtitle', 'artist', 'pack', 'banner', 'folder', 'encoding', 'bannerFile', 'music'):
+            columns[field].append(self.getStringIndex(song.get(field)))
+        for field in JSON_COLUMNS:
+            value = song.get(field)
+            columns[field].append(self.getStringIndex(None if value is None else json.dumps(value, ensure_ascii=False)))
+
+        for difficultyKey, chart in song.get('charts', {}).items():
+            columns['song'].append(songRow)
+            for field in ('rating', 'note', 'hold', 'roll', 'mine'):
+                columns[field].append(chart.get(field, 0))
+            columns['difficultyKey'].append(self.getStringIndex(difficultyKey))
+            for field in ('game', 'difficulty', 'stepper'):
+                columns[field].append(self.getStringIndex(chart.get(field)))
+            columns['chartId'].append(chart.get('chartId', -1))
+            if chart.get('length') is None:
+                columns['length'].append(float("nan"))
+                columns['peakNps'].append(float("nan"))
+                columns['streamMeasures'].append(-1)
+                columns['breakMeasures'].append(-1)
+            else:
+                columns['length'].append(float(chart['length']))
+                columns['peakNps'].append(float(chart['peakNps']))
+                columns['streamMeasures'].append(chart['streamMeasures'])
+                columns['breakMeasures'].append(chart['breakMeasures'])
+            columns['breakdown'].append(self.getStringIndex(chart.get('breakdown')))
+
+    def write(self, catalogPath):
+        """
+        Writes the catalog to catalogPath through a temporary file.
+        """
+        stringData = bytearray()
+        stringOffsets = array.array('I', [0])
+        for text in self.strings:
+            stringData += text.encode("utf-8")
+            stringOffsets.append(len(stringData))
+        columns = list(self.columns.items()) + [('stringOffsets', stringOffsets),
+                                                ('stringData', array.array('B', stringData))]
+
+        # Lay out the column data after the header and directory.
+        dataStart = COLUMNAR_HEADER.size + COLUMNAR_ENTRY.size * len(columns)
+        entries = []
+        offset = dataStart
+        for name, values in columns:
+            offset = (offset + 7) & ~7
+            entries.append(COLUMNAR_ENTRY.pack(name.encode("ascii"), values.typecode.encode("ascii"), offset, len(values)))
+            offset += values.itemsize * len(values)
+
+        columnarLogger.info("write: Writing columnar catalog of %s songs and %s charts to '%s'",
+                            len(self.columns['idNum']), len(self.columns['song']), catalogPath)
+        tempPath = catalogPath + ".tmp"
+        with open(tempPath, 'wb') as catalogFile:
+            catalogFile.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(columns),
+                                                   len(self.columns['idNum']), len(self.columns['song']),
+                                                   len(self.strings)))
+            for entry in entries:
+                catalogFile.write(entry)
+            for name, values in columns:
+                catalogFile.write(b"\0" * (-catalogFile.tell() & 7))
+                if sys.byteorder == "big" and values.itemsize > 1:
+                    values = array.array(values.typecode, values)
+                    values.byteswap()
+                values.tofile(catalogFile)
+        os.replace(tempPath, catalogPath)
+
+class ColumnarCatalog():
+    """
+    This class reads a catalog written by ColumnarCatalogBuilder through mmap.
+    Nothing is parsed up front besides the header: columns are zero-copy views
+    into the mapped file, so opening even a huge catalog is instant.
+
+    Call close() (or use it as a context manager) once done with it. Columns
+    handed out must be released first, or the mapping stays open until they are.
+
+    - catalogPath: Path to the catalog file.
+    - songCount: Number of songs.
+    - chartCount: Number of charts.
+    - stringCount: Number of strings in the string table.
+    - directory: Dictionary of column name -> (type code, byte offset, item count).
+    """
+
+    def __init__(self, catalogPath):
+        self.catalogPath = catalogPath
+        with open(catalogPath, 'rb') as catalogFile:
+            self.map = mmap.mmap(catalogFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, columnCount, self.songCount, self.chartCount, self.stringCount = \
+                COLUMNAR_HEADER.unpack_from(self.map, 0)
+            if magic != COLUMNAR_MAGIC:
+                raise ValueError("'{0}' is not a columnar catalog".format(catalogPath))
+            if version != COLUMNAR_VERSION:
+                raise ValueError("Columnar catalog '{0}' has version {1}, expected {2}".format(catalogPath, version,
+                                                                                              COLUMNAR_VERSION))
+            self.directory = {}
+            for i in range(columnCount):
+                name, typeCode, offset, count = COLUMNAR_ENTRY.unpack_from(self.map, COLUMNAR_HEADER.size +
+                                                                          i * COLUMNAR_ENTRY.size)
+                self.directory[name.rstrip(b"\0").decode("ascii")] = (typeCode.rstrip(b"\0").decode("ascii"),
+                                                                      offset, count)
+            self.view = memoryview(self.map)
+            self.stringOffsets = self.getColumn('stringOffsets')
+            self.stringData = self.getColumn('stringData')
+        except:
+            self.map.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def close(self):
+        self.stringOffsets.release()
+        self.stringData.release()
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            columnarLogger.warning("close: Columns of '%s' are still in use, the file stays mapped until they're gone.",
+                                   self.catalogPath)
+
+    def getColumnNames(self):
+        return list(self.directory)
+
+    def getColumn(self, name):
+        """
+        Returns a column as a memoryview of its type (e.g. 'i' for int32) over
+        the mapped file, without copying. On big-endian machines the column is
+        copied and byte-swapped instead.
+        """
+        typeCode, offset, count = self.directory[name]
+        itemSize = struct.calcsize(typeCode)
+        column = self.view[offset:offset + itemSize * count]
+        if sys.byteorder == "big" and itemSize > 1:
+            values = array.array(typeCode, column.tobytes())
+            values.byteswap()
+            return memoryview(values)
+        return column.cast(typeCode)
+
+    def getArray(self, name):
+        """
+        Returns a column as a read-only NumPy array over the mapped file, or as
+        a memoryview (see getColumn) when NumPy isn't installed.
+        """
+        if numpy is None:
+            return self.getColumn(name)
+        typeCode, offset, count = self.directory[name]
+        return numpy.frombuffer(self.map, dtype=COLUMN_DTYPES[typeCode], count=count, offset=offset)
+
+    def getString(self, index):
+        return str(self.stringData[self.stringOffsets[index]:self.stringOffsets[index + 1]], "utf-8")
+
+    def getStrings(self, name):
+        """
+        Returns a string column decoded to a list of strings.
+        """
+        return [self.getString(index) for index in self.getColumn(name)]
+
+    def getSong(self, row):
+        """
+        Returns song number row as a song dictionary like the combined JSON's.
+        """
+        song = {}
+        for field in ('title', 'subtitle', 'artist'):
+            song[field] = self.getString(self.getColumn(field)[row])
+        bpm = [self.getColumn('bpmMin')[row], self.getColumn('bpmMax')[row]][:self.getColumn('bpmCount')[row]]
+        if self.getColumn('bpmInt')[row]:
+            bpm = [int(value) for value in bpm]
+        song['bpm'] = bpm if bpm != [] else None
+        chartStart = self.getColumn('chartStart')[row]
+        song['charts'] = {}
+        for chartRow in range(chartStart, chartStart + self.getColumn('chartCount')[row]):
+            difficultyKey, chart = self.getChart(chartRow)
+            song['charts'][difficultyKey] = chart
+        for field in ('pack', 'banner', 'folder'):
+            song[field] = self.getString(self.getColumn(field)[row])
+        for field in ('encoding', 'bannerFile', 'music'):
+            song[field] = self.getString(self.getColumn(field)[row]) or None
+        for field in JSON_COLUMNS:
+            value = self.getString(self.getColumn(field)[row])
+            song[field] = json.loads(value) if value != "" else None
+        song['idNum'] = self.getColumn('idNum')[row]
+        return song
+
+    def getChart(self, row):
+        """
+        Returns (difficultyKey, chart dictionary) of chart number row.
+        """
+        chart = {}
+        for field in ('note', 'hold', 'roll', 'mine', 'difficulty', 'rating', 'game', 'stepper',
+                      'length', 'peakNps', 'streamMeasures', 'breakMeasures', 'breakdown'):
+            value = self.getColumn(field)[row]
+            chart[field] = self.getString(value) if field in STRING_COLUMNS else value
+        if chart['streamMeasures'] == -1:
+            for field in ('length', 'peakNps', 'streamMeasures', 'breakMeasures', 'breakdown'):
+                chart[field] = None
+        chartId = self.getColumn('chartId')[row]
+        if chartId != -1:
+            chart['chartId'] = chartId
+        return self.getString(self.getColumn('difficultyKey')[row]), chart
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+from containers.serializer import readJson, writeJson
+import json
+import hashlib
+import logging
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+idregistryLogger = logging.getLogger("IDREGISTRY")
+idregistryLogger.addHandler(logging.NullHandler())
+
+# Bump this whenever the layout of the registry file changes.
+REGISTRY_VERSION = 1
+
+# Song fields that are part of every chart's fingerprint, next to the chart's own fields.
+FINGERPRINT_SONG_FIELDS = ('title', 'subtitle', 'artist', 'bpm', 'banner')
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getChartFingerprint(song, chart):
+    """
+    Returns a hash of the chart's fields and the song fields shown with it, so a
+    chart counts as changed when anything a downstream row holds changed.
+    """
+    fingerprinted = {field: song.get(field) for field in FINGERPRINT_SONG_FIELDS}
+    fingerprinted['chart'] = {field: value for field, value in chart.items() if field != 'chartId'}
+    return hashlib.sha1(json.dumps(fingerprinted, sort_keys=True).encode("utf-8")).hexdigest()
+
+def getDeltaRow(song, difficultyKey, chart):
+    """
+    Returns the flat row written to the delta file for one chart.
+    """
+    row = {'chartId': chart['chartId'], 'idNum': song['idNum'], 'pack': song.get('pack'),
+           'folder': song.get('folder'), 'difficultyKey': difficultyKey}
+    for field in FINGERPRINT_SONG_FIELDS:
+        row[field] = song.get(field)
+    row.update((field, value) for field, value in chart.items() if field != 'chartId')
+    return row
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class IdRegistry():
+    """
+    This class hands out Id's that stay the same from run to run: a song's
+    idNum is tied to its pack and song folder, and a chart's chartId to its
+    pack, song folder and difficulty key. Id's of removed songs and charts are
+    never handed out again.
+
+    Every run also collects the charts that were added, changed (their
+    fingerprint differs, see getChartFingerprint) or removed since the last
+    run, for a delta file.
+
+    - registryPath: Path to the registry JSON.
+    - songs: Dictionary of pack -> folder -> {'idNum', 'charts': {difficultyKey: [chartId, fingerprint]}}.
+    - nextSongId / nextChartId: Next Id's to hand out.
+    - added / changed: Delta rows of this run.
+    - seen: (pack, folder) of every song assigned during this run.
+    """
+
+    def __init__(self, registryPath):
+        self.registryPath = registryPath
+        self.songs = {}
+        self.nextSongId = 0
+        self.nextChartId = 0
+        self.added = []
+        self.changed = []
+        self.seen = set()
+
+    def __str__(self):
+        return """>>> IDREGISTRY INFORMATION
+- registryPath: {}
+- nextSongId: {}
+- nextChartId: {}
+- added: {}
+- changed: {}""" \
+        .format(self.registryPath, self.nextSongId, self.nextChartId, len(self.added), len(self.changed))
+
+    def load(self):
+        """
+        Loads the registry from disk. Without one, every chart of the run is new.
+        """
+        try:
+            registry = readJson(self.registryPath)
+            if registry.get('version') != REGISTRY_VERSION:
+                raise ValueError("Id registry '{0}' has version {1}, expected {2}".format(
+                    self.registryPath, registry.get('version'), REGISTRY_VERSION))
+            self.songs = registry['songs']
+            self.nextSongId = registry['nextSongId']
+            self.nextChartId = registry['nextChartId']
+        except FileNotFoundError:
+            idregistryLogger.info("load: No Id registry found at '%s', starting a new one.", self.registryPath)
+
+    def save(self):
+        """
+        Writes the registry atomically with writeJson so a crash never loses it.
+        """
+        idregistryLogger.info("save: Saving Id registry '%s'", self.registryPath)
+        writeJson(self.registryPath, {'version': REGISTRY_VERSION, 'nextSongId': self.nextSongId,
+                                      'nextChartId': self.nextChartId, 'songs': self.songs}, compact=True)
+
+    def assignIds(self, song):
+        """
+        Sets the idNum of a song dictionary from the combined JSON and the
+        chartId of each of its charts, and records what changed.
+
+        Raises ValueError for a song without its 'pack' or 'folder' (from a pack
+        JSON written before songs had a folder): every such song would get the
+        same Id's. The pack has to be parsed again.
+        """
+        packName = song.get('pack')
+        folder = song.get('folder')
+        if not packName or not folder:
+            raise ValueError("Song '{0}' of Song Pack '{1}' has no pack or song folder to key its Id's by. "
+                             "Parse the pack again with parsesongsfolder.py.".format(song.get('title'), packName))
+        packEntries = self.songs.setdefault(packName, {})
+        entry = packEntries.get(folder)
+        if entry is None:
+            entry = {'idNum': self.nextSongId, 'charts': {}}
+            packEntries[folder] = entry
+            self.nextSongId += 1
+        elif (packName, folder) in self.seen:
+            idregistryLogger.warning("assignIds: Song '%s' of Song Pack '%s' was already numbered.", folder, packName)
+        self.seen.add((packName, folder))
+        song['idNum'] = entry['idNum']
+
+        oldCharts = entry['charts']
+        entry['charts'] = {}
+        for difficultyKey, chart in song.get('charts', {}).items():
+            fingerprint = getChartFingerprint(song, chart)
+            oldChart = oldCharts.get(difficultyKey)
+            if oldChart is None:
+                chart['chartId'] = self.nextChartId
+                self.nextChartId += 1
+                self.added.append(getDeltaRow(song, difficultyKey, chart))
+            else:
+                chart['chartId'] = oldChart[0]
+                if oldChart[1] != fingerprint:
+                    self.changed.append(getDeltaRow(song, difficultyKey, chart))
+            entry['charts'][difficultyKey] = [chart['chartId'], fingerprint]
+
+        # Charts the song no longer has are kept aside until finishRun reports them.
+        for difficultyKey, oldChart in oldCharts.items():
+            if difficultyKey not in entry['charts']:
+                entry.setdefault('removedCharts', {})[difficultyKey] = oldChart[0]
+
+    def finishRun(self, packNames=None):
+        """
+        Drops every song and chart that wasn't seen during this run from the
+        registry and returns the delta of the run: a dictionary with the
+        'added', 'changed' and 'removed' chart rows. Removed rows only have
+        chartId, idNum, pack, folder and difficultyKey.
+
+        With packNames, only those packs were looked at (like in watch mode),
+        so only their songs can be dropped and the songs of every other pack
+        are kept. The next run starts with an empty delta.
+        """
+        removed = []
+        if packNames is None:
+            packNames = list(self.songs)
+        for packName in [packName for packName in packNames if packName in self.songs]:
+            packEntries = self.songs[packName]
+            for folder in list(packEntries):
+                entry = packEntries[folder]
+                if (packName, folder) in self.seen:
+                    removedCharts = entry.pop('removedCharts', {}).items()
+                else:
+                    removedCharts = [(difficultyKey, oldChart[0]) for difficultyKey, oldChart in entry['charts'].items()]
+                    del packEntries[folder]
+                for difficultyKey, chartId in removedCharts:
+                    removed.append({'chartId': chartId, 'idNum': entry['idNum'], 'pack': packName,
+                                    'folder': folder, 'difficultyKey': difficultyKey})
+            if packEntries == {}:
+                del self.songs[packName]
+        idregistryLogger.info("finishRun: %s charts added, %s changed, %s removed.",
+                              len(self.added), len(self.changed), len(removed))
+        delta = {'added': self.added, 'changed': self.changed, 'removed': removed}
+        self.added = []
+        self.changed = []
+        self.seen = set()
+        return delta
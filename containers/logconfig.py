@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+import sys
+import logging
+
+# Date formatting will be the same for all loggers
+dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
+
+# Level names the scripts accept for --log-level.
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+# The handlers installed by the last configureLogging call, and the arguments it got.
+installedHandlers = []
+loggingConfig = None
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def configureLogging(level="WARNING", logFile=None):
+    """
+    Sets up logging for the container modules (STEPFILE, SONGPACK, PARSECACHE, ...).
+    The modules only get a NullHandler when imported, so nothing is logged and
+    no files are opened until a script calls this.
+
+    - level: Level name or number. Below DEBUG, debug records aren't even formatted.
+    - logFile: Optional path of a file to log to, in addition to the console.
+
+    Calling it again replaces the handlers of the previous call.
+    """
+    global loggingConfig
+
+    rootLogger = logging.getLogger()
+    for handler in installedHandlers:
+        rootLogger.removeHandler(handler)
+        handler.close()
+    del installedHandlers[:]
+
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    rootLogger.setLevel(level)
+
+    consoleHandler = logging.StreamHandler(sys.stderr)
+    installedHandlers.append(consoleHandler)
+    if logFile is not None:
+        installedHandlers.append(logging.FileHandler(logFile))
+    for handler in installedHandlers:
+        handler.setLevel(level)
+        handler.setFormatter(dateformatter)
+        rootLogger.addHandler(handler)
+
+    loggingConfig = (level, logFile)
+
+def getLoggingConfig():
+    """
+    Returns the (level, logFile) arguments of the last configureLogging call,
+    or None if logging was never configured.
+    """
+    return loggingConfig
+
+def initWorkerLogging(config):
+    """
+    Process pool initializer that sets up logging in a worker the same way as
+    in the parent, given the parent's getLoggingConfig().
+    """
+    if config is not None:
+        configureLogging(*config)
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+
+from containers.serializer import writeJson
+import os
+import math
+import time
+import heapq
+import cProfile
+import logging
+import threading
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+metricsLogger = logging.getLogger("METRICS")
+metricsLogger.addHandler(logging.NullHandler())
+
+# Stages of a run, in the order they happen. 'header' also covers splitting the
+# file into tags, 'charts' is counting the note data of every #NOTES tag and
+# 'assets' is probing the files a song refers to (see containers.assets).
+STAGES = ('discovery', 'read', 'header', 'charts', 'assets', 'serialization')
+
+# Number of slowest files (or packs) kept per stage for the report.
+SLOWEST_COUNT = 10
+
+# Stage -> cProfile.Profile, only set up by enableStageProfiling.
+stageProfilers = None
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def enableStageProfiling():
+    """
+    Makes every StageClock in this process run its stages under a cProfile
+    profiler of their own, for writeStageProfiles. Costs a lot of speed.
+    """
+    global stageProfilers
+    if stageProfilers is None:
+        stageProfilers = {}
+
+def writeStageProfiles(profileDirectory):
+    """
+    Dumps the profile of every stage to '<stage>.pstats' in profileDirectory,
+    for pstats or snakeviz. Returns the list of files written.
+    """
+    if stageProfilers is None:
+        return []
+    os.makedirs(profileDirectory, exist_ok=True)
+    profilePaths = []
+    for stage, profiler in sorted(stageProfilers.items()):
+        profilePath = os.path.join(profileDirectory, stage + ".pstats")
+        profiler.dump_stats(profilePath)
+        profilePaths.append(profilePath)
+    return profilePaths
+
+def getPercentile(sortedTimes, percent):
+    """
+    Nearest-rank percentile of a sorted, non-empty list.
+    """
+    rank = max(math.ceil(percent * len(sortedTimes) / 100.0) - 1, 0)
+    return sortedTimes[min(rank, len(sortedTimes) - 1)]
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class StageClock():
+    """
+    This class times the stages of one piece of work, like parsing a stepfile,
+    with as little overhead as possible: switch() ends the running stage and
+    starts the next one. The times add up per stage, so a stage that is
+    entered several times (like 'charts' for every #NOTES tag) gets its total.
+
+    When enableStageProfiling was called, every stage also runs under its own
+    profiler. Profilers only see the thread that started them.
+
+    - timings: Dictionary of stage -> seconds.
+    """
+
+    __slots__ = ('timings', 'stage', 'start', 'profiler')
+
+    def __init__(self):
+        self.timings = {}
+        self.stage = None
+        self.start = 0.0
+        self.profiler = None
+
+    def switch(self, stage=None):
+        """
+        Ends the running stage, if any, and starts stage. None just stops the clock.
+        """
+        now = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler = None
+        if self.stage is not None:
+            self.timings[self.stage] = self.timings.get(self.stage, 0.0) + now - self.start
+        self.stage = stage
+        if stage is not None and stageProfilers is not None:
+            self.profiler = stageProfilers.setdefault(stage, cProfile.Profile())
+            self.profiler.enable()
+        self.start = time.perf_counter() if self.profiler is not None else now
+
+class RunMetrics():
+    """
+    This class collects the stage times of a whole run: one time per file (or
+    per pack for the pack-level stages) of every stage, the totals of every
+    pack, and the slowest files of every stage. getReport turns them into
+    counts, totals and p50/p95/max.
+
+    addTime can be called from several threads.
+
+    - stageTimes: Dictionary of stage -> list of seconds.
+    - packTimes: Dictionary of pack name -> stage -> seconds.
+    - slowest: Dictionary of stage -> heap of the SLOWEST_COUNT slowest (seconds, file).
+    - startTime: When the run started, for the wall clock time.
+    """
+
+    def __init__(self):
+        self.stageTimes = {}
+        self.packTimes = {}
+        self.slowest = {}
+        self.startTime = time.time()
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        lines = [">>> RUNMETRICS INFORMATION"]
+        for stage, summary in self.getStageSummaries().items():
+            lines.append("- {0}: {1} x, total {2}s, p50 {3}ms, p95 {4}ms, max {5}ms".format(
+                stage, summary['count'], summary['total'], summary['p50Ms'], summary['p95Ms'], summary['maxMs']))
+        return "\n".join(lines)
+
+    def addTime(self, stage, seconds, packName=None, fileKey=None):
+        """
+        Records one time of a stage, for the pack and file (or pack) it was spent on.
+        """
+        with self.lock:
+            self.stageTimes.setdefault(stage, []).append(seconds)
+            if packName is not None:
+                packStages = self.packTimes.setdefault(packName, {})
+                packStages[stage] = packStages.get(stage, 0.0) + seconds
+            if fileKey is None:
+                fileKey = packName
+            if fileKey is not None:
+                slowest = self.slowest.setdefault(stage, [])
+                if len(slowest) < SLOWEST_COUNT:
+                    heapq.heappush(slowest, (seconds, fileKey))
+                elif seconds > slowest[0][0]:
+                    heapq.heapreplace(slowest, (seconds, fileKey))
+
+    def addStepfile(self, stepfile):
+        """
+        Records the stage times of a parsed Stepfile. Stepfiles that came from
+        the cache have none.
+        """
+        for stage, seconds in stepfile.timings.items():
+            self.addTime(stage, seconds, stepfile.packName, stepfile.stepfilePath)
+
+    def getStageSummaries(self):
+        summaries = {}
+        for stage in sorted(self.stageTimes, key=lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES)):
+            sortedTimes = sorted(self.stageTimes[stage])
+            summaries[stage] = {'count': len(sortedTimes),
+                                'total': round(sum(sortedTimes), 3),
+                                'p50Ms': round(getPercentile(sortedTimes, 50) * 1000.0, 3),
+                                'p95Ms': round(getPercentile(sortedTimes, 95) * 1000.0, 3),
+                                'maxMs': round(sortedTimes[-1] * 1000.0, 3)}
+        return summaries
+
+    def getReport(self):
+        """
+        Returns the report dictionary: the stage summaries, the stage totals of
+        every pack (slowest pack first) and the slowest files of every stage.
+        """
+        packs = sorted(self.packTimes.items(), key=lambda packItem: sum(packItem[1].values()), reverse=True)
+        return {'wallSeconds': round(time.time() - self.startTime, 3),
+                'stages': self.getStageSummaries(),
+                'packs': [{'pack': packName, 'total': round(sum(packStages.values()), 3),
+                           'stages': {stage: round(seconds, 4) for stage, seconds in packStages.items()}}
+                          for packName, packStages in packs],
+                'slowest': {stage: [{'file': fileKey, 'ms': round(seconds * 1000.0, 3)}
+                                    for seconds, fileKey in sorted(slowest, reverse=True)]
+                            for stage, slowest in self.slowest.items()}}
+
+    def writeReport(self, reportPath):
+        metricsLogger.info("writeReport: Writing metrics report to '%s'", reportPath)
+        return writeJson(reportPath, self.getReport())
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+from containers.parsecache import ParseCache, getParseKey
+from containers.assets import AssetCache, AssetIndex, DEFAULT_ASSET_THREADS, getAssetsKey
+from containers.serializer import COMPRESSION_SUFFIXES, getEncoderName, getJsonPath
+from containers.stepfile import DEFAULT_ENCODINGS
+import os
+import sys
+import json
+import codecs
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def addPackOptions(parser):
+    """
+    Adds the options that decide what goes into the pack JSONs and how they are
+    written to an argparse parser. parsesongsfolder.py and watchsongsfolder.py
+    share them, along with the parse cache, so they always agree on the cache
+    keys and pack signatures.
+    """
+    parser.add_argument("--cache", default=None,
+                        help="Path of the parse cache manifest. Defaults to '.songpackcache.json' in the Songs directory.")
+    parser.add_argument("--hash", action="store_true",
+                        help="Also compare file contents, so stepfiles that were only touched stay cached.")
+    parser.add_argument("--compact", action="store_true",
+                        help="Write the JSONs without indentation.")
+    parser.add_argument("--compress", choices=sorted(COMPRESSION_SUFFIXES), default=None,
+                        help="Compress the JSONs with gzip or zstd (needs the zstandard package). "
+                             "combinejsons.py reads them either way.")
+    parser.add_argument("--timing", action="store_true",
+                        help="Also work out every chart's length in seconds, peak notes per second and stream breakdown "
+                             "from the song's BPMs, stops and offset. Warps aren't modelled. Adds to the parse time.")
+    parser.add_argument("--assets", action="store_true",
+                        help="Index the banner and music of every song: whether they exist, their size and mtime, the "
+                             "banner's format and dimensions and the music's format and duration. Only file headers are "
+                             "read, and unchanged files are taken from the asset cache.")
+    parser.add_argument("--asset-threads", type=int, default=DEFAULT_ASSET_THREADS,
+                        help="Files probed at once with --assets. Defaults to " + str(DEFAULT_ASSET_THREADS) + ".")
+    parser.add_argument("--encodings", default=",".join(DEFAULT_ENCODINGS),
+                        help="Comma separated encodings to try, in order, for the text of stepfiles that isn't "
+                             "plain ASCII. Defaults to '" + ",".join(DEFAULT_ENCODINGS) + "'.")
+
+def getEncodings(parser, args):
+    """
+    Returns the --encodings of the parsed args as a tuple, stopping with a
+    parser error if one of them is unknown or there are none.
+    """
+    encodings = tuple(encoding.strip() for encoding in args.encodings.split(",") if encoding.strip() != "")
+    try:
+        for encoding in encodings:
+            codecs.lookup(encoding)
+    except LookupError:
+        parser.error("Unknown encoding in --encodings: " + str(sys.exc_info()[1]))
+    if encodings == ():
+        parser.error("--encodings needs at least one encoding")
+    return encodings
+
+def openParseCache(args, songsDirectory, encodings):
+    """
+    Returns the loaded ParseCache of --cache (or the default in songsDirectory),
+    keyed by the encodings and --timing.
+    """
+    cachePath = args.cache
+    if cachePath is None:
+        cachePath = os.path.join(songsDirectory, ".songpackcache.json")
+    cache = ParseCache(cachePath, useHash=args.hash, parseKey=getParseKey(encodings, args.timing))
+    cache.load()
+    return cache
+
+def openAssetIndex(args, cache=None):
+    """
+    Returns an AssetIndex with --asset-threads if --assets was given, or None.
+    Its cache lives next to the parse cache, or only in memory without one.
+    """
+    if not args.assets:
+        return None
+    assetCache = AssetCache()
+    if cache is not None:
+        assetCache = AssetCache(os.path.splitext(cache.cachePath)[0] + ".assets.json")
+        assetCache.load()
+    return AssetIndex(assetCache, args.asset_threads)
+
+def removePackJsons(basePath, keepPath=None):
+    """
+    Removes the JSONs at basePath written with any compression (see getJsonPath),
+    except keepPath.
+    """
+    for compression in [None] + list(COMPRESSION_SUFFIXES):
+        jsonPath = getJsonPath(basePath, compression)
+        if jsonPath != keepPath and os.path.exists(jsonPath):
+            os.remove(jsonPath)
+
+def submitPack(writer, pack, cache=None, catalog=None, assetIndex=None, scriptName="parsesongsfolder.py"):
+    """
+    Hands the songs of a parsed SongPack over to the PackWriter, unless the
+    pack is unchanged since the last run and still has its JSON. The pack is
+    added to the SQLite catalog here, since the catalog belongs to this thread.
+    When an AssetIndex is given, the pack's assets are indexed first and are
+    part of what has to be unchanged, along with the options the JSON is
+    written with and the cache's parse options. JSONs of the pack written
+    with another compression are removed.
+
+    Returns the list of song dictionaries of the pack, [] if it has no songs.
+    """
+    if assetIndex is not None:
+        pack.indexAssets(assetIndex)
+    songs = pack.getSongs()
+    if songs == []:
+        return songs
+    packName = pack.getPackName()
+    if catalog is not None:
+        catalog.addPack(packName, songs)
+    removePackJsons(os.path.join(writer.jsonsDir, packName), writer.getPackJsonPath(packName))
+
+    # Packs whose stepfiles all came unchanged from the cache keep their JSON.
+    signature = None
+    if cache is not None:
+        stepfilePaths = [stepfile.stepfilePath for stepfile in pack.getStepfiles()]
+        packKey = [getEncoderName(), writer.compact, writer.compression, cache.parseKey]
+        if assetIndex is not None:
+            packKey.append(getAssetsKey(songs))
+        signature = cache.getPackSignature(stepfilePaths, json.dumps(packKey))
+        if os.path.exists(writer.getPackJsonPath(packName)) and cache.isPackUnchanged(packName, signature):
+            print(">>> " + scriptName + ": WRITE: Song Pack '" + packName + "' is unchanged. Keeping its JSON.")
+            return songs
+    print(">>> " + scriptName + ": WRITE: Queueing JSON file for Song Pack '" + packName + "'. " + str(len(songs)) + " songs found.")
+    writer.submit(packName, songs, signature)
+    return songs
+
+def removeStaleJsons(writer, cache, packNames, scriptName="parsesongsfolder.py"):
+    """
+    Removes the JSONs of the song packs an earlier run wrote (the packs with a
+    signature in the cache) that aren't in packNames, and drops them from the
+    cache. Nothing else in the jsons directory is touched.
+    """
+    for packName in [packName for packName in cache.packs if packName not in packNames]:
+        if os.path.exists(writer.getPackJsonPath(packName)):
+            print(">>> " + scriptName + ": WRITE: Removing stale JSON for Song Pack '" + packName + "'.")
+        removePackJsons(os.path.join(writer.jsonsDir, packName))
+        del cache.packs[packName]
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+
+from containers.serializer import writeJson, getJsonPath
+from containers.metrics import StageClock
+import os
+import sys
+import queue
+import logging
+import threading
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+packwriterLogger = logging.getLogger("PACKWRITER")
+packwriterLogger.addHandler(logging.NullHandler())
+
+# Number of parsed packs that may wait for the writer before parsing blocks.
+DEFAULT_QUEUE_DEPTH = 2
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class PackWriter():
+    """
+    This class writes song pack JSONs on a background thread, so the next pack
+    can be parsed while the last one is written out. Packs are handed over
+    through a bounded queue: once queueDepth packs are waiting, submit blocks
+    until the writer catches up, which keeps memory bounded by the queue
+    instead of the whole library.
+
+    Every JSON is written atomically with containers.serializer.writeJson, so
+    a crash leaves the packs written so far intact.
+
+    - jsonsDir: Directory the pack JSONs are written to.
+    - written: List of (packName, signature) of every pack written successfully.
+    - failed: List of (packName, error message) of packs that couldn't be written.
+    - writeTime: Seconds the writer thread spent writing.
+    - bytesWritten: Total size of the JSONs written.
+    - metrics: RunMetrics the 'serialization' time of every pack goes to, or None.
+    """
+
+    def __init__(self, jsonsDir, queueDepth=DEFAULT_QUEUE_DEPTH, compact=False, compression=None, metrics=None):
+        self.jsonsDir = jsonsDir
+        self.metrics = metrics
+        self.compact = compact
+        self.compression = compression
+        self.queue = queue.Queue(maxsize=max(queueDepth, 1))
+        self.written = []
+        self.failed = []
+        self.writeTime = 0.0
+        self.bytesWritten = 0
+        self.thread = threading.Thread(target=self.run, name="PackWriter", daemon=True)
+        self.thread.start()
+
+    def __str__(self):
+        return """>>> PACKWRITER INFORMATION
+- jsonsDir: {}
+- written: {}
+- failed: {}
+- writeTime: {}
+- bytesWritten: {}""" \
+        .format(self.jsonsDir, len(self.written), len(self.failed), round(self.writeTime, 3), self.bytesWritten)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def getPackJsonPath(self, packName):
+        return getJsonPath(os.path.join(self.jsonsDir, packName), self.compression)
+
+    def submit(self, packName, songs, signature=None):
+        """
+        Queues the songs of a pack to be written to its JSON (see getPackJsonPath).
+        Blocks while the queue is full. signature is handed back in written.
+        """
+        self.queue.put((packName, songs, signature))
+
+    def close(self):
+        """
+        Waits for every queued pack to be written and stops the writer thread.
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            packName, songs, signature = job
+            clock = StageClock()
+            try:
+                clock.switch('serialization')
+                jsonOut = writeJson(self.getPackJsonPath(packName), songs, self.compact, self.compression)
+                clock.switch()
+                self.written.append((packName, signature))
+                self.writeTime += jsonOut.seconds
+                self.bytesWritten += jsonOut.bytesWritten
+                if self.metrics is not None:
+                    self.metrics.addTime('serialization', clock.timings['serialization'], packName, jsonOut.outputPath)
+                packwriterLogger.debug("run: Wrote %s songs for Song Pack '%s'", len(songs), packName)
+            except:
+                clock.switch()
+                error = "{0}: {1}".format(sys.exc_info()[0].__name__, sys.exc_info()[1])
+                self.failed.append((packName, error))
+                packwriterLogger.warning("run: '%s': %s", packName, error)
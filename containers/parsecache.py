@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+from containers.serializer import readJson, writeJson
+import os
+import sys
+import json
+import hashlib
+import logging
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+parsecacheLogger = logging.getLogger("PARSECACHE")
+parsecacheLogger.addHandler(logging.NullHandler())
+
+# Bump this whenever the song dictionary layout changes so old caches are thrown away.
+CACHE_VERSION = 7
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def hashFile(filePath):
+    """
+    Returns the sha1 hex digest of the contents of filePath.
+    """
+    sha = hashlib.sha1()
+    with open(filePath, 'rb') as hashedFile:
+        for block in iter(lambda: hashedFile.read(1 << 16), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def getParseKey(encodings, timingAnalytics=False):
+    """
+    Returns the parseKey of a ParseCache for songs parsed with the given
+    encodings and with or without timing analytics.
+    """
+    return json.dumps([list(encodings), timingAnalytics])
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ParseCache():
+    """
+    This class is a persistent cache of parsed song dictionaries, stored on disk
+    as a JSON manifest so unchanged .sm files don't have to be parsed again.
+
+    The constructor requires the full path to the manifest file. If useHash is
+    True, a content hash is stored too, so a file whose mtime changed but whose
+    contents didn't is still a cache hit. parseKey is a string of the options
+    the songs are parsed with (like the encodings); songs cached under another
+    parseKey are parsed again.
+
+    - cachePath: Full path to the manifest file.
+    - useHash: Whether content hashes are computed and compared.
+    - parseKey: The parse options songs are looked up and stored with.
+    - songs: Dictionary of stepfile path -> {'size', 'mtime_ns', 'hash', 'parseKey', 'songDict'}.
+    - packs: Dictionary of pack name -> signature of the stepfiles the pack JSON was written from.
+    - seenPaths: Stepfile paths looked up or stored during this run, used for pruning.
+    """
+
+    def __init__(self, cachePath, useHash=False, parseKey=None):
+        self.cachePath = cachePath
+        self.useHash = useHash
+        self.parseKey = parseKey
+        self.songs = {}
+        self.packs = {}
+        self.seenPaths = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return """>>> PARSECACHE INFORMATION
+- cachePath: {}
+- useHash: {}
+- songs: {}
+- hits: {}
+- misses: {}""" \
+        .format(self.cachePath, self.useHash, len(self.songs), self.hits, self.misses)
+
+    def load(self):
+        """
+        Loads the manifest from disk. A missing, unreadable or outdated manifest
+        just leaves the cache empty.
+        """
+        parsecacheLogger.info("load: Loading parse cache '%s'", self.cachePath)
+        try:
+            manifest = readJson(self.cachePath)
+            if manifest.get('version') == CACHE_VERSION:
+                self.songs = manifest['songs']
+                self.packs = manifest['packs']
+            else:
+                parsecacheLogger.info("load: Parse cache version changed, starting over.")
+        except FileNotFoundError:
+            parsecacheLogger.info("load: No parse cache found at '%s'", self.cachePath)
+        except:
+            parsecacheLogger.warning("load: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+
+    def save(self, prune=True):
+        """
+        Writes the manifest back to disk atomically with writeJson so a crash
+        never leaves half a manifest behind. If prune is True, songs that
+        weren't seen during this run are dropped from the cache.
+        """
+        if prune:
+            self.songs = {path: entry for path, entry in self.songs.items() if path in self.seenPaths}
+        parsecacheLogger.info("save: Saving %s songs to parse cache '%s'", len(self.songs), self.cachePath)
+        writeJson(self.cachePath, {'version': CACHE_VERSION, 'songs': self.songs, 'packs': self.packs}, compact=True)
+
+    def getSongDict(self, stepfilePath):
+        """
+        Returns the cached song dictionary for stepfilePath, or None if the file
+        is new or changed since it was cached, or was parsed with other options.
+        """
+        self.seenPaths.add(stepfilePath)
+        entry = self.songs.get(stepfilePath)
+        if entry is None or entry.get('parseKey') != self.parseKey:
+            self.misses += 1
+            return None
+        try:
+            fileStat = os.stat(stepfilePath)
+            if fileStat.st_size == entry['size'] and fileStat.st_mtime_ns == entry['mtime_ns']:
+                self.hits += 1
+                return entry['songDict']
+
+            # Same size but touched: only the contents can tell if it changed.
+            if self.useHash and fileStat.st_size == entry['size'] and entry['hash'] is not None:
+                if hashFile(stepfilePath) == entry['hash']:
+                    entry['mtime_ns'] = fileStat.st_mtime_ns
+                    self.hits += 1
+                    return entry['songDict']
+        except:
+            parsecacheLogger.warning("getSongDict: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        self.misses += 1
+        return None
+
+    def putSongDict(self, stepfilePath, songDict):
+        """
+        Stores the song dictionary parsed from stepfilePath along with the
+        file's current size, mtime, (optionally) content hash and the parseKey.
+        """
+        self.seenPaths.add(stepfilePath)
+        try:
+            fileStat = os.stat(stepfilePath)
+            fileHash = None
+            if self.useHash:
+                fileHash = hashFile(stepfilePath)
+            self.songs[stepfilePath] = {'size': fileStat.st_size,
+                                        'mtime_ns': fileStat.st_mtime_ns,
+                                        'hash': fileHash,
+                                        'parseKey': self.parseKey,
+                                        'songDict': songDict}
+        except:
+            parsecacheLogger.warning("putSongDict: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+
+    def getPackSignature(self, stepfilePaths, extraKey=None):
+        """
+        Returns a signature of the cached content hash (or size/mtime when there is
+        no hash) of every stepfile path given. Two runs give the same signature only
+        if none of the pack's stepfiles changed. extraKey is a string of anything else
+        the pack JSON depends on, like the output options or the asset information
+        of its songs.
+        """
+        sha = hashlib.sha1()
+        if extraKey is not None:
+            sha.update(extraKey.encode("utf-8"))
+        for stepfilePath in sorted(stepfilePaths):
+            entry = self.songs.get(stepfilePath, {})
+            if entry.get('hash') is not None:
+                fileKey = entry['hash']
+            else:
+                fileKey = "{0}\0{1}".format(entry.get('size'), entry.get('mtime_ns'))
+            sha.update("{0}\0{1}\n".format(stepfilePath, fileKey).encode("utf-8"))
+        return sha.hexdigest()
+
+    def isPackUnchanged(self, packName, signature):
+        return self.packs.get(packName) == signature
+
+    def setPackSignature(self, packName, signature):
+        self.packs[packName] = signature
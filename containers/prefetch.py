@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import sys
+import logging
+import threading
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+prefetchLogger = logging.getLogger("PREFETCH")
+prefetchLogger.addHandler(logging.NullHandler())
+
+# Files read ahead at most, and bytes of read-ahead files that may wait to be used.
+DEFAULT_PREFETCH_DEPTH = 8
+DEFAULT_PREFETCH_BYTES = 64 * 1024 * 1024
+MAX_PREFETCH_THREADS = 8
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def readFileBytes(filePath):
+    with open(filePath, 'rb') as inFile:
+        return inFile.read()
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class Prefetcher():
+    """
+    This class reads a list of files ahead of whoever iterates over it, on a
+    small pool of threads, so the round trip of every open() and read() on
+    slow or network storage overlaps with parsing the files already loaded.
+
+    Iterating yields (filePath, data, error) in the order of filePaths. data
+    is the whole file as bytes, or None if reading failed, in which case
+    error has the exception text.
+
+    At most depth files are read or waiting at once, and no new read is
+    started while the files waiting to be used add up to byteBudget or more.
+    Reads already in flight still finish, so the budget can be overshot by
+    up to depth files. The file being used doesn't count, so a file bigger
+    than the budget still gets through on its own.
+
+    - filePaths: Files to read, in the order they're used.
+    - depth: Files read ahead at most.
+    - byteBudget: Bytes of files waiting to be used before reading pauses.
+    - bufferedBytes: Bytes of files read but not handed out yet.
+    """
+
+    def __init__(self, filePaths, depth=DEFAULT_PREFETCH_DEPTH, byteBudget=DEFAULT_PREFETCH_BYTES, threads=None):
+        self.filePaths = list(filePaths)
+        self.depth = max(depth, 1)
+        self.byteBudget = byteBudget
+        self.threads = threads if threads is not None else min(self.depth, MAX_PREFETCH_THREADS)
+        self.bufferedBytes = 0
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return """>>> PREFETCHER INFORMATION
+- files: {}
+- depth: {}
+- byteBudget: {}
+- threads: {}""" \
+        .format(len(self.filePaths), self.depth, self.byteBudget, self.threads)
+
+    def readFile(self, filePath):
+        data = readFileBytes(filePath)
+        with self.lock:
+            self.bufferedBytes += len(data)
+        return data
+
+    def __iter__(self):
+        nextIndex = 0
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="Prefetch") as executor:
+            try:
+                while nextIndex < len(self.filePaths) or pending:
+                    # Top up the reads in flight while there's room in the depth and the byte budget.
+                    while nextIndex < len(self.filePaths) and len(pending) < self.depth and \
+                            (pending == deque() or self.bufferedBytes < self.byteBudget):
+                        filePath = self.filePaths[nextIndex]
+                        pending.append((filePath, executor.submit(self.readFile, filePath)))
+                        nextIndex += 1
+
+                    filePath, future = pending.popleft()
+                    try:
+                        data = future.result()
+                    except:
+                        prefetchLogger.warning("Prefetcher: '%s': %s: %s", filePath, sys.exc_info()[0].__name__,
+                                               sys.exc_info()[1])
+                        yield filePath, None, "{0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1]))
+                        continue
+                    with self.lock:
+                        self.bufferedBytes -= len(data)
+                    yield filePath, data, None
+            finally:
+                # Reads that weren't started yet are dropped if the caller stops early.
+                for filePath, future in pending:
+                    future.cancel()
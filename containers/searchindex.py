@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+from containers.stepfile import getStepArtistFromFolder
+from containers.serializer import readJson, writeJson
+import bisect
+import logging
+import unicodedata
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+searchindexLogger = logging.getLogger("SEARCHINDEX")
+searchindexLogger.addHandler(logging.NullHandler())
+
+# Bump this whenever the layout of the index file changes.
+SEARCH_INDEX_VERSION = 1
+
+# Song fields that are searchable, in the order they're stored for every document.
+SEARCH_FIELDS = ('title', 'subtitle', 'artist', 'pack', 'stepartist')
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def normalizeText(text):
+    """
+    Lower-cases text, strips accents and turns everything that isn't a letter
+    or a digit into a space, so 'Café-Remix!' and 'cafe remix' match.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    normalized = []
+    for character in decomposed:
+        if unicodedata.combining(character):
+            continue
+        if character.isalnum():
+            normalized.append(character.casefold())
+        else:
+            normalized.append(" ")
+    return "".join(normalized)
+
+def tokenizeText(text):
+    return normalizeText(text).split()
+
+def getTrigrams(token):
+    """
+    Returns the set of trigrams of a token, padded with spaces so that short
+    tokens and word starts and ends get trigrams too.
+    """
+    padded = " " + token + " "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+def loadSearchIndex(indexPath):
+    """
+    Loads an index file written by SearchIndexBuilder and returns a SearchIndex.
+    """
+    index = readJson(indexPath)
+    if index.get('version') != SEARCH_INDEX_VERSION:
+        raise ValueError("Search index '{0}' has version {1}, expected {2}".format(indexPath, index.get('version'),
+                                                                                   SEARCH_INDEX_VERSION))
+    return SearchIndex(index)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class SearchIndexBuilder():
+    """
+    This class builds an inverted index over the title, subtitle, artist, pack
+    and stepartist (from the song folder) of every song, with posting lists of
+    song idNums for every normalized token and every token trigram.
+
+    Songs are added one at a time, so the catalog never has to be in memory.
+
+    - docs: Dictionary of idNum -> list of the SEARCH_FIELDS of the song.
+    - tokens: Dictionary of token -> set of idNums.
+    - trigrams: Dictionary of trigram -> set of idNums.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.tokens = {}
+        self.trigrams = {}
+
+    def addSong(self, song):
+        """
+        Adds a song dictionary from the combined JSON (it must have its idNum).
+        """
+        idNum = song['idNum']
+        stepArtist = getStepArtistFromFolder(song.get('folder', ""))
+        if stepArtist == "unspecified":
+            stepArtist = ""
+        fields = [song.get('title') or "", song.get('subtitle') or "", song.get('artist') or "",
+                  song.get('pack') or "", stepArtist]
+        self.docs[idNum] = fields
+        for field in fields:
+            for token in tokenizeText(field):
+                self.tokens.setdefault(token, set()).add(idNum)
+                for trigram in getTrigrams(token):
+                    self.trigrams.setdefault(trigram, set()).add(idNum)
+
+    def toDict(self):
+        return {'version': SEARCH_INDEX_VERSION,
+                'fields': SEARCH_FIELDS,
+                'docs': {str(idNum): fields for idNum, fields in self.docs.items()},
+                'tokens': {token: sorted(self.tokens[token]) for token in sorted(self.tokens)},
+                'trigrams': {trigram: sorted(self.trigrams[trigram]) for trigram in sorted(self.trigrams)}}
+
+    def write(self, indexPath):
+        searchindexLogger.info("write: Writing search index of %s songs to '%s'", len(self.docs), indexPath)
+        writeJson(indexPath, self.toDict(), compact=True)
+
+class SearchIndex():
+    """
+    This class answers prefix and fuzzy searches from a loaded index (see
+    loadSearchIndex). Results are lists of (idNum, fields) tuples where fields
+    is a dictionary of the SEARCH_FIELDS of the song.
+
+    - docs: Dictionary of idNum -> list of the SEARCH_FIELDS of the song.
+    - tokens: Dictionary of token -> list of idNums.
+    - trigrams: Dictionary of trigram -> list of idNums.
+    - sortedTokens: All tokens in sorted order, for prefix lookups with bisect.
+    """
+
+    def __init__(self, index):
+        self.docs = {int(idNum): fields for idNum, fields in index['docs'].items()}
+        self.tokens = index['tokens']
+        self.trigrams = index['trigrams']
+        self.sortedTokens = sorted(self.tokens)
+
+    def getDocument(self, idNum):
+        return dict(zip(SEARCH_FIELDS, self.docs[idNum]))
+
+    def getPrefixIds(self, prefix):
+        """
+        Returns the set of idNums of every token starting with prefix.
+        """
+        ids = set()
+        tokenIndex = bisect.bisect_left(self.sortedTokens, prefix)
+        while tokenIndex < len(self.sortedTokens) and self.sortedTokens[tokenIndex].startswith(prefix):
+            ids.update(self.tokens[self.sortedTokens[tokenIndex]])
+            tokenIndex += 1
+        return ids
+
+    def search(self, query, limit=20):
+        """
+        Prefix search: every word of the query must be the start of a word in one
+        of the song's fields. 'drea the' finds 'Dreamer' by 'The Band'.
+        """
+        queryTokens = tokenizeText(query)
+        if queryTokens == []:
+            return []
+        ids = None
+        for token in queryTokens:
+            tokenIds = self.getPrefixIds(token)
+            ids = tokenIds if ids is None else ids & tokenIds
+            if not ids:
+                return []
+        return [(idNum, self.getDocument(idNum)) for idNum in sorted(ids)[:limit]]
+
+    def fuzzySearch(self, query, limit=20, minScore=0.5):
+        """
+        Fuzzy search: songs are scored by the share of the query's trigrams that
+        appear in them, so typos like 'drem' still find 'dream'. Songs scoring
+        below minScore are left out. Best scores come first.
+        """
+        queryTrigrams = set()
+        for token in tokenizeText(query):
+            queryTrigrams.update(getTrigrams(token))
+        if not queryTrigrams:
+            return []
+        scores = {}
+        for trigram in queryTrigrams:
+            for idNum in self.trigrams.get(trigram, []):
+                scores[idNum] = scores.get(idNum, 0) + 1
+        ranked = sorted(((count / len(queryTrigrams), idNum) for idNum, count in scores.items()
+                         if count / len(queryTrigrams) >= minScore), key=lambda scored: (-scored[0], scored[1]))
+        return [(idNum, self.getDocument(idNum)) for score, idNum in ranked[:limit]]
@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+
+import os
+import json
+import gzip
+import time
+import logging
+
+# orjson is optional: without it, the stdlib json module does the encoding.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# zstandard is optional and only needed for zstd output.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+serializerLogger = logging.getLogger("SERIALIZER")
+serializerLogger.addHandler(logging.NullHandler())
+
+# Compression name -> suffix added after '.json'.
+COMPRESSION_SUFFIXES = {'gzip': ".gz", 'zstd': ".zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# One level of indentation in indented output. orjson only indents by two
+# spaces, so the stdlib does the same and both give the same bytes.
+INDENT = b"  "
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getEncoderName():
+    return "orjson" if orjson is not None else "json"
+
+def dumpsJson(data, compact=False):
+    """
+    Returns data serialized as UTF-8 JSON bytes, with orjson if it's installed.
+    Without compact, the output is indented by INDENT.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2)
+    if compact:
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode("utf-8")
+    return json.dumps(data, indent=len(INDENT), ensure_ascii=False).encode("utf-8")
+
+def loadsJson(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def decompressJson(data):
+    """
+    Returns the JSON bytes of a file's contents, decompressing gzip or zstd
+    data (told apart by their magic bytes) and passing anything else through.
+    """
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ImportError("Reading zstd compressed JSON needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+def readJson(jsonPath):
+    """
+    Loads a JSON file written by any of the scripts, compressed or not.
+    """
+    with open(jsonPath, 'rb') as jsonFile:
+        return loadsJson(decompressJson(jsonFile.read()))
+
+def getJsonPath(basePath, compression=None):
+    """
+    Returns basePath with '.json' and the suffix of the compression added,
+    e.g. 'jsons/PackA' -> 'jsons/PackA.json.gz' for gzip.
+    """
+    return basePath + ".json" + COMPRESSION_SUFFIXES.get(compression, "")
+
+def isJsonFile(fileName):
+    return any(fileName.endswith(".json" + suffix) for suffix in [""] + list(COMPRESSION_SUFFIXES.values()))
+
+def writeJson(outputPath, data, compact=False, compression=None):
+    """
+    Writes data as JSON to outputPath atomically (see JsonOutput) and returns
+    the JsonOutput, which has the bytes written and the time it took.
+    """
+    with JsonOutput(outputPath, compression) as jsonOut:
+        jsonOut.write(dumpsJson(data, compact))
+    return jsonOut
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class JsonOutput():
+    """
+    This class is a binary output file for JSON, used as a context manager.
+    Everything is written to a temporary file, optionally through a gzip or
+    zstd compressor, and renamed over outputPath when the block ends without
+    an error, so readers never see half a file. On an error the temporary
+    file is removed instead.
+
+    - outputPath: Path of the file once it's done.
+    - compression: None, 'gzip' or 'zstd'.
+    - rawBytes: Bytes of JSON written, before compression.
+    - bytesWritten: Size of the finished file.
+    - seconds: Time from opening to renaming the file.
+    """
+
+    def __init__(self, outputPath, compression=None):
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError("Unknown compression '{0}'".format(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package")
+        self.outputPath = outputPath
+        self.tempPath = outputPath + ".tmp"
+        self.compression = compression
+        self.rawBytes = 0
+        self.bytesWritten = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        return """>>> JSONOUTPUT INFORMATION
+- outputPath: {}
+- compression: {}
+- rawBytes: {}
+- bytesWritten: {}
+- seconds: {}""" \
+        .format(self.outputPath, self.compression, self.rawBytes, self.bytesWritten, round(self.seconds, 3))
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.file = open(self.tempPath, 'wb')
+        if self.compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.file, mode='wb', compresslevel=6, mtime=0)
+        elif self.compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.file, closefd=False)
+        else:
+            self.stream = self.file
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        try:
+            if self.stream is not self.file:
+                self.stream.close()
+            self.file.close()
+            if excType is None:
+                os.replace(self.tempPath, self.outputPath)
+                self.bytesWritten = os.path.getsize(self.outputPath)
+        finally:
+            if os.path.exists(self.tempPath):
+                os.remove(self.tempPath)
+            self.seconds = time.perf_counter() - self.start
+        serializerLogger.debug("JsonOutput: Wrote %s bytes (%s before compression) to '%s' in %.3f seconds",
+                               self.bytesWritten, self.rawBytes, self.outputPath, self.seconds)
+
+    def write(self, data):
+        """
+        Writes JSON bytes (or a string, which is encoded as UTF-8).
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.stream.write(data)
+        self.rawBytes += len(data)
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+from containers.serializer import INDENT, JsonOutput, dumpsJson, getJsonPath, isJsonFile, readJson, writeJson
+import os
+import sys
+import hashlib
+import logging
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+shardsLogger = logging.getLogger("SHARDS")
+shardsLogger.addHandler(logging.NullHandler())
+
+# Bump this whenever the layout of the manifest or the shards changes.
+SHARD_MANIFEST_VERSION = 1
+SHARD_MANIFEST_NAME = "manifest.json"
+SHARD_PREFIX = "shard-"
+
+# Shards are closed once their JSON would grow past this many bytes.
+DEFAULT_SHARD_BYTES = 4 * 1024 * 1024
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getPackEntry(packName, packJson, compact=False, firstEntry=True):
+    """
+    Returns the bytes of one 'packName: [songs]' entry of a combined JSON
+    object, for the pack's songs already serialized by dumpsJson. The result
+    is the same as dumpsJson would give for the whole object.
+    """
+    if compact:
+        return (b"" if firstEntry else b",") + dumpsJson(packName) + b":" + packJson
+    return (b"\n" if firstEntry else b",\n") + INDENT + dumpsJson(packName) + b": " + packJson.replace(b"\n", b"\n" + INDENT)
+
+def splitSongs(songs, maxBytes, compact=False):
+    """
+    Splits the songs of a pack that is too big for one shard into runs of
+    songs whose JSON stays under about maxBytes each. Every run has at least
+    one song, so a single song bigger than maxBytes gets a run of its own.
+    """
+    runs = [[]]
+    runBytes = 0
+    for song in songs:
+        songBytes = len(dumpsJson(song, compact))
+        if runs[-1] != [] and runBytes + songBytes > maxBytes:
+            runs.append([])
+            runBytes = 0
+        runs[-1].append(song)
+        runBytes += songBytes
+    return runs
+
+def loadShardManifest(shardsDirectory):
+    """
+    Loads the manifest written by ShardWriter.finish.
+    """
+    manifest = readJson(os.path.join(shardsDirectory, SHARD_MANIFEST_NAME))
+    if manifest.get('version') != SHARD_MANIFEST_VERSION:
+        raise ValueError("Shard manifest in '{0}' has version {1}, expected {2}".format(
+            shardsDirectory, manifest.get('version'), SHARD_MANIFEST_VERSION))
+    return manifest
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ShardWriter():
+    """
+    This class splits the combined catalog into shards: JSON files with the
+    same layout as the combined JSON ({pack name: [songs]}) for a few packs
+    each, so a client can fetch only the packs it needs. Packs are added in
+    order, one at a time, and a shard is written once the next pack would
+    push it past maxShardBytes. A pack that is bigger than that on its own is
+    split over several shards by runs of songs (so by idNum range), and shows
+    up in the manifest of every one of them.
+
+    Shards are named after the SHA-256 of their JSON, so a client can cache
+    them forever. finish() writes the manifest, listing every shard's file,
+    packs, idNum range, song count, size and hash, and removes the shards of
+    earlier runs that aren't in it anymore.
+
+    - shardsDirectory: Directory the shards and the manifest are written to.
+    - maxShardBytes: Size of the JSON of a shard (before compression) that closes it.
+    - shards: List of the manifest entries of the shards written so far.
+    - bytesWritten: Total size of the shards written.
+    """
+
+    def __init__(self, shardsDirectory, maxShardBytes=DEFAULT_SHARD_BYTES, compact=False, compression=None):
+        self.shardsDirectory = shardsDirectory
+        self.maxShardBytes = maxShardBytes
+        self.compact = compact
+        self.compression = compression
+        self.shards = []
+        self.bytesWritten = 0
+        self.pendingEntries = []
+        self.pendingBytes = 0
+        self.pendingPacks = []
+        self.pendingIds = []
+        os.makedirs(shardsDirectory, exist_ok=True)
+
+    def __str__(self):
+        return """>>> SHARDWRITER INFORMATION
+- shardsDirectory: {}
+- maxShardBytes: {}
+- shards: {}
+- bytesWritten: {}""" \
+        .format(self.shardsDirectory, self.maxShardBytes, len(self.shards), self.bytesWritten)
+
+    def addPack(self, packName, songs, packJson=None):
+        """
+        Adds the songs of a pack, which must have their idNums already.
+        packJson is dumpsJson(songs, compact) if the caller has it already.
+        """
+        if packJson is None:
+            packJson = dumpsJson(songs, self.compact)
+        if len(packJson) > self.maxShardBytes:
+            self.flush()
+            for run in splitSongs(songs, self.maxShardBytes, self.compact):
+                self.addEntry(packName, run, dumpsJson(run, self.compact))
+                self.flush()
+            return
+        if self.pendingEntries != [] and self.pendingBytes + len(packJson) > self.maxShardBytes:
+            self.flush()
+        self.addEntry(packName, songs, packJson)
+
+    def addEntry(self, packName, songs, packJson):
+        entry = getPackEntry(packName, packJson, self.compact, self.pendingEntries == [])
+        self.pendingEntries.append(entry)
+        self.pendingBytes += len(entry)
+        self.pendingPacks.append(packName)
+        self.pendingIds.extend(song['idNum'] for song in songs)
+
+    def flush(self):
+        """
+        Writes the packs added since the last shard as a shard of their own.
+        """
+        if self.pendingEntries == []:
+            return
+        closing = b"}" if self.compact else b"\n}"
+        shardJson = b"".join([b"{"] + self.pendingEntries + [closing])
+        shardHash = hashlib.sha256(shardJson).hexdigest()
+        shardPath = getJsonPath(os.path.join(self.shardsDirectory, SHARD_PREFIX + shardHash[:16]), self.compression)
+        with JsonOutput(shardPath, self.compression) as jsonOut:
+            jsonOut.write(shardJson)
+        self.bytesWritten += jsonOut.bytesWritten
+        self.shards.append({'file': os.path.basename(shardPath),
+                            'packs': self.pendingPacks,
+                            'idRange': [min(self.pendingIds), max(self.pendingIds)] if self.pendingIds else None,
+                            'songs': len(self.pendingIds),
+                            'bytes': jsonOut.bytesWritten,
+                            'rawBytes': jsonOut.rawBytes,
+                            'sha256': shardHash})
+        shardsLogger.debug("flush: Wrote shard '%s' with %s packs", shardPath, len(self.pendingPacks))
+        self.pendingEntries = []
+        self.pendingBytes = 0
+        self.pendingPacks = []
+        self.pendingIds = []
+
+    def finish(self):
+        """
+        Writes the last shard and the manifest, removes stale shards and
+        returns the manifest.
+        """
+        self.flush()
+        manifest = {'version': SHARD_MANIFEST_VERSION,
+                    'compression': self.compression,
+                    'songs': sum(shard['songs'] for shard in self.shards),
+                    'bytes': self.bytesWritten,
+                    'shards': self.shards}
+        writeJson(os.path.join(self.shardsDirectory, SHARD_MANIFEST_NAME), manifest)
+
+        # Shards of earlier runs are removed only after the new manifest is in place.
+        shardFiles = {shard['file'] for shard in self.shards}
+        for fileName in os.listdir(self.shardsDirectory):
+            if fileName.startswith(SHARD_PREFIX) and isJsonFile(fileName) and fileName not in shardFiles:
+                try:
+                    os.remove(os.path.join(self.shardsDirectory, fileName))
+                except:
+                    shardsLogger.warning("finish: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        return manifest
@@ -1,26 +1,20 @@
 #!/usr/bin/python3
 
 from containers.stepfile import *
+from containers.logconfig import getLoggingConfig, initWorkerLogging
+from containers.prefetch import Prefetcher, DEFAULT_PREFETCH_BYTES
+from containers.metrics import StageClock
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 ###########
 # LOGGERS #
 ###########
 
-# Date formatting will be the same for all loggers
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
 import logging
-dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
-
-# Make songpackLogger logger object.
 songpackLogger = logging.getLogger("SONGPACK")
-songpackLogger.setLevel(logging.DEBUG)
-songpackFileH = logging.FileHandler('/tmp/songpackContainer.log')
-songpackFileH.setLevel(logging.DEBUG)
-songpackConsoleH = logging.StreamHandler()
-songpackConsoleH.setLevel(logging.WARNING)
-songpackFileH.setFormatter(dateformatter)
-songpackConsoleH.setFormatter(dateformatter)
-songpackLogger.addHandler(songpackFileH)  # File Handler add
-songpackLogger.addHandler(songpackConsoleH)  # Console Handler add
+songpackLogger.addHandler(logging.NullHandler())
 
 #####################
 # CLASS DEFINITIONS #
@@ -39,11 +33,15 @@ class SongPack():
     - packSongFolders: List of files/folders in the batch folder directory.
     - packSongTitles: List of the song titles for this pack.
     - stepfileList: List of Stepfile objects for each song folder in the pack.
-    - songs: List of dictionaries with information for all songs in the pack.
+    - songs: List of SongRecords for all songs in the pack. getSongs gives them as dictionaries.
+    - encodings: Encodings the Stepfiles decode their tag values with (see decodeValue).
+    - timingAnalytics: Whether the Stepfiles work out the timing analytics of their charts.
     """
 
-    def __init__(self, fullPackPath):
+    def __init__(self, fullPackPath, encodings=DEFAULT_ENCODINGS, timingAnalytics=False):
         self.packPath = fullPackPath
+        self.encodings = tuple(encodings)
+        self.timingAnalytics = timingAnalytics
         self.packName = os.path.basename(os.path.normpath(self.packPath))
         self.packSongFolders = []
         self.packSongTitles = []
@@ -70,79 +68,250 @@ class SongPack():
         return self.packName
 
     def getSongs(self):
-        return self.songs
+        return [song.toDict() for song in self.songs]
 
     # Setters
     def retrieveSongFolders(self):
+        """
+        Lists the song folders in the pack directory. Only directories are kept, using the
+        file type that os.scandir already read with the listing.
+        """
         songpackLogger.info("retrieveSongFolders: Retrieving song folder listing in '%s'", self.packPath)
         try:
-            self.packSongFolders = os.listdir(self.packPath)
-            songpackLogger.info("retrieveSongFolders: Pack Folders are '%s'", self.packSongFolders)
+            with os.scandir(self.packPath) as packEntries:
+                self.packSongFolders = [entry.name for entry in packEntries if entry.is_dir()]
+            songpackLogger.debug("retrieveSongFolders: Pack Folders are '%s'", self.packSongFolders)
         except:
-            songpackLogger.warning("retrieveSongFolders: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                          str(sys.exc_info()[1])))
+            songpackLogger.warning("retrieveSongFolders: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
 
     def constructStepfiles(self):
         """
         For every song folder in the pack directory, instantiate Stepfile Objects.
+        Full paths are used throughout, so the working directory is never changed.
         """
 
         songpackLogger.info("constructStepfiles: Attempting to construct simfile objects in '%s'", self.packPath)
 
-        try:
-            for songFolder in self.packSongFolders:
-                os.chdir(self.packPath)
-                if os.path.isdir(songFolder):
-                    try:
-
-                        # Get a listing of the folders
-                        folderFiles = os.listdir(songFolder)
-                        songpackLogger.debug("constructStepfiles: Folder Files are '%s'", str(folderFiles))
-
-                        # Search for the SM files in the folder
-                        for file in folderFiles:
-                            smSearch = re.search("(.*\.[sS][mM])$", file)
-                            if smSearch is not None:
-                                songpackLogger.debug("constructStepfiles: Found SM file in '%s'", songFolder)
-                                stepfileToAdd = Stepfile(self.packPath, songFolder, file)
-                                songpackLogger.debug("constructStepfiles: Created Stepfile Object for '%s'", songFolder)
-                                songpackLogger.debug(stepfileToAdd)
-                                self.stepfileList.append(stepfileToAdd) # Add .sm file
-                                break
-                    except:
-                        songpackLogger.warning("constructStepfiles: During Stepfile Creation, {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                                                               str(sys.exc_info()[1])))
-                else:
-                    continue # This means we didn't have a directory
-            songpackLogger.info("constructStepfiles: Created %s simfile objects", str(len(self.stepfileList)))
-        except:
-            songpackLogger.warning("constructStepfiles: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                         str(sys.exc_info()[1])))
-
-    def parseStepfiles(self):
+        for songFolder in self.packSongFolders:
+            try:
+                # Search for the SM file in the folder
+                smFile = findStepfileInFolder(os.path.join(self.packPath, songFolder))
+                if smFile is not None:
+                    songpackLogger.debug("constructStepfiles: Found SM file in '%s'", songFolder)
+                    stepfileToAdd = Stepfile(self.packPath, songFolder, smFile)
+                    stepfileToAdd.encodings = self.encodings
+                    stepfileToAdd.timingAnalytics = self.timingAnalytics
+                    self.stepfileList.append(stepfileToAdd) # Add .sm file
+            except:
+                songpackLogger.warning("constructStepfiles: During Stepfile Creation, %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        songpackLogger.info("constructStepfiles: Created %s simfile objects", len(self.stepfileList))
+
+    def parseStepfiles(self, jobs=1, cache=None, readAhead=0, readAheadBytes=DEFAULT_PREFETCH_BYTES):
         """
         For every Stepfile Object, parse its SM file for song and chart information. This is
         also where all the song titles are retrieved.
 
         folder is the name of the folder by itself. It will be turned into the full file path
         However since not every file in the batch could be a folder, keep file cases in mind
+
+        When jobs is more than 1, the songs are parsed in a pool of that many processes.
+        When a ParseCache is given, unchanged songs are taken from it instead of being parsed.
+        When readAhead is more than 0, up to that many SM files (and at most readAheadBytes
+        of them) are read ahead on background threads while the current one parses, see
+        containers.prefetch. The time spent waiting on a file counts as its 'read' time.
+        Worker processes read their own files, so this only applies when jobs is 1.
         """
+        if jobs > 1:
+            parseSongPacksParallel([self], jobs, cache)
+            return
+
         if self.stepfileList is not []:
             songpackLogger.info("parseStepfiles: Parsing batch simfiles")
-            for stepfile in self.stepfileList:
+
+            # Unchanged songs come straight from the cache, so only the others are read.
+            songDicts = [None] * len(self.stepfileList)
+            if cache is not None:
+                songDicts = [cache.getSongDict(stepfile.stepfilePath) for stepfile in self.stepfileList]
+            prefetched = None
+            if readAhead > 0:
+                prefetched = iter(Prefetcher([stepfile.stepfilePath for stepfile, songDict in zip(self.stepfileList, songDicts)
+                                              if songDict is None], readAhead, readAheadBytes))
+
+            for stepfile, songDict in zip(self.stepfileList, songDicts):
+                if songDict is not None:
+                    stepfile.setSongDict(songDict)
+                    self.addParsedStepfile(stepfile)
+                    continue
 
                 # See if we can properly parse through the SM file.
                 songFolder = stepfile.getSongFolderName()
                 songpackLogger.debug("parseStepfiles: parseStepfile: Attempting to parse stepfile for Song Folder '%s'", songFolder)
-                try:
-                    stepfile.parseStepfile()
-                except:
-                    songpackLogger.warning("parseStepfiles: parseStepfile: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                                            str(sys.exc_info()[1])))
-                stepfile.createSongDict()
-                songTitle = stepfile.getSongTitle()
-                self.packSongTitles.append(songTitle)
-                self.songs.append(stepfile.getSongDict())
+                if prefetched is None:
+                    stepfile, error = parseStepfileJob(stepfile)
+                else:
+                    clock = StageClock()
+                    clock.switch('read')
+                    stepfilePath, smBytes, error = next(prefetched)
+                    clock.switch()
+                    if error is None:
+                        stepfile, error = parseStepfileJob(stepfile, smBytes)
+                        stepfile.timings['read'] = clock.timings['read']
+                self.addParsedStepfile(stepfile, error)
+                if cache is not None and error is None:
+                    cache.putSongDict(stepfile.stepfilePath, stepfile.getSongDict())
+
+    def scanStepfiles(self, readCharts=False):
+        """
+        Like parseStepfiles, but only scans the header of every SM file (see
+        Stepfile.scanStepfile). With readCharts, the charts are listed with their
+        header fields but without note counts. Nothing is cached.
+        """
+        songpackLogger.info("scanStepfiles: Scanning batch simfiles")
+        for stepfile in self.stepfileList:
+            stepfile.scanStepfile(readCharts)
+            self.addParsedStepfile(stepfile)
+
+    def indexAssets(self, assetIndex):
+        """
+        Looks up the files the parsed songs refer to with a containers.assets.AssetIndex
+        and adds what it finds to the songs. Songs from the parse cache are indexed too,
+        since their files can change without the SM file changing.
+        """
+        songpackLogger.info("indexAssets: Indexing assets of %s simfiles", len(self.stepfileList))
+        assetIndex.indexStepfiles(self.stepfileList)
+
+    def addParsedStepfile(self, stepfile, error=None):
+        """
+        Adds the song dictionary and song title of a parsed Stepfile Object to the pack.
+        error is the exception text from parseStepfileJob, if parsing failed.
+        """
+        if error is not None:
+            songpackLogger.warning("parseStepfiles: parseStepfile: %s", error)
+        stepfile.createSongDict()
+        songTitle = stepfile.getSongTitle()
+        self.packSongTitles.append(songTitle)
+        self.songs.append(stepfile.getSong())
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def findStepfileInFolder(songFolderPath):
+    """
+    Returns the name of the first .sm file in songFolderPath, or None if there isn't one.
+    The extension is matched without a regex, and only entries that are files count.
+    """
+    with os.scandir(songFolderPath) as folderEntries:
+        for entry in folderEntries:
+            if entry.name[-3:].lower() == ".sm" and entry.is_file():
+                return entry.name
+    return None
+
+def discoverSongPacks(songsDirectory, skipFolders=("jsons",), encodings=DEFAULT_ENCODINGS, timingAnalytics=False):
+    """
+    Walks a Songs directory in one pass with os.scandir and returns a list of
+    SongPack Objects, one per pack folder, with their Stepfile Objects constructed.
+    Folders named in skipFolders (like the output 'jsons' directory) are left out.
+    encodings and timingAnalytics are handed to every SongPack.
+    """
+    packs = []
+    songpackLogger.info("discoverSongPacks: Discovering song packs in '%s'", songsDirectory)
+    with os.scandir(songsDirectory) as songsEntries:
+        for entry in songsEntries:
+            if entry.name in skipFolders or not entry.is_dir():
+                continue
+            pack = SongPack(entry.path, encodings, timingAnalytics)
+            pack.retrieveSongFolders()
+            pack.constructStepfiles()
+            packs.append(pack)
+    return packs
+
+def discoverStepfiles(songsDirectory, skipFolders=("jsons",)):
+    """
+    Returns a flat list of the Stepfile Objects of every pack in a Songs directory.
+    See discoverSongPacks.
+    """
+    return [stepfile for pack in discoverSongPacks(songsDirectory, skipFolders) for stepfile in pack.getStepfiles()]
+
+def parseStepfileJob(stepfile, smBytes=None):
+    """
+    Parses a single Stepfile Object, from smBytes if its SM file was already
+    read. This lives at module level so it can be sent to worker processes.
+
+    Returns a tuple of the parsed Stepfile Object and the exception text if
+    parsing failed (None otherwise).
+    """
+    error = None
+    try:
+        stepfile.parseStepfile(smBytes)
+    except:
+        error = "{0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1]))
+    return stepfile, error
+
+def parseSongPacksParallel(packs, jobs, cache=None):
+    """
+    Parses the Stepfile Objects of every SongPack in packs in a pool of jobs
+    processes, one song per task across all packs. When a ParseCache is given,
+    only the songs that aren't in it are sent to the pool.
+
+    Songs are submitted largest .sm file first so that the slowest files don't
+    end up alone at the tail of the run. Results are merged back into each pack
+    in the same order as its stepfileList, so the output doesn't depend on which
+    worker finished first.
+
+    Returns the list of packs whose songs were all merged back successfully.
+    """
+
+    # Order every song of every pack by the size of its .sm file.
+    tasks = []
+    results = {}
+    for packIndex, pack in enumerate(packs):
+        for stepfileIndex, stepfile in enumerate(pack.getStepfiles()):
+            if cache is not None:
+                songDict = cache.getSongDict(stepfile.stepfilePath)
+                if songDict is not None:
+                    stepfile.setSongDict(songDict)
+                    results[(packIndex, stepfileIndex)] = (stepfile, None, True)
+                    continue
+            try:
+                fileSize = os.path.getsize(stepfile.stepfilePath)
+            except OSError:
+                fileSize = 0
+            tasks.append((fileSize, packIndex, stepfileIndex))
+    tasks.sort(key=lambda task: task[0], reverse=True)
+    songpackLogger.info("parseSongPacksParallel: Parsing %s simfiles from %s packs with %s jobs", len(tasks), len(packs), jobs)
+
+    # Fan the songs out to the worker processes.
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initWorkerLogging, initargs=(getLoggingConfig(),)) as executor:
+        futures = {}
+        for fileSize, packIndex, stepfileIndex in tasks:
+            stepfile = packs[packIndex].getStepfiles()[stepfileIndex]
+            futures[executor.submit(parseStepfileJob, stepfile)] = (packIndex, stepfileIndex)
+        for future in as_completed(futures):
+            packIndex, stepfileIndex = futures[future]
+            try:
+                stepfile, error = future.result()
+            except:
+                stepfile = packs[packIndex].getStepfiles()[stepfileIndex]
+                error = "{0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1]))
+            results[(packIndex, stepfileIndex)] = (stepfile, error, False)
+
+    # Merge the parsed songs back into their packs in a deterministic order.
+    parsedPacks = []
+    for packIndex, pack in enumerate(packs):
+        try:
+            stepfileList = pack.getStepfiles()
+            for stepfileIndex in range(len(stepfileList)):
+                stepfile, error, cached = results[(packIndex, stepfileIndex)]
+                stepfileList[stepfileIndex] = stepfile
+                pack.addParsedStepfile(stepfile, error)
+                if cache is not None and not cached and error is None:
+                    cache.putSongDict(stepfile.stepfilePath, stepfile.getSongDict())
+            parsedPacks.append(pack)
+        except:
+            songpackLogger.warning("parseSongPacksParallel: '%s': %s: %s", pack.getPackName(),
+                                   sys.exc_info()[0].__name__, sys.exc_info()[1])
+    return parsedPacks
 
 
 
@@ -3,27 +3,40 @@
 import os
 import re
 import sys
+import mmap
 import logging
 import codecs
 
+from containers.timing import createTimingData, getMeasureNoteRows, analyzeChart
+from containers.metrics import StageClock
+
 ###########
 # LOGGERS #
 ###########
 
-# Date formatting will be the same for all loggers
-dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
-
-# Make stepfileLogger logger object.
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
 stepfileLogger = logging.getLogger("STEPFILE")
-stepfileLogger.setLevel(logging.DEBUG)
-stepfileFileH = logging.FileHandler('/tmp/stepfile.log')
-stepfileFileH.setLevel(logging.DEBUG)
-stepfileConsoleH = logging.StreamHandler()
-stepfileConsoleH.setLevel(logging.WARNING)
-stepfileFileH.setFormatter(dateformatter)
-stepfileConsoleH.setFormatter(dateformatter)
-stepfileLogger.addHandler(stepfileFileH)  # File Handler add
-stepfileLogger.addHandler(stepfileConsoleH)  # Console Handler add
+stepfileLogger.addHandler(logging.NullHandler())
+
+# Tables for countNoteRows: '1', '2' and '4' start a judgment, newlines separate rows.
+# ',' is kept too, so the timing analytics can tell measures apart from the same bytes.
+NOTE_ROW_TABLE = bytes.maketrans(b'124', b'111')
+NOTE_ROW_DELETE = bytes(byte for byte in range(256) if byte not in b'124,\n')
+
+# Tags the timing analytics are built from.
+TIMING_TAGS = ('BPMS', 'STOPS', 'OFFSET')
+
+# Start of a #NOTES record for the header-only scan, e.g. '#NOTES:' or '#notes :'.
+NOTES_TAG = re.compile(rb'#[ \t]*NOTES[ \t]*:', re.IGNORECASE)
+
+# Encodings tag values are decoded with, tried in order. Shift-JIS (as cp932) comes
+# before cp1252 since cp1252 decodes nearly anything, Japanese text included.
+DEFAULT_ENCODINGS = ('utf-8', 'cp932', 'cp1252')
+
+# Comment, record start, tag end, record end and line separator for tokenizeStepfile.
+TEXT_MARKS = ('//', '#', ':', ';', '\n')
+BYTES_MARKS = (b'//', b'#', b':', b';', b'\n')
 
 ########################
 # FUNCTION DEFINITIONS #
@@ -50,8 +63,7 @@ def getSongTitleFromFolder(folder):
         if curlybraceArtist is not None:
             song = curlybraceArtist.group(1).strip()  # Song Title with brackets stepartist
     except:
-        stepfileLogger.warning("getSongTitleFromFolder: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                         str(sys.exc_info()[1])))
+        stepfileLogger.warning("getSongTitleFromFolder: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
 
     return song
 
@@ -76,8 +88,7 @@ def getStepArtistFromFolder(folder):
         if curlybraceArtist is not None:
             stepArtist = curlybraceArtist.group(1)  # Stepartist with brackets
     except:
-        stepfileLogger.warning("getStepArtistFromFolder: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                          str(sys.exc_info()[1])))
+        stepfileLogger.warning("getStepArtistFromFolder: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
 
     return stepArtist
 
@@ -91,11 +102,12 @@ def parseBpmString(bpmString):
     """
     
     # Get all BPM Change values
-    stepfileLogger.debug("parseBpmString: Attempting to find min and max BPM")
     try:
         allBpmChangesList = bpmString.split(',')
         bpmValues = []
         for bpmChange in allBpmChangesList:
+            if bpmChange.strip() == "":
+                continue
             bpm = bpmChange.split('=')[1]
             bpmValues.append(float(bpm))
 
@@ -107,67 +119,145 @@ def parseBpmString(bpmString):
         else:
             return [lowestBpm,highestBpm]
     except:
-        stepfileLogger.warning("parseBpmString: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                 str(sys.exc_info()[1])))
+        stepfileLogger.warning("parseBpmString: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
 
-def getSongInfoFromLines(fileLines):
+def decodeValue(value, encodings=DEFAULT_ENCODINGS):
+    """
+    Decodes a tag value (bytes) with the first of encodings that can decode it.
+    If none can, the last one is used with replacement characters.
+    Returns a tuple of the text and the encoding used ('ascii' for plain ASCII).
     """
-    This function takes an array of strings (file lines) from an .sm file
-    and returns a dictionary representing information about the song not
-    related to the step charts.
+    if value.isascii():
+        return value.decode("ascii"), 'ascii'
+    for encoding in encodings:
+        try:
+            return value.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    stepfileLogger.warning("decodeValue: None of %s can decode %r, replacing what doesn't fit.", encodings, value[:40])
+    return value.decode(encodings[-1], "replace"), encodings[-1]
 
-    The dictionary returned contains the following keys:
+def detectEncoding(headerBytes, encodings=DEFAULT_ENCODINGS):
+    """
+    Finds the encoding of a file from its header (the bytes before the first
+    #NOTES tag): the first of encodings that decodes all of it, or 'ascii'.
+    Returns a tuple of that encoding and the encodings to decode the file's
+    tag values with, the detected one first and the others as fallbacks.
+    """
+    encoding = decodeValue(headerBytes, encodings)[1]
+    if encoding == 'ascii':
+        return encoding, tuple(encodings)
+    return encoding, (encoding,) + tuple(other for other in encodings if other != encoding)
+
+def tokenizeStepfile(fileLines):
+    """
+    Generator that takes an iterable of lines from an .sm file (a list or an
+    open file object) and yields a (tag, value) tuple for every #TAG:value;
+    record in the file. The file is only walked once.
+
+    Lines can be strings or bytes. With bytes, values are bytes as well and
+    nothing is decoded but the tags, so note data never has to be.
+
+    - tag is upper-cased and has no leading '#', e.g. 'TITLE' or 'NOTES'.
+    - value is everything between the first ':' and the closing ';'. Values
+      that span several lines have every line stripped and are joined by '\\n'.
+    - Comments ('//' until the end of the line) are dropped.
+    - Several records on the same line, like '#TITLE:a;#SUBTITLE:b;', are all yielded.
+    - A record missing its ';' is ended by the next line starting with '#'.
+    """
+
+    tag = None
+    valueParts = []
+    marks = None
+    for line in fileLines:
+        if marks is None:
+            marks = BYTES_MARKS if isinstance(line, bytes) else TEXT_MARKS
+            comment, recordStart, tagEnd, recordEnd, newline = marks
+        commentIndex = line.find(comment)
+        if commentIndex != -1:
+            line = line[:commentIndex]
+        line = line.strip()
+
+        lineStart = True
+        while line:
+            # A new record at the start of a line closes a record missing its ';'.
+            if lineStart and tag is not None and line.startswith(recordStart):
+                yield tag, newline.join(valueParts)
+                tag = None
+            lineStart = False
+
+            # Outside of a record, only '#TAG:' starts a new one. Anything else is ignored.
+            if tag is None:
+                colonIndex = line.find(tagEnd)
+                if not line.startswith(recordStart) or colonIndex == -1:
+                    break
+                tag = line[1:colonIndex].strip().upper()
+                if marks is BYTES_MARKS:
+                    tag = tag.decode("latin-1")
+                valueParts = []
+                line = line[colonIndex+1:]
+
+            # The record either ends on this line or continues on the next one.
+            endIndex = line.find(recordEnd)
+            if endIndex == -1:
+                valueParts.append(line)
+                break
+            valueParts.append(line[:endIndex])
+            yield tag, newline.join(valueParts)
+            tag = None
+            line = line[endIndex+1:].lstrip()
+
+    # Last record in the file had no ';'.
+    if tag is not None:
+        yield tag, newline.join(valueParts)
+
+def getSongInfoFromTag(song, tag, value):
+    """
+    This function takes a SongRecord and a (tag, value) pair from tokenizeStepfile.
+    If the tag is one of the song information tags, the record is updated with it.
+    Tags not related to the song information are ignored.
+
+    The record is filled with the following fields:
     - title
     - subtitle
     - artist
     - bpm
+    - banner
+    - bannerFile (the #BANNER value as written, None if empty)
+    - music (may be missing, like bannerFile)
     """
-    
-    songInfo = {}
-    stepfileLogger.debug("getSongInfoFromLines: Attempting to retrieve song information.")
-    try:
-        for line in fileLines:
-            if line.startswith('#'):
-                title = re.search("^#TITLE:(.*);$", line)
-                subtitle = re.search("^#SUBTITLE:(.*);$", line)
-                artist = re.search("^#ARTIST:(.*);$", line)
-                bpm = re.search("^#BPMS:(.*);$", line)
-                banner = re.search("^#BANNER:(.*);$", line)
-
-                if title is not None:
-                    songInfo['title'] = title.group(1)
-                if subtitle is not None:
-                    songInfo['subtitle'] = subtitle.group(1)
-                if artist is not None:
-                    songInfo['artist'] = artist.group(1)
-                if bpm is not None:
-                    songInfo['bpm'] = parseBpmString(bpm.group(1))
-                if banner is not None:
-                    bannerField = banner.group(1)
-                    if bannerField == "":
-                        songInfo['banner'] = "none.png"
-                    else:
-                        songInfo['banner'] = bannerField.strip().strip('\./\\')
-
-    except:
-        stepfileLogger.warning("getSongInfoFromLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                       str(sys.exc_info()[1])))
-        songInfo['title'] = "untitled"
-        songInfo['subtitle'] = ""
-        songInfo['artist'] = "Unknown Artist"
-        songInfo['bpm'] = [0]
-        songInfo['banner'] = "none.png"
 
-    # Return the dictionary of song information
-    return songInfo
+    if tag == 'TITLE':
+        song.title = value
+    elif tag == 'SUBTITLE':
+        song.subtitle = value
+    elif tag == 'ARTIST':
+        song.artist = value
+    elif tag == 'BPMS':
+        song.bpm = parseBpmString(value)
+    elif tag == 'BANNER':
+        if value == "":
+            song.banner = "none.png"
+        else:
+            song.banner = value.strip().strip('\./\\')
+        song.bannerFile = value.strip() or None
+    elif tag == 'MUSIC':
+        song.music = value.strip() or None
 
-def getChartInfoFromLines(fileLines):
+def getChartInfoFromNotes(notesValue, timing=None, encodings=DEFAULT_ENCODINGS):
     """
-    This function takes an array of strings (file lines) from an .sm file
-    and returns an array of dictionaries, where each dictionary represents
-    a different charted difficulty for the file.
+    This function takes the value of a #NOTES tag from tokenizeStepfile and
+    returns a tuple of the difficulty key (see determineDifficultyKey) and a
+    ChartRecord representing the charted difficulty. timing is the song's
+    TimingData (see containers.timing), needed for the timing analytics.
+
+    notesValue can be bytes, in which case only the first five fields are
+    decoded (see decodeValue) and the note data is counted as bytes.
 
-    The dictionaries contain the following keys:
+    The value of a #NOTES tag has six ':' separated fields:
+    game type, stepper credit, difficulty name, rating, radar values and the note data.
+
+    The record contains the following fields:
     - stepper
     - difficulty
     - game
@@ -176,56 +266,52 @@ def getChartInfoFromLines(fileLines):
     - note
     - roll
     - hold
+    - length, peakNps, streamMeasures, breakMeasures, breakdown (None without timing)
     """
 
-    # Arrays for keeping track of where #NOTES data is.
-    linesOfNotes = []
-    chartsStartEnd = []
-
-    # Find the #NOTES lines in the .sm file.
-    stepfileLogger.debug("getChartInfoFromLines: Finding #NOTES locations in lines of .sm file.")
-    try:
-        counter = 0
-        for line in fileLines:
-            counter += 1
-            if line.startswith('#'):
-                notes = re.search("^(#NOTES:)", line)
-                if notes is not None:
-                    # print("NOTES: '" + notes.group(1) + "' on line " + str(counter))
-                    linesOfNotes.append(counter)
-        totalFileLength = counter
-    except:
-        stepfileLogger.warning("getChartInfoFromLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                        str(sys.exc_info()[1])))
+    # Initialize record and the six fields of the chart.
+    chartData = ChartRecord()
+    if isinstance(notesValue, bytes):
+        chartFields = notesValue.split(b':', 5)
+        chartFields[:5] = [decodeValue(field, encodings)[0] for field in chartFields[:5]]
+    else:
+        chartFields = notesValue.split(':', 5)
 
-    # Relate where the #NOTES lines occur so we know where the chart data starts and ends.
-    stepfileLogger.debug("getChartInfoFromLines: Relating chart data on which lines it starts and ends.")
     try:
-        counter = 0
-        for i in range(len(linesOfNotes)):
-            if (i+1) == len(linesOfNotes):
-                start = linesOfNotes[i] + 5
-                end = totalFileLength - 1
-                chartsStartEnd.append([start,end])
-                break
-            else:
-                start = linesOfNotes[i] + 5
-                end = linesOfNotes[i+1] - 2
-                chartsStartEnd.append([start,end])
+        # Get the non-step data for the chart
+        gameType = chartFields[0].strip()
+        stepperCredit = chartFields[1].strip()
+        difficultyName = chartFields[2].strip()
+        difficultyRating = chartFields[3].strip()
+
+        # Add the above non-step data to the record
+        chartData.difficulty = difficultyName
+        chartData.rating = int(difficultyRating)
+        chartData.game = gameType
+        if stepperCredit != "":
+            chartData.stepper = stepperCredit
+        else:
+            chartData.stepper = "unspecified"
     except:
-        stepfileLogger.warning("getChartInfoFromLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                        str(sys.exc_info()[1])))
+        stepfileLogger.warning("getChartInfoFromNotes: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        chartData.difficulty = 'Easy'
+        chartData.rating = 0
+        chartData.game = 'dance-single'
+        chartData.stepper = 'unspecified'
+        stepfileLogger.warning("getChartInfoFromNotes: Something went wrong getting non-step data for the chart.")
 
     # Count the step data by making a call to countStepData.
-    stepfileLogger.debug("getChartInfoFromLines: Attempting to retrieve stepchart data.")
     try:
-        chartArray = countStepData(fileLines, chartsStartEnd)
+        stepData = countStepData(chartFields[5], timing)
+        chartData.setStepData(stepData)
     except:
-        stepfileLogger.warning("getChartInfoFromLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                        str(sys.exc_info()[1])))
-        chartArray = []
-        stepfileLogger.warning("getChartInfoFromLines: Stepchart data is an empty list.")
-    return chartArray
+        stepfileLogger.warning("getChartInfoFromNotes: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        difficultyName = "Easy"
+        gameType = "dance-single"
+        stepfileLogger.warning("getChartInfoFromNotes: Something went wrong counting the step data.")
+
+    keyToAdd = determineDifficultyKey(difficultyName,gameType)
+    return keyToAdd, chartData
 
 def determineDifficultyKey(difficultyName,gameType):
     """
@@ -289,114 +375,301 @@ def determineDifficultyKey(difficultyName,gameType):
         else:
             return "otherChallenge"
 
-def countStepData(fileLines, chartsStartEnd):
+def countNoteRows(noteBytes):
     """
-    Takes an array of strings (file lines) and an array specifying
-    where #NOTES starts and ends. For instance, chartsStartEnd could look like
-    [[25,300],[302,500]]
+    Counts the rows of note data (bytes) that have at least one note, hold or roll
+    head in them. Jumps and hands only count as single judgments.
 
-    This function returns an array of dictionaries representing the different
-    charted difficulties for the song.
+    Every '1', '2' and '4' is turned into '1' and every other byte but the newline
+    and ',' is deleted, so each counted row leaves exactly one '\n1' behind.
     """
+    noteRows = noteBytes.translate(NOTE_ROW_TABLE, NOTE_ROW_DELETE)
+    return noteRows.count(b'\n1') + noteRows.startswith(b'1')
 
-    # Dictionary where every key is a separate charted difficulty.
-    stepfileData = {}
+def countStepData(noteData, timing=None):
+    """
+    Takes the note data of a chart, which is the last field of a #NOTES tag
+    with one row of the chart per line and measures separated by ',' lines.
+    noteData can be a string or bytes.
 
-    # Get the step data for each chart.
-    for chart in chartsStartEnd:
+    This function returns a dictionary with the 'note', 'hold', 'roll' and
+    'mine' counts of the chart. Everything is counted over the whole block
+    of bytes at once instead of line by line.
 
-        # Initialize dictionary and range of lines for stepchart data
-        chartData = {'note':0, 'hold':0, 'roll':0, 'mine':0}
-        start = chart[0]
-        end = chart[1]
+    If the song's TimingData is given, the dictionary also has the timing
+    analytics of containers.timing.analyzeChart, worked out from the same
+    reduced note rows the note count comes from.
+    """
 
-        stepfileLogger.debug("countStepData: Attempting to retrieve non-step data from the chart.")
-        try:
-            # Get the non-step data for the chart
-            gameType = fileLines[start - 5].strip().strip(":")
-            stepperCredit = fileLines[start - 4].strip().strip(":")
-            difficultyName = fileLines[start - 3].strip().strip(":")
-            difficultyRating = fileLines[start - 2].strip().strip(":")
-
-            # Add the above non-step data to the dictionary
-            chartData['difficulty'] = difficultyName
-            chartData['rating'] = int(difficultyRating)
-            chartData['game'] = gameType
-            if stepperCredit != "":
-                chartData["stepper"] = stepperCredit
-            else:
-                chartData["stepper"] = "unspecified"
-        except:
-            stepfileLogger.warning("countStepData: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                    str(sys.exc_info()[1])))
-            chartData['difficulty'] = 'Easy'
-            chartData['rating'] = 0
-            chartData['game'] = 'dance-single'
-            chartData['stepper'] = 'unspecified'
-            stepfileLogger.warning("countStepData: Something went wrong getting non-step data for the chart.")
-
-        # Go through the range of lines specifying chart notes
-        stepfileLogger.debug("countStepData: Counting step data.")
-        try:
-            for i in range(start,end):
-                line = fileLines[i]
-                if line.startswith('//'):
-                    continue
-                elif line.startswith(' '):
-                    continue
-                elif line.startswith(','):
-                    continue
-                elif line.startswith(';'):
-                    continue
-                else:
-                    # This means we have a valid line for counting step data
-                    notesInLine = line.count('1')
-                    holdsInLine = line.count('2')
-                    endHoldOrRoll = line.count('3')
-                    rollsInLine = line.count('4')
-                    minesInLine = line.count('M')
-
-                    # Jumps and hands should only count as single judgments.
-                    notes = notesInLine + holdsInLine + rollsInLine
-                    if notes > 0:
-                        notes = 1
-                    
-                    chartData['note'] += notes
-                    chartData['hold'] += holdsInLine
-                    chartData['roll'] += rollsInLine
-                    chartData['mine'] += minesInLine
-        except:
-            stepfileLogger.warning("countStepData: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                    str(sys.exc_info()[1])))
-            chartData['note'] = 0
-            chartData['hold'] = 0
-            chartData['roll'] = 0
-            chartData['mine'] = 0
-            difficultyName = "Easy"
-            gameType = "dance-single"
-            stepfileLogger.warning("countStepData: Something went wrong counting the step data.")
-
-        keyToAdd = determineDifficultyKey(difficultyName,gameType)
-        stepfileData[keyToAdd] = chartData
-
-    # Return the array of dictionaries representing charts for the song
-    return stepfileData
+    if isinstance(noteData, str):
+        noteData = noteData.encode("ascii", "ignore")
+
+    # Lines starting with ',', ';', ' ' or '//' aren't rows. Separators normally hold
+    # nothing else and tokenizeStepfile strips the rest, but if such a line has
+    # more in it, drop those lines (keeping a bare ',' for separators) so they aren't counted.
+    separators = noteData.count(b',') + noteData.count(b';')
+    if separators != noteData.count(b',\n') + noteData.count(b';\n') + noteData.endswith((b',', b';')) \
+            or b'\n ' in noteData or b'\n//' in noteData or noteData.startswith((b' ', b'//')):
+        noteData = b'\n'.join(b',' if line.startswith(b',') else line for line in noteData.split(b'\n')
+                               if not line.startswith((b';', b' ', b'//')))
+
+    # Same as countNoteRows. Empty lines at either end aren't rows, so they're left out for the analytics.
+    noteRows = noteData.strip(b'\n').translate(NOTE_ROW_TABLE, NOTE_ROW_DELETE)
+    stepData = {'note':0, 'hold':0, 'roll':0, 'mine':0}
+    stepData['note'] = noteRows.count(b'\n1') + noteRows.startswith(b'1')
+    stepData['hold'] = noteData.count(b'2')
+    stepData['roll'] = noteData.count(b'4')
+    stepData['mine'] = noteData.count(b'M')
+
+    if timing is not None:
+        stepData.update(analyzeChart(timing, *getMeasureNoteRows(noteRows)))
+
+    # Return the dictionary of step counts for the chart
+    return stepData
+
+def findNotesTag(data, start=0):
+    """
+    Returns the match of the first #NOTES tag in data (bytes or mmap) at or after
+    start that isn't commented out, or None if there isn't one.
+    """
+    while True:
+        notesMatch = NOTES_TAG.search(data, start)
+        if notesMatch is None:
+            return None
+        lineStart = data.rfind(b'\n', 0, notesMatch.start()) + 1
+        if data.find(b'//', lineStart, notesMatch.start()) == -1:
+            return notesMatch
+        start = notesMatch.end()
+
+def findRecordEnd(data, start):
+    """
+    Returns the index of the ';' ending the record that continues at start,
+    skipping ';' inside comments. Like tokenizeStepfile, a record missing its
+    ';' ends where the next #NOTES tag starts, or at the end of data.
+    """
+    nextNotes = findNotesTag(data, start)
+    recordLimit = len(data) if nextNotes is None else nextNotes.start()
+    while True:
+        endIndex = data.find(b';', start, recordLimit)
+        if endIndex == -1:
+            return recordLimit
+        lineStart = data.rfind(b'\n', 0, endIndex) + 1
+        if data.find(b'//', max(lineStart, start), endIndex) == -1:
+            return endIndex
+        start = data.find(b'\n', endIndex)
+        if start == -1:
+            return recordLimit
+
+def scanChartHeader(data, start):
+    """
+    Reads the five ':' terminated header fields of a chart (game type, stepper
+    credit, difficulty name, rating and radar values) starting right after a
+    #NOTES: tag, without looking at the note data behind them.
+
+    Returns (headerBytes, bodyStart): the header fields as tokenizeStepfile would
+    give them for bytes, and the index where the note data starts. headerBytes
+    is None if the record ends before all five fields were found.
+    """
+    headerParts = []
+    colons = 0
+    position = start
+    while position < len(data):
+        lineEnd = data.find(b'\n', position)
+        if lineEnd == -1:
+            lineEnd = len(data)
+        line = data[position:lineEnd]
+        commentIndex = line.find(b'//')
+        if commentIndex != -1:
+            line = line[:commentIndex]
+        recordEnd = line.find(b';')
+        if recordEnd != -1:
+            line = line[:recordEnd]
+
+        colonIndex = line.find(b':')
+        while colonIndex != -1:
+            colons += 1
+            if colons == 5:
+                headerParts.append(line[:colonIndex].strip())
+                return b'\n'.join(part for part in headerParts if part), position + colonIndex + 1
+            colonIndex = line.find(b':', colonIndex + 1)
+        headerParts.append(line.strip())
+        if recordEnd != -1:
+            break
+        position = lineEnd + 1
+    return None, position
+
+def normalizeNoteBytes(noteBytes):
+    """
+    Strips comments and surrounding whitespace from every line of raw note data
+    read straight from the file, so it counts like tokenizeStepfile's value.
+    """
+    noteLines = []
+    for line in noteBytes.split(b'\n'):
+        commentIndex = line.find(b'//')
+        if commentIndex != -1:
+            line = line[:commentIndex]
+        line = line.strip()
+        if line:
+            noteLines.append(line)
+    return b'\n'.join(noteLines)
 
 #####################
 # CLASS DEFINITIONS #
 #####################
 
+class ChartRecord():
+    """
+    This class is a compact record for one charted difficulty of a song.
+    It uses __slots__ so a library's worth of charts doesn't carry a
+    dictionary per chart around.
+
+    toDict gives the dictionary written out in the JSONs, with its keys in
+    the same order as always. The timing analytics (length in seconds, peakNps,
+    streamMeasures, breakMeasures and breakdown, see containers.timing) come last.
+    They are None unless they were worked out, so a chart they weren't worked
+    out for can be told apart from a chart of 0 seconds without stream.
+    """
+
+    __slots__ = ('note', 'hold', 'roll', 'mine', 'difficulty', 'rating', 'game', 'stepper',
+                 'length', 'peakNps', 'streamMeasures', 'breakMeasures', 'breakdown')
+
+    def __init__(self):
+        self.note = 0
+        self.hold = 0
+        self.roll = 0
+        self.mine = 0
+        self.difficulty = 'Easy'
+        self.rating = 0
+        self.game = 'dance-single'
+        self.stepper = 'unspecified'
+        self.length = None
+        self.peakNps = None
+        self.streamMeasures = None
+        self.breakMeasures = None
+        self.breakdown = None
+
+    def __str__(self):
+        return str(self.toDict())
+
+    def setStepData(self, stepData):
+        """
+        Sets the counts (and timing analytics, if any) returned by countStepData.
+        """
+        for field, value in stepData.items():
+            setattr(self, field, value)
+
+    def toDict(self):
+        return {'note': self.note,
+                'hold': self.hold,
+                'roll': self.roll,
+                'mine': self.mine,
+                'difficulty': self.difficulty,
+                'rating': self.rating,
+                'game': self.game,
+                'stepper': self.stepper,
+                'length': self.length,
+                'peakNps': self.peakNps,
+                'streamMeasures': self.streamMeasures,
+                'breakMeasures': self.breakMeasures,
+                'breakdown': self.breakdown}
+
+    @classmethod
+    def fromDict(cls, chartDict):
+        chartData = cls()
+        for field in cls.__slots__:
+            setattr(chartData, field, chartDict[field])
+        return chartData
+
+class SongRecord():
+    """
+    This class is a compact record for a song: its information from the
+    .sm header, a dictionary of ChartRecords keyed by difficulty key, and
+    the pack and song folder it was found in.
+
+    The song information fields (INFO_FIELDS) are only set once they have
+    been parsed, so a missing field can be told apart from an empty one.
+
+    toDict gives the dictionary written out in the JSONs, with its keys in
+    the same order as always. encoding (see detectEncoding), bannerFile and
+    music (the #BANNER and #MUSIC values as written, None without them),
+    bannerInfo and musicInfo (see containers.assets, None unless the assets
+    were indexed) come last.
+    """
+
+    __slots__ = ('title', 'subtitle', 'artist', 'bpm', 'charts', 'pack', 'banner', 'folder', 'encoding', 'bannerFile',
+                 'music', 'bannerInfo', 'musicInfo')
+    INFO_FIELDS = ('title', 'subtitle', 'artist', 'bpm', 'banner')
+
+    def __init__(self, packName, songFolder):
+        self.charts = {}
+        self.pack = packName
+        self.folder = songFolder
+        self.encoding = None
+        self.bannerFile = None
+        self.music = None
+        self.bannerInfo = None
+        self.musicInfo = None
+
+    def __str__(self):
+        return str(self.toDict())
+
+    def getMissingFields(self):
+        return [field for field in self.INFO_FIELDS if not hasattr(self, field)]
+
+    def toDict(self):
+        return {'title': self.title,
+                'subtitle': self.subtitle,
+                'artist': self.artist,
+                'bpm': self.bpm,
+                'charts': {key: chartData.toDict() for key, chartData in self.charts.items()},
+                'pack': self.pack,
+                'banner': self.banner,
+                'folder': self.folder,
+                'encoding': self.encoding,
+                'bannerFile': self.bannerFile,
+                'music': self.music,
+                'bannerInfo': self.bannerInfo,
+                'musicInfo': self.musicInfo}
+
+    @classmethod
+    def fromDict(cls, songDict):
+        song = cls(songDict['pack'], songDict['folder'])
+        for field in cls.INFO_FIELDS:
+            setattr(song, field, songDict[field])
+        song.charts = {key: ChartRecord.fromDict(chartDict) for key, chartDict in songDict['charts'].items()}
+        song.encoding = songDict.get('encoding')
+        song.bannerFile = songDict.get('bannerFile')
+        song.music = songDict.get('music')
+        song.bannerInfo = songDict.get('bannerInfo')
+        song.musicInfo = songDict.get('musicInfo')
+        return song
+
 class Stepfile():
     """
     This class is a container providing information for a single song.
-    Information includes a dictionary and an array of dictionaries.
 
-    songInfo is the dictionary of song information not related to the stepcharts.
-    songCharts is the array of dictionaries representing different charts for the song.
-    songTitle is here in case something went wrong parsing the sm file.
-    stepArtist is here in case something went wrong parsing the sm file.
+    song is the SongRecord holding the song information and its charts.
+    Nothing of the .sm file itself is kept once it has been parsed.
+
+    chartOffsets is filled by scanStepfile(readCharts=True): difficulty key ->
+    (start, end) byte offsets of the chart's note data, for parseChartBodies.
+    timingTags holds the raw #BPMS, #STOPS and #OFFSET values it found for them.
+
+    encodings is the fallback chain tag values are decoded with (see decodeValue).
+
+    timingAnalytics turns on the timing analytics of containers.timing for the
+    charts. They're off by default since they add to the parse time; without
+    them (or for a song without usable BPMs) every chart's length, peakNps,
+    streamMeasures, breakMeasures and breakdown stay None.
+
+    timings has the seconds parseStepfile spent in every stage ('read', 'header',
+    'charts'), for containers.metrics. It stays empty for songs from the cache.
+    containers.assets adds 'assets' when the song's assets are indexed.
     """
 
+    __slots__ = ('packPath', 'packName', 'songFolder', 'songFolderPath', 'stepfile', 'stepfilePath', 'song',
+                 'chartOffsets', 'timingTags', 'timings', 'encodings', 'timingAnalytics')
+
     def __init__(self, pathToPackFolder, songFolderName, chartFile):
         self.packPath = pathToPackFolder
         self.packName = os.path.basename(os.path.normpath(self.packPath))
@@ -404,10 +677,12 @@ class Stepfile():
         self.songFolderPath = os.path.join(self.packPath, self.songFolder)
         self.stepfile = chartFile
         self.stepfilePath = os.path.join(self.songFolderPath, self.stepfile)
-        self.stepfileLines = []
-        self.songInfo = {}
-        self.songCharts = []
-        self.songDict = {}
+        self.song = SongRecord(self.packName, self.songFolder)
+        self.chartOffsets = {}
+        self.timingTags = {}
+        self.timings = {}
+        self.encodings = DEFAULT_ENCODINGS
+        self.timingAnalytics = False
 
     # String representation to print out for the object
     def __str__(self):
@@ -417,78 +692,154 @@ class Stepfile():
 - songFolderPath: {}
 - stepfile: {}
 - stepfilePath: {}
-- songInfo: {}
-- songCharts: {}
-- songDict: {}""" \
+- song: {}""" \
         .format(self.packPath, self.songFolder, self.songFolderPath, self.stepfile, self.stepfilePath,
-                self.songInfo, self.songCharts, self.songDict)
+                {field: getattr(self.song, field, None) for field in SongRecord.INFO_FIELDS})
 
     # Getters
+    def getSong(self):
+        return self.song
+
     def getSongInfo(self):
-        return self.songInfo
+        return {field: getattr(self.song, field) for field in SongRecord.INFO_FIELDS if hasattr(self.song, field)}
 
     def getSongCharts(self):
-        return self.songCharts
+        return {key: chartData.toDict() for key, chartData in self.song.charts.items()}
 
     def getSongFolderName(self):
         return self.songFolder
 
     def getSongTitle(self):
-        return self.songInfo['title']
+        return self.song.title
 
     def getSongDict(self):
-        return self.songDict
-
-    def readStepfileLines(self):
-
-        # Just read as utf-8-sig for now to ignore the BOM mark at the beginning of the files.
-        # If BOM was present at the first line, the #TITLE field would be skipped.
-        stepfileLogger.debug("readStepfileLines: Attempting to read SM File '" + self.stepfilePath + "'.")
-        with open(self.stepfilePath, encoding="utf-8-sig") as smFile:
-            for line in smFile:
-                try:
-                    # if line.startswith('#'):
-                    #    stepfileLogger.debug("readStepfileLines: '" + line.strip() + "'")
-                    self.stepfileLines.append(line.strip())
-                    
-                except:
-                    stepfileLogger.warning("readStepfileLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                                str(sys.exc_info()[1])))
-            smFile.close()
-
-        # Since some files might break the reading process,
-        
-
-    def parseStepfile(self):
-
-        stepfileLogger.debug("parseStepfile: Attempting to read SM file in folder '" + self.songFolder + "'.")
+        return self.song.toDict()
+
+    def parseStepfile(self, smBytes=None):
+        """
+        Reads the SM file in one go and feeds every record from tokenizeStepfile
+        into the SongRecord in a single pass. The time spent reading, on the
+        header and on the charts is kept in timings.
+
+        smBytes is the contents of the SM file if they were already read, e.g.
+        by a containers.prefetch.Prefetcher. The file isn't opened then.
+
+        With timingAnalytics, the song's TimingData is built when the first #NOTES
+        tag comes up, from the #BPMS, #STOPS and #OFFSET tags of the header before it.
+
+        The file is tokenized as bytes. Only the values of the tags other than
+        #NOTES and the header fields of the charts are decoded, with the
+        encoding detectEncoding finds for the file (recorded in the song) and
+        the rest of encodings as fallbacks. Note data is counted as bytes.
+        """
+        timingTags = {}
+        timing = None
+        clock = StageClock()
+        stepfileLogger.debug("parseStepfile: Attempting to parse SM File '%s'.", self.stepfilePath)
         try:
-            self.readStepfileLines()
+            if smBytes is None:
+                clock.switch('read')
+                with open(self.stepfilePath, 'rb') as smFile:
+                    smBytes = smFile.read()
+            clock.switch('header')
+
+            # Skip the BOM mark at the beginning of the file. If it were left in, the #TITLE field would be skipped.
+            if smBytes.startswith(codecs.BOM_UTF8):
+                smBytes = smBytes[len(codecs.BOM_UTF8):]
+            notesMatch = findNotesTag(smBytes)
+            self.song.encoding, encodings = detectEncoding(smBytes if notesMatch is None else smBytes[:notesMatch.start()],
+                                                           self.encodings)
+
+            for tag, value in tokenizeStepfile(smBytes.splitlines()):
+                if tag == 'NOTES':
+                    clock.switch('charts')
+                    if self.timingAnalytics and timing is None and 'BPMS' in timingTags:
+                        timing = createTimingData(timingTags)
+                        timingTags = {}
+                    keyToAdd, chartData = getChartInfoFromNotes(value, timing, encodings)
+                    self.song.charts[keyToAdd] = chartData
+                    clock.switch('header')
+                else:
+                    value = decodeValue(value, encodings)[0]
+                    if tag in TIMING_TAGS:
+                        timingTags[tag] = value
+                    getSongInfoFromTag(self.song, tag, value)
         except:
-            stepfileLogger.warning("parseStepfile: readStepfileLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                                       str(sys.exc_info()[1])))
-
-        stepfileLogger.debug("parseStepfile: Attempting to get song info for folder '" + self.songFolder + "'.")
+            stepfileLogger.warning("parseStepfile: tokenizeStepfile: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        clock.switch()
+        self.timings = clock.timings
+
+    def scanStepfile(self, readCharts=False):
+        """
+        Fast scan for jobs that only need the song information: the SM file is
+        mapped and only read up to its first #NOTES tag.
+
+        With readCharts, the five header fields of every chart are read as well
+        and the note data is skipped over by looking for the record's ';' only.
+        The charts' note, hold, roll and mine counts stay at 0 until
+        parseChartBodies is called; chartOffsets remembers where their note data is.
+        """
+        stepfileLogger.debug("scanStepfile: Scanning SM File '%s'.", self.stepfilePath)
         try:
-            self.songInfo = getSongInfoFromLines(self.stepfileLines)
+            with open(self.stepfilePath, 'rb') as smFile:
+                if os.fstat(smFile.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(smFile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    notesMatch = findNotesTag(data)
+                    headerEnd = len(data) if notesMatch is None else notesMatch.start()
+                    headerBytes = data[:headerEnd]
+                    if headerBytes.startswith(codecs.BOM_UTF8):
+                        headerBytes = headerBytes[len(codecs.BOM_UTF8):]
+                    self.song.encoding, encodings = detectEncoding(headerBytes, self.encodings)
+                    for tag, value in tokenizeStepfile(headerBytes.splitlines()):
+                        value = decodeValue(value, encodings)[0]
+                        if tag in TIMING_TAGS:
+                            self.timingTags[tag] = value
+                        getSongInfoFromTag(self.song, tag, value)
+
+                    while readCharts and notesMatch is not None:
+                        chartHeader, bodyStart = scanChartHeader(data, notesMatch.end())
+                        if chartHeader is None:
+                            keyToAdd, chartData = getChartInfoFromNotes(b"", encodings=encodings)
+                            bodyEnd = bodyStart
+                        else:
+                            keyToAdd, chartData = getChartInfoFromNotes(chartHeader + b":", encodings=encodings)
+                            bodyEnd = findRecordEnd(data, bodyStart)
+                        self.song.charts[keyToAdd] = chartData
+                        self.chartOffsets[keyToAdd] = (bodyStart, bodyEnd)
+                        notesMatch = findNotesTag(data, bodyEnd)
         except:
-            stepfileLogger.warning("parseStepfile: getSongInfoFromLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                                          str(sys.exc_info()[1])))
-
-        stepfileLogger.debug("parseStepfile: Attempting to get chart info for folder '" + self.songFolder + "'.")
+            stepfileLogger.warning("scanStepfile: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+
+    def parseChartBodies(self):
+        """
+        Counts the note data of the charts found by scanStepfile(readCharts=True),
+        reading only the byte ranges in chartOffsets.
+        """
+        timing = None
+        if self.timingAnalytics and 'BPMS' in self.timingTags:
+            timing = createTimingData(self.timingTags)
         try:
-            self.songCharts = getChartInfoFromLines(self.stepfileLines)
+            with open(self.stepfilePath, 'rb') as smFile:
+                for keyToAdd, (bodyStart, bodyEnd) in self.chartOffsets.items():
+                    smFile.seek(bodyStart)
+                    stepData = countStepData(normalizeNoteBytes(smFile.read(bodyEnd - bodyStart)), timing)
+                    self.song.charts[keyToAdd].setStepData(stepData)
         except:
-            stepfileLogger.warning("parseStepfile: getChartInfoFromLines: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                                           str(sys.exc_info()[1])))
-
-    def createSongDict(self):
-        self.songDict['title'] = self.songInfo['title']
-        self.songDict['subtitle'] = self.songInfo['subtitle']
-        self.songDict['artist'] = self.songInfo['artist']
-        self.songDict['bpm'] = self.songInfo['bpm']
-        self.songDict['charts'] = self.songCharts
-        self.songDict['pack'] = self.packName
-        self.songDict['banner'] = self.songInfo['banner']
+            stepfileLogger.warning("parseChartBodies: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
 
+    def setSongDict(self, songDict):
+        """
+        Fills the Stepfile from an already parsed song dictionary, e.g. one from
+        the parse cache, instead of calling parseStepfile.
+        """
+        self.song = SongRecord.fromDict(songDict)
 
+    def createSongDict(self):
+        """
+        Checks that all of the song information was parsed. Raises a KeyError
+        naming the first missing field otherwise.
+        """
+        missingFields = self.song.getMissingFields()
+        if missingFields != []:
+            raise KeyError(missingFields[0])
@@ -0,0 +1,242 @@
+#!/usr/bin/python3
+
+import sys
+import bisect
+import logging
+
+# NumPy is optional: without it, the same numbers are computed in plain Python.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+timingLogger = logging.getLogger("TIMING")
+timingLogger.addHandler(logging.NullHandler())
+
+# A measure with at least this many note rows counts as stream (16th notes).
+STREAM_ROWS = 16
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def parseTimingPairs(value):
+    """
+    Parses a #BPMS or #STOPS value like '0.000=120.000,64.000=150.000' into a
+    list of (beat, value) tuples sorted by beat. Blank entries are skipped.
+    """
+    pairs = []
+    for entry in value.split(','):
+        if entry.strip() == "":
+            continue
+        beat, value = entry.split('=')
+        pairs.append((float(beat), float(value)))
+    pairs.sort()
+    return pairs
+
+def getMeasureNoteRows(noteRows):
+    """
+    Takes the note rows of a chart reduced by countStepData (one line per row,
+    holding a '1' for every note, hold or roll head, and ',' lines between
+    measures) and returns a tuple (measureCounts, lastNoteBeat): the number of
+    rows with notes in every measure, and the beat of the last such row (None
+    if there isn't any). measureCounts is a NumPy array when NumPy is installed.
+    """
+    if numpy is not None:
+        return getMeasureNoteRowsNumpy(noteRows)
+
+    measureCounts = [0]
+    measureRows = 0
+    lastNote = None
+    for line in noteRows.split(b'\n'):
+        if line.startswith(b','):
+            if lastNote is not None and len(lastNote) == 2:
+                lastNote.append(measureRows)
+            measureCounts.append(0)
+            measureRows = 0
+            continue
+        if line != b"":
+            measureCounts[-1] += 1
+            lastNote = [len(measureCounts) - 1, measureRows]
+        measureRows += 1
+    if lastNote is None:
+        return measureCounts, None
+    if len(lastNote) == 2:
+        lastNote.append(measureRows)
+    return measureCounts, 4.0 * lastNote[0] + 4.0 * lastNote[1] / lastNote[2]
+
+def getMeasureNoteRowsNumpy(noteRows):
+    """
+    NumPy version of getMeasureNoteRows: the first byte of every line tells
+    separators and rows with notes apart, and measure numbers are a cumulative
+    sum over the separators.
+    """
+    rowBytes = numpy.frombuffer(noteRows + b'\n', dtype=numpy.uint8)
+    firstBytes = rowBytes[numpy.concatenate(([0], numpy.flatnonzero(rowBytes == ord('\n'))[:-1] + 1))]
+    separatorLine = firstBytes == ord(',')
+    noteLine = firstBytes == ord('1')
+
+    measureOfLine = numpy.cumsum(separatorLine)
+    measureCounts = numpy.bincount(measureOfLine[noteLine], minlength=int(measureOfLine[-1]) + 1)
+    noteLines = numpy.flatnonzero(noteLine)
+    if len(noteLines) == 0:
+        return measureCounts, None
+
+    # Position of the last note row within its measure.
+    lastLine = noteLines[-1]
+    lastMeasure = int(measureOfLine[lastLine])
+    measureRows = numpy.flatnonzero((measureOfLine == lastMeasure) & ~separatorLine)
+    rowIndex = int(numpy.searchsorted(measureRows, lastLine))
+    return measureCounts, 4.0 * lastMeasure + 4.0 * rowIndex / len(measureRows)
+
+def getBreakdown(measureCounts):
+    """
+    Takes the number of note rows of every measure and returns (streamMeasures,
+    breakMeasures, breakdown). breakdown is the usual notation of the runs of
+    stream between the first and last stream measure, e.g. '16 (4) 8' for 16
+    measures of stream, a 4 measure break and 8 more measures of stream.
+    """
+    runs = []
+    streamMeasures = 0
+    breakMeasures = 0
+    for noteRows in measureCounts:
+        isStream = noteRows >= STREAM_ROWS
+        if not isStream and runs == []:
+            continue
+        if runs != [] and runs[-1][0] == isStream:
+            runs[-1][1] += 1
+        else:
+            runs.append([isStream, 1])
+    if runs != [] and not runs[-1][0]:
+        runs.pop()
+    for isStream, length in runs:
+        if isStream:
+            streamMeasures += length
+        else:
+            breakMeasures += length
+    breakdown = " ".join(str(length) if isStream else "(" + str(length) + ")" for isStream, length in runs)
+    return streamMeasures, breakMeasures, breakdown
+
+def analyzeChart(timing, measureCounts, lastNoteBeat):
+    """
+    Takes the result of getMeasureNoteRows for a chart and the song's TimingData
+    and returns the chart's timing analytics as a dictionary:
+    - length: Seconds from the start of the music to the last note row.
+    - peakNps: Highest note rows per second of any measure.
+    - streamMeasures / breakMeasures / breakdown: See getBreakdown.
+    Without note rows every value is 0 (breakdown ""). Without timing nothing
+    can be worked out, so every value is None.
+
+    Warps aren't modelled (see TimingData): in a song with warps, length and the
+    NPS of the measures after the first warp come out as if the warped beats
+    were played at the BPM before it.
+    """
+    if timing is None:
+        return {'length': None, 'peakNps': None, 'streamMeasures': None, 'breakMeasures': None, 'breakdown': None}
+    analytics = {'length': 0.0, 'peakNps': 0.0, 'streamMeasures': 0, 'breakMeasures': 0, 'breakdown': ""}
+    if lastNoteBeat is None:
+        return analytics
+
+    # Measure boundaries and the last note are converted to seconds in one go.
+    measureCount = len(measureCounts)
+    if numpy is not None:
+        times = timing.beatsToSeconds(numpy.append(4.0 * numpy.arange(measureCount + 1), lastNoteBeat))
+        durations = numpy.diff(times[:-1])
+        valid = durations > 0
+        if valid.any():
+            analytics['peakNps'] = round(float((measureCounts[valid] / durations[valid]).max()), 2)
+        measureCounts = measureCounts.tolist()
+    else:
+        times = timing.beatsToSeconds([4.0 * measure for measure in range(measureCount + 1)] + [lastNoteBeat])
+        rates = [noteRows / (end - start) for noteRows, start, end in zip(measureCounts, times, times[1:-1])
+                 if end > start]
+        if rates != []:
+            analytics['peakNps'] = round(max(rates), 2)
+    analytics['length'] = round(float(times[-1]), 3)
+    analytics['streamMeasures'], analytics['breakMeasures'], analytics['breakdown'] = getBreakdown(measureCounts)
+    return analytics
+
+def createTimingData(timingTags):
+    """
+    Returns the TimingData for a dictionary of the raw 'BPMS', 'STOPS' and 'OFFSET'
+    values of a song, or None if the song has no usable BPMs. Negative and zero
+    BPMs (warps) are dropped, see TimingData.
+    """
+    try:
+        bpms = parseTimingPairs(timingTags.get('BPMS', ""))
+        stops = parseTimingPairs(timingTags.get('STOPS', ""))
+        offset = float(timingTags.get('OFFSET', "").strip() or 0.0)
+        return TimingData(bpms, stops, offset)
+    except:
+        timingLogger.warning("createTimingData: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        return None
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class TimingData():
+    """
+    This class holds the piecewise timing of a song, built once from its BPM
+    changes, stops and offset, and converts beats to seconds in bulk.
+
+    The constructor raises ValueError if there is no positive BPM.
+    Non-positive BPMs (warps) are ignored rather than modelled: the BPM before
+    a warp just carries on over the beats it would skip, so every later
+    segment starts later than it does in game.
+
+    - segmentBeats: Beat where every constant BPM segment starts.
+    - segmentSeconds: Time in seconds where every segment starts, without stops.
+    - segmentSecondsPerBeat: Seconds per beat of every segment.
+    - stopBeats: Beats of the stops.
+    - stopSeconds: Total length of all stops before each stop, plus the total at the end.
+    """
+
+    def __init__(self, bpms, stops=(), offset=0.0):
+        bpms = [(beat, bpm) for beat, bpm in bpms if bpm > 0]
+        if bpms == []:
+            raise ValueError("No positive BPM")
+        self.segmentBeats = [min(bpms[0][0], 0.0)] + [beat for beat, bpm in bpms[1:]]
+        self.segmentSecondsPerBeat = [60.0 / bpm for beat, bpm in bpms]
+        self.segmentSeconds = [-offset]
+        for i in range(1, len(bpms)):
+            self.segmentSeconds.append(self.segmentSeconds[-1] +
+                                       (self.segmentBeats[i] - self.segmentBeats[i-1]) * self.segmentSecondsPerBeat[i-1])
+        self.stopBeats = [beat for beat, seconds in stops]
+        self.stopSeconds = [0.0]
+        for beat, seconds in stops:
+            self.stopSeconds.append(self.stopSeconds[-1] + seconds)
+
+        if numpy is not None:
+            self.segmentBeatsArray = numpy.array(self.segmentBeats)
+            self.segmentSecondsArray = numpy.array(self.segmentSeconds)
+            self.segmentSecondsPerBeatArray = numpy.array(self.segmentSecondsPerBeat)
+            self.stopBeatsArray = numpy.array(self.stopBeats)
+            self.stopSecondsArray = numpy.array(self.stopSeconds)
+
+    def beatsToSeconds(self, beats):
+        """
+        Converts a sequence of beats to seconds from the start of the music.
+        A stop delays everything after its beat, but not notes on the beat itself.
+        Returns a NumPy array when NumPy is installed and a list otherwise.
+        """
+        if numpy is not None:
+            beats = numpy.asarray(beats, dtype=numpy.float64)
+            segment = numpy.maximum(numpy.searchsorted(self.segmentBeatsArray, beats, side='right') - 1, 0)
+            seconds = (self.segmentSecondsArray[segment] +
+                       (beats - self.segmentBeatsArray[segment]) * self.segmentSecondsPerBeatArray[segment])
+            return seconds + self.stopSecondsArray[numpy.searchsorted(self.stopBeatsArray, beats, side='left')]
+
+        seconds = []
+        for beat in beats:
+            segment = max(bisect.bisect_right(self.segmentBeats, beat) - 1, 0)
+            seconds.append(self.segmentSeconds[segment] +
+                           (beat - self.segmentBeats[segment]) * self.segmentSecondsPerBeat[segment] +
+                           self.stopSeconds[bisect.bisect_left(self.stopBeats, beat)])
+        return seconds
@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are set up by the caller with containers.logconfig.configureLogging,
+# so importing this module doesn't touch any files and logs nothing by default.
+watcherLogger = logging.getLogger("WATCHER")
+watcherLogger.addHandler(logging.NullHandler())
+
+# inotify event flags, from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def takeSnapshot(songsDirectory, skipFolders=("jsons",)):
+    """
+    Returns a dictionary of pack name -> {stepfile path: (size, mtime_ns)} for every
+    .sm file two levels below songsDirectory, using os.scandir. Packs without any
+    .sm file are in it too, with an empty dictionary.
+    """
+    snapshot = {}
+    with os.scandir(songsDirectory) as packEntries:
+        for packEntry in packEntries:
+            if packEntry.name in skipFolders or not packEntry.is_dir():
+                continue
+            packFiles = {}
+            try:
+                with os.scandir(packEntry.path) as songEntries:
+                    for songEntry in songEntries:
+                        if not songEntry.is_dir():
+                            continue
+                        with os.scandir(songEntry.path) as fileEntries:
+                            for fileEntry in fileEntries:
+                                if fileEntry.name[-3:].lower() == ".sm" and fileEntry.is_file():
+                                    fileStat = fileEntry.stat()
+                                    packFiles[fileEntry.path] = (fileStat.st_size, fileStat.st_mtime_ns)
+            except OSError:
+                watcherLogger.warning("takeSnapshot: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+            snapshot[packEntry.name] = packFiles
+    return snapshot
+
+def diffSnapshots(oldSnapshot, newSnapshot):
+    """
+    Returns the set of pack names that were added, removed or had any of their
+    .sm files added, removed or changed between two snapshots.
+    """
+    changedPacks = set()
+    for packName in set(oldSnapshot) | set(newSnapshot):
+        if oldSnapshot.get(packName) != newSnapshot.get(packName):
+            changedPacks.add(packName)
+    return changedPacks
+
+def createWatcher(songsDirectory, pollInterval=2.0, skipFolders=("jsons",)):
+    """
+    Returns an InotifyWatcher for songsDirectory where inotify is available,
+    and a PollingWatcher otherwise.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(songsDirectory, skipFolders)
+        except OSError:
+            watcherLogger.warning("createWatcher: inotify unavailable (%s), polling every %s seconds instead.",
+                                  sys.exc_info()[1], pollInterval)
+    return PollingWatcher(songsDirectory, pollInterval, skipFolders)
+
+def waitForChangedPacks(watcher, debounceSeconds=1.0, timeout=None):
+    """
+    Blocks until a pack changes, then keeps collecting changes until no new
+    event came in for debounceSeconds, so copying a whole pack into the Songs
+    folder ends up as one rebuild. Returns the set of changed pack names, or an
+    empty set if timeout seconds passed without any change.
+    """
+    started = time.monotonic()
+    changedPacks = set()
+    while not changedPacks:
+        waitTime = None
+        if timeout is not None:
+            waitTime = timeout - (time.monotonic() - started)
+            if waitTime <= 0:
+                return changedPacks
+        changedPacks = watcher.getChangedPacks(waitTime)
+
+    quietSince = time.monotonic()
+    while time.monotonic() - quietSince < debounceSeconds:
+        moreChanges = watcher.getChangedPacks(max(debounceSeconds - (time.monotonic() - quietSince), 0))
+        if moreChanges:
+            changedPacks |= moreChanges
+            quietSince = time.monotonic()
+    return changedPacks
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class PollingWatcher():
+    """
+    This class finds changed song packs by comparing os.scandir snapshots of
+    the Songs directory (see takeSnapshot) every pollInterval seconds. Snapshots
+    are never taken more often than that, however short the timeouts given to
+    getChangedPacks are.
+
+    - songsDirectory: Full path to the Songs directory.
+    - pollInterval: Seconds between snapshots.
+    - snapshot: The last snapshot taken.
+    - snapshotTime: time.monotonic() of the last snapshot.
+    """
+
+    def __init__(self, songsDirectory, pollInterval=2.0, skipFolders=("jsons",)):
+        self.songsDirectory = songsDirectory
+        self.pollInterval = pollInterval
+        self.skipFolders = skipFolders
+        self.snapshot = takeSnapshot(songsDirectory, skipFolders)
+        self.snapshotTime = time.monotonic()
+
+    def close(self):
+        pass
+
+    def getChangedPacks(self, timeout=None):
+        """
+        Waits until the next snapshot is due and returns the set of pack names
+        that changed since the last one. If timeout seconds run out first, no
+        snapshot is taken and the set is empty. Without a timeout, it always
+        waits for the next snapshot.
+        """
+        waitTime = max(self.snapshotTime + self.pollInterval - time.monotonic(), 0)
+        if timeout is not None and timeout < waitTime:
+            time.sleep(max(timeout, 0))
+            return set()
+        time.sleep(waitTime)
+        newSnapshot = takeSnapshot(self.songsDirectory, self.skipFolders)
+        self.snapshotTime = time.monotonic()
+        changedPacks = diffSnapshots(self.snapshot, newSnapshot)
+        self.snapshot = newSnapshot
+        return changedPacks
+
+class InotifyWatcher():
+    """
+    This class finds changed song packs with Linux inotify, watching the Songs
+    directory, every pack folder and every song folder. New folders are watched
+    as soon as they show up.
+
+    The constructor raises OSError if inotify can't be set up, e.g. when the
+    watch limit (fs.inotify.max_user_watches) is too low for the library.
+
+    - songsDirectory: Full path to the Songs directory.
+    - fd: The inotify file descriptor.
+    - watchPaths: Dictionary of watch descriptor -> watched directory.
+    """
+
+    def __init__(self, songsDirectory, skipFolders=("jsons",)):
+        self.songsDirectory = os.path.normpath(songsDirectory)
+        self.skipFolders = skipFolders
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watchPaths = {}
+        try:
+            self.addWatch(self.songsDirectory)
+            with os.scandir(self.songsDirectory) as packEntries:
+                for packEntry in packEntries:
+                    if packEntry.name not in self.skipFolders and packEntry.is_dir():
+                        self.addTreeWatches(packEntry.path)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def addWatch(self, directory):
+        watchDescriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if watchDescriptor < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        self.watchPaths[watchDescriptor] = directory
+
+    def addTreeWatches(self, packPath):
+        """
+        Watches a pack folder and the song folders in it.
+        """
+        self.addWatch(packPath)
+        with os.scandir(packPath) as songEntries:
+            for songEntry in songEntries:
+                if songEntry.is_dir():
+                    self.addWatch(songEntry.path)
+
+    def getPackName(self, path):
+        """
+        Returns the name of the pack that path is in, or None if it's not in a pack.
+        """
+        relativePath = os.path.relpath(path, self.songsDirectory)
+        packName = relativePath.split(os.sep)[0]
+        if packName in (".", "..") or packName in self.skipFolders:
+            return None
+        return packName
+
+    def getChangedPacks(self, timeout=None):
+        """
+        Waits up to timeout seconds (without one, until something happens) for
+        inotify events and returns the set of pack names they touched.
+        """
+        changedPacks = set()
+        readable, writable, errored = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changedPacks
+        try:
+            buffer = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return changedPacks
+
+        offset = 0
+        while offset < len(buffer):
+            watchDescriptor, mask, cookie, nameLength = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(buffer[offset:offset + nameLength].rstrip(b"\0"))
+            offset += nameLength
+
+            # Too many events at once: every pack has to be checked.
+            if mask & IN_Q_OVERFLOW:
+                watcherLogger.warning("getChangedPacks: inotify queue overflowed, checking every pack.")
+                with os.scandir(self.songsDirectory) as packEntries:
+                    changedPacks.update(entry.name for entry in packEntries
+                                        if entry.name not in self.skipFolders and entry.is_dir())
+                continue
+            if mask & IN_IGNORED:
+                self.watchPaths.pop(watchDescriptor, None)
+                continue
+            directory = self.watchPaths.get(watchDescriptor)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+
+            # Files next to the packs (like the parse cache) aren't songs.
+            if directory == self.songsDirectory and not mask & IN_ISDIR:
+                continue
+            packName = self.getPackName(path)
+            if packName is None:
+                continue
+            changedPacks.add(packName)
+
+            # Start watching folders that were just created or moved in.
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    if directory == self.songsDirectory:
+                        self.addTreeWatches(path)
+                    else:
+                        self.addWatch(path)
+                except OSError:
+                    watcherLogger.warning("getChangedPacks: %s: %s", sys.exc_info()[0].__name__, sys.exc_info()[1])
+        return changedPacks
@@ -1,8 +1,10 @@
 #!/usr/bin/python3
 
 from containers.songpack import SongPack
+from containers.logconfig import configureLogging
+from containers.serializer import COMPRESSION_SUFFIXES, getEncoderName, getJsonPath, writeJson
+import argparse
 import pprint
-import json
 import os
 
 # MAIN
@@ -12,6 +14,22 @@ if __name__ == "__main__":
     # Create prettyprinter object
     pp = pprint.PrettyPrinter(indent=4)
 
+    # Command line options.
+    parser = argparse.ArgumentParser(description="Create a JSON for one song pack.")
+    parser.add_argument("--header-only", action="store_true",
+                        help="Only read the song information before the first #NOTES tag of every stepfile. No charts.")
+    parser.add_argument("--chart-headers", action="store_true",
+                        help="Like --header-only, but also list every chart's game, stepper, difficulty and "
+                             "rating. Note counts are left at 0.")
+    parser.add_argument("--compact", action="store_true",
+                        help="Write the JSON without indentation.")
+    parser.add_argument("--compress", choices=sorted(COMPRESSION_SUFFIXES), default=None,
+                        help="Compress the JSON with gzip or zstd (needs the zstandard package).")
+    args = parser.parse_args()
+
+    # Show warnings from the container modules on the console.
+    configureLogging()
+
     # Create Batch Object with user specified directory.
     print(">>> listsongpack.py looks through a song pack directory and retrieves song "
           "information from it including chart information.")
@@ -26,7 +44,10 @@ if __name__ == "__main__":
     # Make the stepfile objects and parse them.
     print(">>> Constructing Simfile Objects and parsing them.")
     pack.constructStepfiles()
-    pack.parseStepfiles()
+    if args.header_only or args.chart_headers:
+        pack.scanStepfiles(readCharts=args.chart_headers)
+    else:
+        pack.parseStepfiles()
     print(pack)
 
     """
@@ -47,11 +68,10 @@ if __name__ == "__main__":
     print(">>> Writing JSON file for song pack.")
     packName = pack.getPackName()
     songs = pack.getSongs()
-    outFilePath = os.path.join(songPackPath, packName + ".json")
-    with open(outFilePath, 'w') as outFile:
-        json.dump(songs, outFile, indent=4)
-    outFile.close()
-    print(">>> Successfully wrote JSON file.")
+    outFilePath = getJsonPath(os.path.join(songPackPath, packName), args.compress)
+    jsonOut = writeJson(outFilePath, songs, args.compact, args.compress)
+    print(">>> Successfully wrote JSON file. " + str(jsonOut.bytesWritten) + " bytes with " + getEncoderName() +
+          " in " + str(round(jsonOut.seconds,3)) + " seconds.")
     
 
 
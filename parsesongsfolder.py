@@ -1,8 +1,16 @@
 #!/usr/bin/python3
 
-from containers.songpack import SongPack
+from containers.songpack import SongPack, discoverSongPacks, parseSongPacksParallel
+from containers.logconfig import LOG_LEVELS, configureLogging
+from containers.catalog import SongCatalog
+from containers.packwriter import PackWriter, DEFAULT_QUEUE_DEPTH
+from containers.serializer import getEncoderName
+from containers.metrics import RunMetrics, StageClock, enableStageProfiling, writeStageProfiles
+from containers.prefetch import DEFAULT_PREFETCH_BYTES
+from containers.packbuild import (addPackOptions, getEncodings, openAssetIndex, openParseCache, removeStaleJsons,
+                                  submitPack)
+import argparse
 import pprint
-import json
 import os
 import sys
 import shutil
@@ -15,6 +23,41 @@ if __name__ == "__main__":
     # Create prettyprinter object
     pp = pprint.PrettyPrinter(indent=4)
 
+    # Command line options.
+    parser = argparse.ArgumentParser(description="Create a JSON for every song pack in a Stepmania Songs directory.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of processes to parse songs with. Songs from all packs are spread over the processes.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Reparse every stepfile and rewrite every JSON instead of using the parse cache.")
+    parser.add_argument("--log-level", default="WARNING", type=str.upper, choices=LOG_LEVELS,
+                        help="Logging level of the container modules, one of %(choices)s. Defaults to WARNING.")
+    parser.add_argument("--log-file", default=None,
+                        help="Also write the container modules' log to this file.")
+    parser.add_argument("--sqlite", default=None,
+                        help="Also write every song pack into an indexed SQLite catalog at this path.")
+    parser.add_argument("--write-queue", type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Number of parsed song packs that may wait to be written before parsing pauses. "
+                             "Defaults to " + str(DEFAULT_QUEUE_DEPTH) + ".")
+    parser.add_argument("--read-ahead", type=int, default=0,
+                        help="Read up to this many stepfiles ahead on background threads while parsing, "
+                             "for Songs directories on network storage. Only without --jobs. Off by default.")
+    parser.add_argument("--read-ahead-mb", type=float, default=DEFAULT_PREFETCH_BYTES / (1024 * 1024),
+                        help="Megabytes of read-ahead stepfiles that may wait to be parsed. Defaults to " +
+                             str(DEFAULT_PREFETCH_BYTES // (1024 * 1024)) + ".")
+    parser.add_argument("--metrics", default=None,
+                        help="Write a JSON report of the time spent per stage, per pack and on the slowest files to this path.")
+    parser.add_argument("--profile", default=None,
+                        help="Profile every stage with cProfile and write one .pstats file per stage to this directory. "
+                             "Slows the run down. Can't be used with --jobs, since the songs are parsed in other processes then.")
+    addPackOptions(parser)
+    args = parser.parse_args()
+    configureLogging(args.log_level, args.log_file)
+    encodings = getEncodings(parser, args)
+    if args.profile is not None and args.jobs > 1:
+        parser.error("--profile can't be used with --jobs, the worker processes aren't profiled")
+    if args.profile is not None:
+        enableStageProfiling()
+
     # Create Batch Object with user specified directory.
     print(">>> parsesongsfolder.py looks through a Songs folder directory containing all "
           "the song packs in a Stepmania directory and creates individual JSONS for "
@@ -30,83 +73,160 @@ if __name__ == "__main__":
             songsDirectory = (input(">>> Input full path to directory of Songs directory: ")).strip()
             jsonsDir = os.path.join(songsDirectory, "jsons")
 
-            # Clean out the 'jsons' directory first. Create it after the song packs are listed.
-            if os.path.exists(jsonsDir):
+            # Without the cache, clean out the 'jsons' directory first. Create it after the song packs are listed.
+            # With the cache, JSONs of unchanged packs are kept and stale ones are removed after writing.
+            if args.no_cache and os.path.exists(jsonsDir):
                 shutil.rmtree(jsonsDir)
-            songPacks = os.listdir(songsDirectory)
-            os.makedirs(jsonsDir)
+            with os.scandir(songsDirectory) as songsEntries:
+                songPacks = [entry.name for entry in songsEntries if entry.is_dir() and entry.name != "jsons"]
+            os.makedirs(jsonsDir, exist_ok=True)
             break
         except:
             print(">>> parsesongsfolder.py: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                          str(sys.exc_info()[1])))
 
+    # Open the SQLite catalog if one was asked for.
+    catalog = None
+    if args.sqlite is not None:
+        try:
+            catalog = SongCatalog(args.sqlite)
+        except:
+            print(">>> parsesongsfolder.py: SQLITE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                         str(sys.exc_info()[1])))
+
+    # Load the parse cache so unchanged stepfiles don't have to be parsed again.
+    cache = None
+    if not args.no_cache:
+        cache = openParseCache(args, songsDirectory, encodings)
+
+    # The asset cache lives next to the parse cache.
+    assetIndex = openAssetIndex(args, cache)
+
     # Look at listsongpack.py and imitate what it's doing for each song pack.
-    # Make a logger for this script.
-    jsonsToWrite = []
+    # Every parsed pack goes straight to the writer thread, which writes its JSON while the next pack parses.
+    packNames = []
     totalTime = 0.0
+    runStart = time.time()
+    metrics = RunMetrics()
+    writer = PackWriter(jsonsDir, args.write_queue, args.compact, args.compress, metrics)
     print(">>> parsesongsfolder.py: MAKE: Making JSONs for the song packs.")
     try:
-        for songPack in songPacks:
-            songPackDir = os.path.join(songsDirectory,songPack)
-            if os.path.isdir(songPackDir):
+        if args.jobs > 1:
+            # Discover the songs of every pack first, then parse all of them in one process pool.
+            try:
+                start = time.time()
+                clock = StageClock()
+                clock.switch('discovery')
+                packs = discoverSongPacks(songsDirectory, encodings=encodings, timingAnalytics=args.timing)
+                clock.switch()
+                metrics.addTime('discovery', clock.timings['discovery'])
+                print(">>> parsesongsfolder.py: MAKE: Parsing " + str(len(packs)) + " Song Packs with " + str(args.jobs) + " jobs.")
+                parsedPacks = parseSongPacksParallel(packs, args.jobs, cache)
+                totalTime += time.time() - start
+                for pack in parsedPacks:
+                    if submitPack(writer, pack, cache, catalog, assetIndex) != []:
+                        packNames.append(pack.getPackName())
+                    for stepfile in pack.getStepfiles():
+                        metrics.addStepfile(stepfile)
+            except:
+                print(">>> parsesongsfolder.py: MAKE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                             str(sys.exc_info()[1])))
+        else:
+            for songPack in songPacks:
+                songPackDir = os.path.join(songsDirectory,songPack)
                 try:
 
                     # Parse the stepfile information for the song pack.
                     print(">>> parsesongsfolder.py: MAKE: Making JSON for Song Pack '" + songPack + "'.")
                     start = time.time()
-                    pack = SongPack(songPackDir)
+                    clock = StageClock()
+                    clock.switch('discovery')
+                    pack = SongPack(songPackDir, encodings, args.timing)
                     pack.retrieveSongFolders() # Initialize search fields and list of folders in batch directory.
-                    pack.constructStepfiles(); pack.parseStepfiles() # Make the stepfile objects and parse them.
-
-                    # Get the Song Array (has dictionaries for each chart) from the SongPack object and save it.
-                    packName = pack.getPackName()
-                    songs = pack.getSongs()
-                    jsonsToWrite.append(songs)
-                    end = time.time()
-                    elapsed = end - start
+                    pack.constructStepfiles() # Make the stepfile objects.
+                    clock.switch()
+                    metrics.addTime('discovery', clock.timings['discovery'], pack.getPackName())
+                    pack.parseStepfiles(cache=cache, readAhead=args.read_ahead,
+                                        readAheadBytes=int(args.read_ahead_mb * 1024 * 1024)) # Parse them.
+
+                    # Hand the Song Array (has dictionaries for each chart) over to the writer.
+                    if submitPack(writer, pack, cache, catalog, assetIndex) != []:
+                        packNames.append(pack.getPackName())
+                    for stepfile in pack.getStepfiles():
+                        metrics.addStepfile(stepfile)
+                    elapsed = time.time() - start
                     totalTime += elapsed
                     print(">>> parsesongsfolder.py: MAKE: Made JSON. Time Elapsed: " + str(round(elapsed,3)) + " seconds.")
-                    
+
                 except:
                     print(">>> parsesongsfolder.py: MAKE: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                  str(sys.exc_info()[1])))
-            else:
-                continue # This means it wasn't a directory
-    except:
-        print(">>> parsesongsfolder.py: MAKE: MAKE: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                     str(sys.exc_info()[1])))
+    finally:
+        # Let the writer finish whatever is still queued, even if parsing stopped early.
+        writer.close()
     print(">>> parsesongsfolder.py: MAKE: JSONs for Song Packs made in " + str(round(totalTime,3)) + " seconds.")
-    overallTime += totalTime
+    print(">>> parsesongsfolder.py: WRITE: Wrote " + str(len(writer.written)) + " JSONs (" + str(writer.bytesWritten) +
+          " bytes with " + getEncoderName() + ") in " + str(round(writer.writeTime,3)) + " seconds, alongside parsing.")
+    for packName, error in writer.failed:
+        print(">>> parsesongsfolder.py: WRITE: Song Pack '" + packName + "': " + error)
 
-    # Now that we have the list of song pack information, we can dump them out
-    # into JSONs in a directory called "jsons".
-    print(">>> parsesongsfolder.py: WRITE: Found " + str(len(jsonsToWrite)) + " song packs. Writing out JSONs.")
-    totalTime = 0.0
-    try:
-        jsonsDir = os.path.join(songsDirectory, "jsons")
-        if os.path.isdir(jsonsDir):
-            counter = len(jsonsToWrite)
-            for jsonToWrite in jsonsToWrite:
-                # Get the name of the song pack, then write its song charts out to a JSON file.
-                start = time.time()
-                packName = jsonToWrite[0]['pack']
-                print(">>> parsesongsfolder.py: WRITE: Writing JSON file for Song Pack '" + packName + "'. " + str(len(jsonToWrite)) + " songs found.")
-                outFilePath = os.path.join(jsonsDir, packName + ".json")
-                with open(outFilePath, 'w') as outFile:
-                    json.dump(jsonToWrite, outFile, indent=4)
-                outFile.close()
-                end = time.time()
-                elapsed = round(end - start,3)
-                totalTime += elapsed
-                counter -= 1
-                print(">>> parsesongsfolder.py: WRITE: " + str(counter) + " Song Packs left. Successfully wrote JSON. Time Elapsed: " + str(round(elapsed,3)) + " seconds.")
-        else:
-            print(">>> parsesongsfolder.py: WRITE: jsons directory not successfully created.")
-    except:
-        print(">>> parsesongsfolder.py: WRITE: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                     str(sys.exc_info()[1])))
-    print(">>> parsesongsfolder.py: WRITE: JSONs for Song Packs written in " + str(round(totalTime,3)) + " seconds.")
-    overallTime += totalTime
+    # Remember the packs that were written so they can be kept next time.
+    if cache is not None:
+        for packName, signature in writer.written:
+            cache.setPackSignature(packName, signature)
+
+    # Remove JSONs of song packs that no longer exist.
+    if cache is not None:
+        try:
+            removeStaleJsons(writer, cache, packNames)
+        except:
+            print(">>> parsesongsfolder.py: WRITE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                         str(sys.exc_info()[1])))
+    overallTime = time.time() - runStart
+
+    # Report where the time went.
+    print(metrics)
+    if args.metrics is not None:
+        try:
+            metrics.writeReport(args.metrics)
+            print(">>> parsesongsfolder.py: METRICS: Report written to '" + args.metrics + "'.")
+        except:
+            print(">>> parsesongsfolder.py: METRICS: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                         str(sys.exc_info()[1])))
+    if args.profile is not None:
+        try:
+            for profilePath in writeStageProfiles(args.profile):
+                print(">>> parsesongsfolder.py: METRICS: Profile written to '" + profilePath + "'.")
+        except:
+            print(">>> parsesongsfolder.py: METRICS: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                         str(sys.exc_info()[1])))
+
+    # Drop packs that no longer exist from the SQLite catalog.
+    if catalog is not None:
+        try:
+            catalog.removePacksExcept(packNames)
+            catalog.close()
+            print(">>> parsesongsfolder.py: SQLITE: Catalog written to '" + args.sqlite + "'.")
+        except:
+            print(">>> parsesongsfolder.py: SQLITE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                         str(sys.exc_info()[1])))
+
+    # Save the parse cache for the next run.
+    if cache is not None:
+        try:
+            cache.save()
+            print(">>> parsesongsfolder.py: CACHE: " + str(cache.hits) + " songs from cache, " + str(cache.misses) + " parsed.")
+        except:
+            print(">>> parsesongsfolder.py: CACHE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                         str(sys.exc_info()[1])))
+    if assetIndex is not None:
+        try:
+            assetIndex.cache.save()
+            print(">>> parsesongsfolder.py: ASSETS: " + str(assetIndex.cache.hits) + " assets from cache, " +
+                  str(assetIndex.cache.misses) + " probed.")
+        except:
+            print(">>> parsesongsfolder.py: ASSETS: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                         str(sys.exc_info()[1])))
     print(">>> parsesongsfolder.py: Total Time Elapsed: " + str(round(overallTime,3)) + " seconds.")
     print(">>> parsesongsfolder.py: Finished writing JSONs for the song packs. See '" + jsonsDir + "' for these files.")
 
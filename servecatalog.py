@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+from containers.catalogserver import CatalogServer
+from containers.logconfig import LOG_LEVELS, configureLogging
+import argparse
+import asyncio
+import os
+import sys
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+async def serveCatalog(server):
+    """
+    Starts the server and reports the address it's bound to (with --port 0,
+    the port that was picked) before serving until stopped.
+    """
+    await server.start()
+    print(">>> servecatalog.py: SERVE: Serving on http://" + server.host + ":" + str(server.port) + "/. Press Ctrl+C to stop.")
+    await server.serveForever()
+
+# MAIN
+# python3 servecatalog.py C:\dev\cs_site\site_idea\Songs\jsons\allSongPacksJson.json --port 8080
+if __name__ == "__main__":
+
+    # Command line options.
+    parser = argparse.ArgumentParser(description="Serve JSON queries over the combined song pack JSON from one warm process.")
+    parser.add_argument("catalogPath", nargs="?", default=None,
+                        help="Path to the allSongPacksJson.json written by combinejsons.py. Asked for when left out.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on. Defaults to 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on. Defaults to 8080.")
+    parser.add_argument("--reload-interval", type=float, default=2.0,
+                        help="Seconds between checks of the catalog file for changes. Defaults to 2.")
+    parser.add_argument("--log-level", default="INFO", type=str.upper, choices=LOG_LEVELS,
+                        help="Logging level of the container modules, one of %(choices)s. Defaults to INFO.")
+    parser.add_argument("--log-file", default=None,
+                        help="Also write the container modules' log to this file.")
+    args = parser.parse_args()
+    configureLogging(args.log_level, args.log_file)
+
+    print(">>> servecatalog.py answers song, pack and chart queries over HTTP from the combined "
+          "song pack JSON, reloading it whenever combinejsons.py writes it again.")
+
+    catalogPath = args.catalogPath
+    while catalogPath is None or not os.path.isfile(catalogPath):
+        if catalogPath is not None:
+            print(">>> servecatalog.py: No such file: '" + catalogPath + "'")
+        catalogPath = (input(">>> Input full path to allSongPacksJson.json: ")).strip()
+
+    server = CatalogServer(catalogPath, args.host, args.port, args.reload_interval)
+    try:
+        asyncio.run(serveCatalog(server))
+    except KeyboardInterrupt:
+        print(">>> servecatalog.py: SERVE: Stopped.")
+    except OSError:
+        print(">>> servecatalog.py: SERVE: {0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1])))
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+
+from containers.assets import AssetIndex, probeAudio, probeImage, resolveAssetPath
+from containers.stepfile import Stepfile
+import os
+import struct
+import tempfile
+import unittest
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getPngBytes(width, height):
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+
+def getGifBytes(width, height):
+    return b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0)
+
+def getJpegBytes(width, height):
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    frame = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    return b"\xff\xd8" + app0 + b"\xff" + frame + b"\xff\xd9"
+
+def getWavBytes(sampleRate, channels, dataBytes, dataSize=None):
+    byteRate = sampleRate * channels
+    fmtChunk = b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sampleRate, byteRate, channels, 8)
+    dataChunk = b"data" + struct.pack("<I", dataBytes if dataSize is None else dataSize) + b"\x80" * dataBytes
+    return b"RIFF" + struct.pack("<I", 4 + len(fmtChunk) + len(dataChunk)) + b"WAVE" + fmtChunk + dataChunk
+
+def getMp3Bytes(frameCount, xingFrames=None):
+    """
+    MPEG-1 layer III frames at 128kbps, 44100Hz and stereo, 417 bytes each.
+    With xingFrames, the first frame holds a Xing header with that frame count.
+    """
+    frame = b"\xff\xfb\x90\x00" + b"\x00" * 413
+    firstFrame = frame
+    if xingFrames is not None:
+        firstFrame = frame[:36] + b"Xing" + struct.pack(">II", 1, xingFrames) + frame[48:]
+    return firstFrame + frame * (frameCount - 1)
+
+def getOggPage(headerType, granule, packet):
+    return b"OggS" + struct.pack("<BBqIIIB", 0, headerType, granule, 1234, 0, 0, 1) + bytes([len(packet)]) + packet
+
+def getOggBytes(sampleRate, channels, samples, nominalBitrate):
+    identification = b"\x01vorbis" + struct.pack("<IBIiiiBB", 0, channels, sampleRate, 0, nominalBitrate, 0, 0xb8, 1)
+    return getOggPage(2, 0, identification) + getOggPage(0, samples // 2, b"\x00" * 200) + getOggPage(4, samples, b"\x00" * 200)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class AssetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeFile(self, relativePath, contents):
+        filePath = os.path.join(self.tempDirectory.name, relativePath)
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        with open(filePath, 'wb') as outFile:
+            outFile.write(contents)
+        return filePath
+
+class ProbeImageTest(AssetTestCase):
+
+    def testPng(self):
+        self.assertEqual(probeImage(self.writeFile("banner.png", getPngBytes(418, 164))),
+                         {'format': 'png', 'width': 418, 'height': 164})
+
+    def testGif(self):
+        self.assertEqual(probeImage(self.writeFile("banner.gif", getGifBytes(256, 80))),
+                         {'format': 'gif', 'width': 256, 'height': 80})
+
+    def testJpeg(self):
+        self.assertEqual(probeImage(self.writeFile("banner.jpg", getJpegBytes(512, 160))),
+                         {'format': 'jpeg', 'width': 512, 'height': 160})
+
+    def testCutOffJpeg(self):
+        self.assertEqual(probeImage(self.writeFile("banner.jpg", getJpegBytes(512, 160)[:8])),
+                         {'format': 'jpeg', 'width': None, 'height': None})
+
+    def testOtherFile(self):
+        self.assertEqual(probeImage(self.writeFile("banner.txt", b"not an image")),
+                         {'format': None, 'width': None, 'height': None})
+
+class ProbeAudioTest(AssetTestCase):
+
+    def testWav(self):
+        self.assertEqual(probeAudio(self.writeFile("song.wav", getWavBytes(8000, 1, 16000))),
+                         {'format': 'wav', 'duration': 2.0, 'sampleRate': 8000, 'channels': 1, 'bitrate': 64})
+
+    def testUnfinishedWav(self):
+        self.assertEqual(probeAudio(self.writeFile("song.wav", getWavBytes(8000, 2, 16000, 0xFFFFFFFF)))['duration'], 1.0)
+
+    def testConstantBitrateMp3(self):
+        self.assertEqual(probeAudio(self.writeFile("song.mp3", getMp3Bytes(10))),
+                         {'format': 'mp3', 'duration': 0.261, 'sampleRate': 44100, 'channels': 2, 'bitrate': 128})
+
+    def testMp3WithXingHeader(self):
+        probe = probeAudio(self.writeFile("song.mp3", getMp3Bytes(10, 100)))
+        self.assertEqual(probe['duration'], 2.612)
+
+    def testMp3AfterId3Tag(self):
+        id3Tag = b"ID3\x03\x00\x00" + bytes([0, 0, 0, 100]) + b"\xff" * 100
+        probe = probeAudio(self.writeFile("song.mp3", id3Tag + getMp3Bytes(10)))
+        self.assertEqual((probe['format'], probe['duration']), ('mp3', 0.261))
+
+    def testOggVorbis(self):
+        self.assertEqual(probeAudio(self.writeFile("song.ogg", getOggBytes(44100, 2, 44100 * 3, 128000))),
+                         {'format': 'ogg', 'duration': 3.0, 'sampleRate': 44100, 'channels': 2, 'bitrate': 128})
+
+    def testOtherFile(self):
+        self.assertEqual(probeAudio(self.writeFile("song.txt", b"not audio")),
+                         {'format': None, 'duration': None, 'sampleRate': None, 'channels': None, 'bitrate': None})
+
+class ResolveBannerTest(AssetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.songFolderPath = os.path.join(self.tempDirectory.name, "Pack", "Song")
+        os.makedirs(self.songFolderPath)
+
+    def testExactName(self):
+        bannerPath = self.writeFile(os.path.join("Pack", "Song", "bn.png"), getPngBytes(1, 1))
+        self.assertEqual(resolveAssetPath(self.songFolderPath, "bn.png"), bannerPath)
+
+    def testNameInOtherCase(self):
+        bannerPath = self.writeFile(os.path.join("Pack", "Song", "Banner.PNG"), getPngBytes(1, 1))
+        self.assertEqual(resolveAssetPath(self.songFolderPath, "banner.png"), bannerPath)
+
+    def testMissingFile(self):
+        self.assertIsNone(resolveAssetPath(self.songFolderPath, "banner.png"))
+        self.assertIsNone(resolveAssetPath(self.songFolderPath, None))
+
+    def testBannerOutsideSongFolder(self):
+        self.writeFile(os.path.join("Pack", "banner.png"), getPngBytes(418, 164))
+        bannerInfo = AssetIndex(threads=1).getImageInfo(self.songFolderPath, "..\\banner.png")
+        self.assertEqual(bannerInfo['file'], "../banner.png")
+        self.assertTrue(bannerInfo['exists'])
+        self.assertEqual((bannerInfo['format'], bannerInfo['width'], bannerInfo['height']), ('png', 418, 164))
+
+    def testMissingBanner(self):
+        bannerInfo = AssetIndex(threads=1).getImageInfo(self.songFolderPath, "banner.png")
+        self.assertEqual(bannerInfo, {'file': "banner.png", 'exists': False, 'bytes': None, 'mtime': None,
+                                      'format': None, 'width': None, 'height': None})
+
+    def testBannerOfParsedStepfile(self):
+        self.writeFile(os.path.join("Pack", "banner.png"), getPngBytes(418, 164))
+        self.writeFile(os.path.join("Pack", "Song", "song.sm"), b"#TITLE:Song;\n#BANNER:../banner.png;\n")
+        stepfile = Stepfile(os.path.join(self.tempDirectory.name, "Pack"), "Song", "song.sm")
+        stepfile.parseStepfile()
+        AssetIndex(threads=1).indexStepfile(stepfile)
+        song = stepfile.getSong()
+        self.assertEqual(song.banner, "banner.png")
+        self.assertEqual(song.bannerFile, "../banner.png")
+        self.assertTrue(song.bannerInfo['exists'])
+        self.assertEqual(song.bannerInfo['file'], "../banner.png")
+
+if __name__ == '__main__':
+    unittest.main()
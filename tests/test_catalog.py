@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+from containers.catalog import SongCatalog
+import os
+import sys
+import sqlite3
+import tempfile
+import subprocess
+import unittest
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPFILE = """#TITLE:{0};
+#SUBTITLE:;
+#ARTIST:Artist;
+#BANNER:bn.png;
+#BPMS:0.000=150.000;
+#NOTES:
+     dance-single:
+     Someone:
+     Hard:
+     9:
+     0,0,0,0,0:
+1000
+0100
+0010
+0001
+;
+"""
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makeSong(title, bpm, charts):
+    return {'title': title, 'subtitle': '', 'artist': 'Artist', 'bpm': bpm, 'charts': charts, 'banner': 'bn.png'}
+
+def makeChart(game, difficulty, rating, stepper="Someone", note=100):
+    return {'note': note, 'hold': 2, 'roll': 1, 'mine': 5, 'difficulty': difficulty, 'rating': rating,
+            'game': game, 'stepper': stepper}
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class SongCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.databasePath = os.path.join(self.tempDirectory.name, "catalog.sqlite")
+        self.catalog = SongCatalog(self.databasePath)
+        self.catalog.addPack("PackA", [makeSong("Slow", [120], {'singleEasy': makeChart('dance-single', 'Easy', 3),
+                                                                'singleHard': makeChart('dance-single', 'Hard', 9, "Other")}),
+                                       makeSong("Changing", [140, 200], {'doubleHard': makeChart('dance-double', 'Hard', 11)})])
+        self.catalog.addPack("PackB", [makeSong("Fast", [180], {'singleHard': makeChart('dance-single', 'Hard', 12)}),
+                                       makeSong("No Bpm", None, {'singleEasy': makeChart('dance-single', 'Easy', 1)})])
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tempDirectory.cleanup()
+
+    def getTitles(self, **filters):
+        return [(chart['pack'], chart['title'], chart['rating']) for chart in self.catalog.queryCharts(**filters)]
+
+    def testSchema(self):
+        schema = {(row['type'], row['name']) for row in self.catalog.connection.execute("SELECT type, name FROM sqlite_master")}
+        for table in ("packs", "songs", "charts"):
+            self.assertIn(('table', table), schema)
+        for index in ("songsPack", "songsBpmMin", "songsBpmMax", "chartsSong", "chartsRating", "chartsGameDifficulty", "chartsStepper"):
+            self.assertIn(('index', index), schema)
+        plan = " ".join(row[3] for row in self.catalog.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM charts WHERE game = ? AND difficulty = ? AND rating >= ?", ('a', 'b', 1)))
+        self.assertIn("chartsGameDifficulty", plan)
+
+    def testCatalogIsWrittenToDisk(self):
+        self.catalog.close()
+        self.catalog = SongCatalog(self.databasePath)
+        self.assertEqual(self.catalog.getPackNames(), ["PackA", "PackB"])
+        connection = sqlite3.connect(self.databasePath)
+        try:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM songs").fetchone()[0], 4)
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM charts").fetchone()[0], 5)
+            self.assertEqual(connection.execute("SELECT bpmMin, bpmMax FROM songs WHERE title = 'Changing'").fetchone(), (140, 200))
+            self.assertEqual(connection.execute("SELECT bpmMin, bpmMax FROM songs WHERE title = 'No Bpm'").fetchone(), (None, None))
+        finally:
+            connection.close()
+
+    def testChartRows(self):
+        chart = self.catalog.queryCharts(pack="PackA", difficulty="Easy")
+        self.assertEqual(chart, [{'difficultyKey': 'singleEasy', 'game': 'dance-single', 'difficulty': 'Easy', 'rating': 3,
+                                  'stepper': 'Someone', 'note': 100, 'hold': 2, 'roll': 1, 'mine': 5, 'title': 'Slow',
+                                  'subtitle': '', 'artist': 'Artist', 'banner': 'bn.png', 'bpmMin': 120, 'bpmMax': 120,
+                                  'pack': 'PackA'}])
+
+    def testFilters(self):
+        self.assertEqual(self.getTitles(), [("PackA", "Changing", 11), ("PackA", "Slow", 3), ("PackA", "Slow", 9),
+                                            ("PackB", "Fast", 12), ("PackB", "No Bpm", 1)])
+        self.assertEqual(self.getTitles(game="dance-double"), [("PackA", "Changing", 11)])
+        self.assertEqual(self.getTitles(game="dance-single", difficulty="Hard"), [("PackA", "Slow", 9), ("PackB", "Fast", 12)])
+        self.assertEqual(self.getTitles(minRating=9, maxRating=11), [("PackA", "Changing", 11), ("PackA", "Slow", 9)])
+        self.assertEqual(self.getTitles(stepper="Other"), [("PackA", "Slow", 9)])
+        self.assertEqual(self.getTitles(pack="PackB"), [("PackB", "Fast", 12), ("PackB", "No Bpm", 1)])
+        self.assertEqual(self.getTitles(limit=2), [("PackA", "Changing", 11), ("PackA", "Slow", 3)])
+        self.assertEqual(self.getTitles(pack="Missing"), [])
+
+    def testBpmFiltersUseTheWholeRange(self):
+        self.assertEqual(self.getTitles(minBpm=150), [("PackB", "Fast", 12)])
+        self.assertEqual(self.getTitles(maxBpm=180), [("PackA", "Slow", 3), ("PackA", "Slow", 9), ("PackB", "Fast", 12)])
+        self.assertEqual(self.getTitles(minBpm=130, maxBpm=200), [("PackA", "Changing", 11), ("PackB", "Fast", 12)])
+
+    def testAddPackReplacesThePack(self):
+        self.catalog.addPack("PackA", [makeSong("Replaced", [100], {'singleBeginner': makeChart('dance-single', 'Beginner', 1)})])
+        self.assertEqual(self.getTitles(pack="PackA"), [("PackA", "Replaced", 1)])
+        self.assertEqual(self.catalog.connection.execute("SELECT COUNT(*) FROM charts").fetchone()[0], 3)
+
+    def testRemovePacksExcept(self):
+        self.catalog.removePacksExcept(["PackB"])
+        self.assertEqual(self.catalog.getPackNames(), ["PackB"])
+        self.assertEqual(self.catalog.connection.execute("SELECT COUNT(*) FROM songs").fetchone()[0], 2)
+        self.assertEqual(self.catalog.connection.execute("SELECT COUNT(*) FROM charts").fetchone()[0], 2)
+
+class CatalogExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.songsDirectory = os.path.join(self.tempDirectory.name, "Songs")
+        self.databasePath = os.path.join(self.tempDirectory.name, "catalog.sqlite")
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeStepfile(self, packName, songFolder):
+        songPath = os.path.join(self.songsDirectory, packName, songFolder)
+        os.makedirs(songPath, exist_ok=True)
+        with open(os.path.join(songPath, songFolder + ".sm"), 'w') as smFile:
+            smFile.write(STEPFILE.format(songFolder))
+
+    def runParse(self):
+        subprocess.run([sys.executable, os.path.join(REPO_DIRECTORY, "parsesongsfolder.py"), "--sqlite", self.databasePath],
+                       input=self.songsDirectory + "\n", cwd=REPO_DIRECTORY, capture_output=True, text=True, check=True)
+        catalog = SongCatalog(self.databasePath)
+        try:
+            return [(chart['pack'], chart['title'], chart['difficultyKey'], chart['note']) for chart in catalog.queryCharts()]
+        finally:
+            catalog.close()
+
+    def testParseWritesTheCatalog(self):
+        self.writeStepfile("PackA", "One")
+        self.writeStepfile("PackA", "Two")
+        self.writeStepfile("PackB", "Three")
+        self.assertEqual(self.runParse(), [("PackA", "One", "singleHard", 4), ("PackA", "Two", "singleHard", 4),
+                                           ("PackB", "Three", "singleHard", 4)])
+
+        # Packs that are gone are dropped from the catalog on the next run.
+        os.remove(os.path.join(self.songsDirectory, "PackB", "Three", "Three.sm"))
+        self.assertEqual(self.runParse(), [("PackA", "One", "singleHard", 4), ("PackA", "Two", "singleHard", 4)])
+
+if __name__ == '__main__':
+    unittest.main()
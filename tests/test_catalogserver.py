@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+
+from containers.catalogserver import CatalogServer
+from containers.serializer import writeJson
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makeCatalog(packSizes):
+    """
+    Returns a combined JSON with packSizes[i] songs in pack 'Pack<i>'. Every
+    song has a dance-single Hard chart rated by its idNum (mod 10) and every
+    other song a dance-double Easy one rated 3.
+    """
+    allPacksJson = {}
+    idNum = 0
+    for packNumber, packSize in enumerate(packSizes):
+        packName = "Pack" + str(packNumber)
+        allPacksJson[packName] = []
+        for songNumber in range(packSize):
+            charts = {'singleHard': {'note': 100, 'difficulty': 'Hard', 'rating': idNum % 10, 'game': 'dance-single'}}
+            if idNum % 2 == 0:
+                charts['doubleEasy'] = {'note': 50, 'difficulty': 'Easy', 'rating': 3, 'game': 'dance-double'}
+            allPacksJson[packName].append({'title': "Song " + str(idNum), 'artist': "Artist", 'pack': packName,
+                                           'charts': charts, 'idNum': idNum})
+            idNum += 1
+    return allPacksJson
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class CatalogServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.catalogPath = os.path.join(self.tempDirectory.name, "allSongPacksJson.json")
+        writeJson(self.catalogPath, makeCatalog([3, 12]))
+        self.server = CatalogServer(self.catalogPath, "127.0.0.1", 0, reloadInterval=0.05)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+        self.tempDirectory.cleanup()
+
+    async def sendRaw(self, requestBytes):
+        """
+        Sends requestBytes and returns everything the server answers until it closes the connection.
+        """
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+        try:
+            writer.write(requestBytes)
+            await writer.drain()
+            return await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+
+    async def request(self, target, method="GET", headers=None):
+        """
+        Returns the status, the headers (names lower-cased) and the decoded JSON body of a request.
+        """
+        lines = [method + " " + target + " HTTP/1.1", "Host: localhost", "Connection: close"]
+        lines.extend(name + ": " + value for name, value in (headers or {}).items())
+        response = await self.sendRaw(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        head, _, body = response.partition(b"\r\n\r\n")
+        headLines = head.decode("latin-1").split("\r\n")
+        responseHeaders = {}
+        for headerLine in headLines[1:]:
+            name, _, value = headerLine.partition(":")
+            responseHeaders[name.strip().lower()] = value.strip()
+        return int(headLines[0].split()[1]), responseHeaders, json.loads(body) if body else None
+
+    async def testStatus(self):
+        status, headers, body = await self.request("/status")
+        self.assertEqual(status, 200)
+        self.assertEqual((body['songs'], body['packs']), (15, 2))
+        self.assertEqual(headers['etag'], '"' + body['version'] + '"')
+
+    async def testPacks(self):
+        status, headers, body = await self.request("/packs")
+        self.assertEqual(body, [{'pack': "Pack0", 'songCount': 3}, {'pack': "Pack1", 'songCount': 12}])
+
+    async def testPackSongsArePaginated(self):
+        status, headers, body = await self.request("/packs/Pack1?page=2&pageSize=5")
+        self.assertEqual(status, 200)
+        self.assertEqual((body['page'], body['pageSize'], body['total']), (2, 5, 12))
+        self.assertEqual([song['idNum'] for song in body['results']], [8, 9, 10, 11, 12])
+        status, headers, body = await self.request("/packs/Pack1?page=3&pageSize=5")
+        self.assertEqual([song['idNum'] for song in body['results']], [13, 14])
+
+    async def testSong(self):
+        status, headers, body = await self.request("/songs/4")
+        self.assertEqual((status, body['title'], body['pack']), (200, "Song 4", "Pack1"))
+
+    async def testChartFilters(self):
+        status, headers, body = await self.request("/charts?game=dance-single&minRating=7&maxRating=8")
+        self.assertEqual(status, 200)
+        self.assertEqual([(chart['idNum'], chart['rating']) for chart in body['results']], [(7, 7), (8, 8)])
+
+        status, headers, body = await self.request("/charts?difficulty=Easy")
+        self.assertEqual(body['total'], 8)
+        self.assertTrue(all(chart['game'] == "dance-double" for chart in body['results']))
+
+        status, headers, body = await self.request("/charts?rating=3&pageSize=100")
+        self.assertEqual(sorted(chart['difficultyKey'] for chart in body['results']), ["doubleEasy"] * 8 + ["singleHard"] * 2)
+        ratings = [chart['rating'] for chart in (await self.request("/charts?pageSize=100"))[2]['results']]
+        self.assertEqual(ratings, sorted(ratings))
+
+    async def testETag(self):
+        status, headers, body = await self.request("/packs")
+        etag = headers['etag']
+        status, headers, body = await self.request("/packs", headers={'If-None-Match': etag})
+        self.assertEqual((status, body), (304, None))
+        self.assertEqual(headers['etag'], etag)
+        status, headers, body = await self.request("/packs", headers={'If-None-Match': '"other", ' + etag})
+        self.assertEqual(status, 304)
+        status, headers, body = await self.request("/packs", headers={'If-None-Match': '"other"'})
+        self.assertEqual(status, 200)
+
+    async def testHead(self):
+        status, headers, body = await self.request("/packs", method="HEAD")
+        self.assertEqual(status, 200)
+        self.assertIsNone(body)
+        self.assertGreater(int(headers['content-length']), 0)
+
+    async def testNotFound(self):
+        for target in ("/nothing", "/packs/NoSuchPack", "/songs/999"):
+            status, headers, body = await self.request(target)
+            self.assertEqual(status, 404, target)
+            self.assertIn('error', body)
+
+    async def testBadRequests(self):
+        for target in ("/songs/abc", "/packs/Pack0?page=0", "/charts?pageSize=x", "/charts?minRating=high"):
+            status, headers, body = await self.request(target)
+            self.assertEqual(status, 400, target)
+        status, headers, body = await self.request("/packs", method="POST")
+        self.assertEqual(status, 405)
+
+    async def testUnreadableRequests(self):
+        for requestBytes in (b"GARBAGE\r\n\r\n",
+                             b"GET /" + b"a" * 70000 + b" HTTP/1.1\r\n\r\n",
+                             b"GET /status HTTP/1.1\r\nX-Long: " + b"a" * 70000 + b"\r\n\r\n",
+                             b"GET /status HTTP/1.1\r\n" + b"X-Header: a\r\n" * 200 + b"\r\n"):
+            response = await self.sendRaw(requestBytes)
+            self.assertTrue(response.startswith(b"HTTP/1.1 400 "), response[:40])
+
+        # The server still answers afterwards.
+        self.assertEqual((await self.request("/status"))[0], 200)
+
+    async def testKeepAlive(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+        try:
+            for target in ("/songs/0", "/songs/1"):
+                writer.write(("GET " + target + " HTTP/1.1\r\nHost: localhost\r\n\r\n").encode("latin-1"))
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+                self.assertTrue(head.startswith(b"HTTP/1.1 200 "))
+                contentLength = [line for line in head.split(b"\r\n") if line.lower().startswith(b"content-length:")][0]
+                body = json.loads(await reader.readexactly(int(contentLength.split(b":")[1])))
+                self.assertEqual(body['title'], "Song " + target[-1])
+        finally:
+            writer.close()
+
+    async def testReload(self):
+        status, headers, body = await self.request("/status")
+        oldVersion = body['version']
+        writeJson(self.catalogPath, makeCatalog([3, 12, 4]))
+        for attempt in range(100):
+            status, headers, body = await self.request("/status")
+            if body['version'] != oldVersion:
+                break
+            await asyncio.sleep(0.05)
+        self.assertEqual((body['songs'], body['packs']), (19, 3))
+        self.assertEqual(headers['etag'], '"' + body['version'] + '"')
+
+        # A broken catalog keeps the last one in use.
+        with open(self.catalogPath, 'w') as catalogFile:
+            catalogFile.write("{broken")
+        await asyncio.sleep(0.3)
+        status, headers, body = await self.request("/status")
+        self.assertEqual((status, body['songs']), (200, 19))
+
+class CatalogNotLoadedTest(unittest.TestCase):
+
+    def testServiceUnavailable(self):
+        with tempfile.TemporaryDirectory() as tempDirectory:
+            server = CatalogServer(os.path.join(tempDirectory, "missing.json"), "127.0.0.1", 0)
+            self.assertEqual(server.route("GET", "/status", server.index)[0], 503)
+
+if __name__ == '__main__':
+    unittest.main()
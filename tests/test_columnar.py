@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+
+from containers.columnar import ColumnarCatalogBuilder, loadColumnarCatalog
+import os
+import tempfile
+import unittest
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makeSong(idNum, title, bpm, charts):
+    return {'title': title, 'subtitle': '', 'artist': 'Artist', 'bpm': bpm, 'charts': charts, 'pack': 'Pack',
+            'banner': 'none.png', 'folder': title, 'encoding': None, 'bannerFile': None, 'music': None,
+            'bannerInfo': None, 'musicInfo': None, 'idNum': idNum}
+
+def makeChart(note, difficulty, rating, chartId=None, analytics=True):
+    chart = {'note': note, 'hold': 2, 'roll': 0, 'mine': 5, 'difficulty': difficulty, 'rating': rating,
+             'game': 'dance-single', 'stepper': 'Someone', 'length': 95.25, 'peakNps': 7.5,
+             'streamMeasures': 12, 'breakMeasures': 3, 'breakdown': "4 (2) 8"}
+    if not analytics:
+        chart.update({'length': None, 'peakNps': None, 'streamMeasures': None, 'breakMeasures': None, 'breakdown': None})
+    if chartId is not None:
+        chart['chartId'] = chartId
+    return chart
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ColumnarCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.catalogPath = os.path.join(self.tempDirectory.name, "catalog.bin")
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeCatalog(self, songs):
+        builder = ColumnarCatalogBuilder()
+        for song in songs:
+            builder.addSong(song)
+        builder.write(self.catalogPath)
+        return loadColumnarCatalog(self.catalogPath)
+
+    def testSongsRoundTrip(self):
+        songs = [makeSong(0, "One", [150], {'singleHard': makeChart(300, 'Hard', 9, 0),
+                                            'singleEasy': makeChart(100, 'Easy', 3, 1)}),
+                 makeSong(1, "Two", [120, 240], {}),
+                 makeSong(2, "Three", None, {'doubleChallenge': makeChart(700, 'Challenge', 14),
+                                             'doubleEasy': makeChart(70, 'Easy', 2, analytics=False)})]
+        songs[0].update({'encoding': 'cp1252', 'bannerFile': '../bn.png', 'music': 'song.ogg',
+                         'bannerInfo': {'file': '../bn.png', 'exists': True, 'format': 'png', 'width': 418, 'height': 164},
+                         'musicInfo': {'file': 'song.ogg', 'exists': False, 'duration': None}})
+        catalog = self.writeCatalog(songs)
+        try:
+            self.assertEqual((catalog.songCount, catalog.chartCount), (3, 4))
+            for row, song in enumerate(songs):
+                self.assertEqual(catalog.getSong(row), song)
+        finally:
+            catalog.close()
+
+    def testChartsWithoutAnalytics(self):
+        catalog = self.writeCatalog([makeSong(0, "One", [150], {'singleHard': makeChart(300, 'Hard', 9, analytics=False),
+                                                                'singleEasy': makeChart(0, 'Easy', 1)})])
+        try:
+            charts = catalog.getSong(0)['charts']
+            self.assertIsNone(charts['singleHard']['length'])
+            self.assertIsNone(charts['singleHard']['breakdown'])
+            self.assertEqual(charts['singleEasy']['streamMeasures'], 12)
+        finally:
+            catalog.close()
+
+    def testBpmKeepsItsType(self):
+        catalog = self.writeCatalog([makeSong(0, "Ints", [120, 240], {}), makeSong(1, "Floats", [120.5], {}),
+                                     makeSong(2, "None", None, {})])
+        try:
+            self.assertEqual([type(value) for value in catalog.getSong(0)['bpm']], [int, int])
+            self.assertEqual(catalog.getSong(1)['bpm'], [120.5])
+            self.assertIsNone(catalog.getSong(2)['bpm'])
+        finally:
+            catalog.close()
+
+    def testQueryColumns(self):
+        catalog = self.writeCatalog([makeSong(5, "One", [150], {'singleHard': makeChart(300, 'Hard', 9)}),
+                                     makeSong(6, "Two", [120, 240], {'singleHard': makeChart(400, 'Hard', 11)})])
+        try:
+            self.assertEqual(list(catalog.getColumn('idNum')), [5, 6])
+            self.assertEqual(list(catalog.getColumn('bpmMax')), [150.0, 240.0])
+            self.assertEqual(list(catalog.getColumn('rating')), [9, 11])
+            self.assertEqual(catalog.getStrings('title'), ["One", "Two"])
+        finally:
+            catalog.close()
+
+if __name__ == '__main__':
+    unittest.main()
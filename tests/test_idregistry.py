@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+
+from containers.idregistry import IdRegistry
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makeSong(packName, folder, charts=None):
+    if charts is None:
+        charts = {'singleHard': {'note': 100, 'difficulty': 'Hard', 'rating': '9'}}
+    return {'title': folder, 'subtitle': '', 'artist': 'Artist', 'bpm': [150], 'charts': charts,
+            'pack': packName, 'banner': 'none.png', 'folder': folder}
+
+def runRegistry(registryPath, songs, packNames=None):
+    """
+    Numbers the songs with the registry at registryPath like one run of
+    combinejsons.py (or of watch mode, with packNames) and returns the delta.
+    """
+    registry = IdRegistry(registryPath)
+    registry.load()
+    for song in songs:
+        registry.assignIds(song)
+    delta = registry.finishRun(packNames)
+    registry.save()
+    return delta
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class IdRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.registryPath = os.path.join(self.tempDirectory.name, "registry.json")
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def testIdsAreStableAcrossRuns(self):
+        firstSongs = [makeSong("PackA", "One"), makeSong("PackA", "Two"), makeSong("PackB", "Three")]
+        runRegistry(self.registryPath, firstSongs)
+
+        # Same songs in another order, with a new one in front.
+        secondSongs = [makeSong("PackC", "New"), makeSong("PackB", "Three"), makeSong("PackA", "Two"), makeSong("PackA", "One")]
+        runRegistry(self.registryPath, secondSongs)
+        firstIds = {song['folder']: (song['idNum'], song['charts']['singleHard']['chartId']) for song in firstSongs}
+        for song in secondSongs[1:]:
+            self.assertEqual((song['idNum'], song['charts']['singleHard']['chartId']), firstIds[song['folder']])
+        self.assertNotIn(secondSongs[0]['idNum'], [idNum for idNum, chartId in firstIds.values()])
+
+    def testRemovedIdsAreNotReused(self):
+        songs = [makeSong("PackA", "One"), makeSong("PackA", "Two")]
+        runRegistry(self.registryPath, songs)
+        newSong = makeSong("PackA", "Three")
+        runRegistry(self.registryPath, [songs[0], newSong])
+        self.assertEqual(newSong['idNum'], 2)
+
+    def testDelta(self):
+        runRegistry(self.registryPath, [makeSong("PackA", "One"), makeSong("PackA", "Two")])
+        changed = makeSong("PackA", "One", {'singleHard': {'note': 101, 'difficulty': 'Hard', 'rating': '9'},
+                                            'singleEasy': {'note': 20, 'difficulty': 'Easy', 'rating': '3'}})
+        delta = runRegistry(self.registryPath, [changed])
+        self.assertEqual([row['difficultyKey'] for row in delta['added']], ['singleEasy'])
+        self.assertEqual([row['note'] for row in delta['changed']], [101])
+        self.assertEqual([(row['folder'], row['difficultyKey']) for row in delta['removed']], [('Two', 'singleHard')])
+
+        delta = runRegistry(self.registryPath, [changed])
+        self.assertEqual(delta, {'added': [], 'changed': [], 'removed': []})
+
+    def testSongsWithoutFolderAreRefused(self):
+        registry = IdRegistry(self.registryPath)
+        for song in ({'title': "Old", 'pack': "PackA", 'charts': {}}, {'title': "Old", 'folder': "Old", 'charts': {}}):
+            with self.assertRaises(ValueError):
+                registry.assignIds(song)
+            self.assertNotIn('idNum', song)
+        self.assertEqual((registry.songs, registry.nextSongId), ({}, 0))
+
+    def testFinishRunOnlyDropsTheGivenPacks(self):
+        songs = [makeSong("PackA", "One"), makeSong("PackB", "Two"), makeSong("PackB", "Three")]
+        runRegistry(self.registryPath, songs)
+
+        # Watch mode only renumbers PackB, and Three was removed from it.
+        delta = runRegistry(self.registryPath, [makeSong("PackB", "Two")], ["PackB"])
+        self.assertEqual([row['folder'] for row in delta['removed']], ['Three'])
+        song = makeSong("PackA", "One")
+        runRegistry(self.registryPath, [song])
+        self.assertEqual(song['idNum'], songs[0]['idNum'])
+
+class CombineRegistryTest(unittest.TestCase):
+    """
+    A combine that fails halfway must leave the registry as it was, or the
+    packs that weren't read yet would come back with new Id's.
+    """
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.jsonsDirectory = os.path.join(self.tempDirectory.name, "jsons")
+        self.registryPath = os.path.join(self.tempDirectory.name, "registry.json")
+        os.makedirs(self.jsonsDirectory)
+        for packName in ("PackA", "PackB"):
+            with open(os.path.join(self.jsonsDirectory, packName + ".json"), 'w', encoding="utf-8") as jsonFile:
+                json.dump([makeSong(packName, "One"), makeSong(packName, "Two")], jsonFile)
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def runCombine(self, *options):
+        return subprocess.run([sys.executable, os.path.join(REPO_DIRECTORY, "combinejsons.py"),
+                               "--registry", self.registryPath] + list(options),
+                              input=self.jsonsDirectory + "\n", cwd=self.tempDirectory.name,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+    def assertFailedCombineKeepsRegistry(self, packJson, *options):
+        self.assertEqual(self.runCombine(*options).returncode, 0)
+        with open(self.registryPath, 'rb') as registryFile:
+            registryBytes = registryFile.read()
+
+        with open(os.path.join(self.jsonsDirectory, "PackB.json"), 'w', encoding="utf-8") as jsonFile:
+            jsonFile.write(packJson)
+        self.assertEqual(self.runCombine(*options).returncode, 1)
+        with open(self.registryPath, 'rb') as registryFile:
+            self.assertEqual(registryFile.read(), registryBytes)
+
+    def testFailedCombineKeepsRegistry(self):
+        self.assertFailedCombineKeepsRegistry("[{")
+
+    def testFailedStreamingCombineKeepsRegistry(self):
+        self.assertFailedCombineKeepsRegistry("[{", "--stream")
+
+    def getPackWithoutFolders(self):
+        songs = [makeSong("PackB", "One"), makeSong("PackB", "Two")]
+        for song in songs:
+            del song['folder']
+        return json.dumps(songs)
+
+    def testPackWithoutFoldersFailsCombine(self):
+        self.assertFailedCombineKeepsRegistry(self.getPackWithoutFolders())
+
+    def testPackWithoutFoldersFailsStreamingCombine(self):
+        self.assertFailedCombineKeepsRegistry(self.getPackWithoutFolders(), "--stream")
+
+if __name__ == '__main__':
+    unittest.main()
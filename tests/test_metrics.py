@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+from containers import metrics
+from containers.metrics import SLOWEST_COUNT, RunMetrics, StageClock, enableStageProfiling, getPercentile, writeStageProfiles
+from containers.serializer import readJson
+import os
+import sys
+import pstats
+import tempfile
+import subprocess
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class PercentileTest(unittest.TestCase):
+
+    def testNearestRank(self):
+        sortedTimes = list(range(1, 11))
+        self.assertEqual(getPercentile(sortedTimes, 50), 5)
+        self.assertEqual(getPercentile(sortedTimes, 95), 10)
+        self.assertEqual(getPercentile(sortedTimes, 0), 1)
+        self.assertEqual(getPercentile(sortedTimes, 100), 10)
+        self.assertEqual(getPercentile(list(range(1, 101)), 95), 95)
+
+    def testSingleTime(self):
+        for percent in (0, 50, 95, 100):
+            self.assertEqual(getPercentile([0.25], percent), 0.25)
+
+class StageClockTest(unittest.TestCase):
+
+    def testStagesAddUp(self):
+        clock = StageClock()
+        with mock.patch("containers.metrics.time.perf_counter", side_effect=[1.0, 1.5, 2.0, 4.0, 4.25]):
+            clock.switch('header')
+            clock.switch('charts')
+            clock.switch('header')
+            clock.switch('charts')
+            clock.switch()
+        self.assertEqual(clock.timings, {'header': 2.5, 'charts': 0.75})
+        self.assertIsNone(clock.stage)
+
+class RunMetricsTest(unittest.TestCase):
+
+    def testSlowestKeepsTheSlowestFiles(self):
+        runMetrics = RunMetrics()
+        for fileNumber in range(SLOWEST_COUNT * 3):
+            seconds = (fileNumber * 7 % (SLOWEST_COUNT * 3)) / 1000.0
+            runMetrics.addTime('charts', seconds, "Pack", "file" + str(fileNumber))
+        slowest = runMetrics.getReport()['slowest']['charts']
+        self.assertEqual(len(slowest), SLOWEST_COUNT)
+        self.assertEqual([entry['ms'] for entry in slowest], [float(ms) for ms in range(SLOWEST_COUNT * 3 - 1, SLOWEST_COUNT * 2 - 1, -1)])
+        self.assertEqual(len(runMetrics.stageTimes['charts']), SLOWEST_COUNT * 3)
+
+    def testPackTimeIsTheFileKeyWithoutFile(self):
+        runMetrics = RunMetrics()
+        runMetrics.addTime('discovery', 0.5, "Pack")
+        runMetrics.addTime('discovery', 0.25)
+        self.assertEqual(runMetrics.getReport()['slowest'], {'discovery': [{'file': "Pack", 'ms': 500.0}]})
+        self.assertEqual(runMetrics.getStageSummaries()['discovery']['count'], 2)
+
+    def testReportShape(self):
+        runMetrics = RunMetrics()
+        runMetrics.addStepfile(SimpleNamespace(timings={'read': 0.001, 'header': 0.002, 'charts': 0.004},
+                                               packName="Small", stepfilePath="Small/a.sm"))
+        runMetrics.addStepfile(SimpleNamespace(timings={'read': 0.003, 'header': 0.01, 'charts': 0.02},
+                                               packName="Big", stepfilePath="Big/b.sm"))
+        runMetrics.addStepfile(SimpleNamespace(timings={}, packName="Big", stepfilePath="Big/cached.sm"))
+        runMetrics.addTime('serialization', 0.05, "Big", "jsons/Big.json")
+        runMetrics.addTime('custom', 0.001)
+        report = runMetrics.getReport()
+
+        self.assertEqual(sorted(report), ['packs', 'slowest', 'stages', 'wallSeconds'])
+        self.assertEqual(list(report['stages']), ['read', 'header', 'charts', 'serialization', 'custom'])
+        self.assertEqual(report['stages']['charts'], {'count': 2, 'total': 0.024, 'p50Ms': 4.0, 'p95Ms': 20.0, 'maxMs': 20.0})
+        self.assertEqual(report['packs'], [{'pack': "Big", 'total': 0.083,
+                                            'stages': {'read': 0.003, 'header': 0.01, 'charts': 0.02, 'serialization': 0.05}},
+                                           {'pack': "Small", 'total': 0.007,
+                                            'stages': {'read': 0.001, 'header': 0.002, 'charts': 0.004}}])
+        self.assertEqual(report['slowest']['header'], [{'file': "Big/b.sm", 'ms': 10.0}, {'file': "Small/a.sm", 'ms': 2.0}])
+        self.assertNotIn('custom', report['slowest'])
+        self.assertIn("- charts: 2 x, total 0.024s, p50 4.0ms, p95 20.0ms, max 20.0ms", str(runMetrics))
+
+        with tempfile.TemporaryDirectory() as reportDirectory:
+            reportPath = os.path.join(reportDirectory, "metrics.json")
+            runMetrics.writeReport(reportPath)
+            writtenReport = readJson(reportPath)
+        self.assertEqual({key: value for key, value in writtenReport.items() if key != 'wallSeconds'},
+                         {key: value for key, value in report.items() if key != 'wallSeconds'})
+
+class StageProfilingTest(unittest.TestCase):
+
+    def testProfilesAreWrittenPerStage(self):
+        with mock.patch.object(metrics, 'stageProfilers', None), tempfile.TemporaryDirectory() as profileDirectory:
+            self.assertEqual(writeStageProfiles(profileDirectory), [])
+            enableStageProfiling()
+            clock = StageClock()
+            clock.switch('header')
+            sorted(range(1000))
+            clock.switch('charts')
+            sum(range(1000))
+            clock.switch()
+            profilePaths = writeStageProfiles(os.path.join(profileDirectory, "profiles"))
+            self.assertEqual([os.path.basename(profilePath) for profilePath in profilePaths], ["charts.pstats", "header.pstats"])
+            for profilePath in profilePaths:
+                self.assertGreater(pstats.Stats(profilePath).total_calls, 0)
+
+    def testProfileIsRefusedWithJobs(self):
+        result = subprocess.run([sys.executable, os.path.join(REPO_DIRECTORY, "parsesongsfolder.py"), "--profile", "profiles",
+                                 "--jobs", "2"], input="", cwd=REPO_DIRECTORY, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--profile can't be used with --jobs", result.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+
+from containers.packbuild import addPackOptions, getEncodings
+from containers.songpack import SongPack
+from containers.stepfile import DEFAULT_ENCODINGS
+import io
+import os
+import argparse
+import tempfile
+import contextlib
+import unittest
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class GetEncodingsTest(unittest.TestCase):
+
+    def getEncodings(self, *arguments):
+        parser = argparse.ArgumentParser()
+        addPackOptions(parser)
+        return getEncodings(parser, parser.parse_args(arguments))
+
+    def assertParserError(self, *arguments):
+        errorOutput = io.StringIO()
+        with contextlib.redirect_stderr(errorOutput), self.assertRaises(SystemExit):
+            self.getEncodings(*arguments)
+        return errorOutput.getvalue()
+
+    def testDefault(self):
+        self.assertEqual(self.getEncodings(), DEFAULT_ENCODINGS)
+
+    def testOverride(self):
+        self.assertEqual(self.getEncodings("--encodings", "shift_jis, cp1252"), ('shift_jis', 'cp1252'))
+        self.assertEqual(self.getEncodings("--encodings", "utf-8,,"), ('utf-8',))
+
+    def testUnknownEncoding(self):
+        self.assertIn("Unknown encoding in --encodings", self.assertParserError("--encodings", "utf-8,klingon"))
+
+    def testNoEncodings(self):
+        self.assertIn("--encodings needs at least one encoding", self.assertParserError("--encodings", " , "))
+
+    def testOverrideReachesTheParse(self):
+        with tempfile.TemporaryDirectory() as packPath:
+            os.makedirs(os.path.join(packPath, "Song"))
+            with open(os.path.join(packPath, "Song", "song.sm"), 'wb') as smFile:
+                smFile.write("#TITLE:さくら;\n#SUBTITLE:;\n#ARTIST:Artist;\n#BANNER:bn.png;\n#BPMS:0=150;\n".encode("cp932"))
+            songs = []
+            for arguments in ((), ("--encodings", "cp1252")):
+                pack = SongPack(packPath, self.getEncodings(*arguments))
+                pack.retrieveSongFolders()
+                pack.constructStepfiles()
+                pack.parseStepfiles()
+                songs.append((pack.getSongs()[0]['title'], pack.getSongs()[0]['encoding']))
+            self.assertEqual(songs, [("さくら", 'cp932'), ("‚³‚\xad‚ç", 'cp1252')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+from containers.packwriter import PackWriter
+from containers.metrics import RunMetrics
+from containers.serializer import readJson, writeJson
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class PackWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.jsonsDir = self.tempDirectory.name
+
+        # Every write waits for the gate, so the test decides when the writer thread catches up.
+        self.gate = threading.Event()
+        self.writing = threading.Event()
+        def gatedWriteJson(*args, **kwargs):
+            self.writing.set()
+            self.assertTrue(self.gate.wait(5))
+            return writeJson(*args, **kwargs)
+        self.patcher = mock.patch("containers.packwriter.writeJson", gatedWriteJson)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.gate.set()
+        self.patcher.stop()
+        self.tempDirectory.cleanup()
+
+    def makeSongs(self, packName):
+        return [{'title': packName + " song", 'pack': packName}]
+
+    def testSubmitBlocksWhenTheQueueIsFull(self):
+        writer = PackWriter(self.jsonsDir, queueDepth=2)
+        writer.submit("Pack0", self.makeSongs("Pack0"))
+        self.assertTrue(self.writing.wait(5))
+        writer.submit("Pack1", self.makeSongs("Pack1"))
+        writer.submit("Pack2", self.makeSongs("Pack2"))
+
+        # One pack is being written and two wait in the queue, so the next submit has to wait.
+        submitter = threading.Thread(target=writer.submit, args=("Pack3", self.makeSongs("Pack3")))
+        submitter.start()
+        submitter.join(0.2)
+        self.assertTrue(submitter.is_alive())
+        self.assertEqual(writer.written, [])
+
+        self.gate.set()
+        submitter.join(5)
+        self.assertFalse(submitter.is_alive())
+        writer.close()
+        self.assertEqual([packName for packName, signature in writer.written], ["Pack0", "Pack1", "Pack2", "Pack3"])
+
+    def testCloseWritesEveryQueuedPack(self):
+        metrics = RunMetrics()
+        writer = PackWriter(self.jsonsDir, queueDepth=8, metrics=metrics)
+        for packNumber in range(6):
+            packName = "Pack" + str(packNumber)
+            writer.submit(packName, self.makeSongs(packName), "signature" + str(packNumber))
+        self.assertEqual(writer.written, [])
+        self.gate.set()
+        writer.close()
+        self.assertFalse(writer.thread.is_alive())
+        self.assertEqual(writer.written, [("Pack" + str(packNumber), "signature" + str(packNumber)) for packNumber in range(6)])
+        for packNumber in range(6):
+            packName = "Pack" + str(packNumber)
+            self.assertEqual(readJson(writer.getPackJsonPath(packName)), self.makeSongs(packName))
+        self.assertEqual(writer.bytesWritten, sum(os.path.getsize(writer.getPackJsonPath("Pack" + str(packNumber)))
+                                                  for packNumber in range(6)))
+        self.assertEqual(len(metrics.stageTimes['serialization']), 6)
+
+        # Closing again doesn't wait on a thread that is gone.
+        writer.close()
+
+    def testContextManagerCloses(self):
+        self.gate.set()
+        with PackWriter(self.jsonsDir, compression="gzip") as writer:
+            writer.submit("Pack", self.makeSongs("Pack"))
+        self.assertTrue(writer.getPackJsonPath("Pack").endswith(".json.gz"))
+        self.assertEqual(readJson(writer.getPackJsonPath("Pack")), self.makeSongs("Pack"))
+
+    def testWriteErrorsReachTheCaller(self):
+        self.gate.set()
+        writer = PackWriter(self.jsonsDir)
+        writer.submit("Missing" + os.sep + "Pack", self.makeSongs("Missing"))
+        writer.submit("Unserializable", [{'title': {"a set"}}])
+        writer.submit("Pack", self.makeSongs("Pack"))
+        writer.close()
+
+        # The writer thread keeps going after a failed pack and reports it in failed.
+        self.assertEqual(writer.written, [("Pack", None)])
+        self.assertEqual([packName for packName, error in writer.failed], ["Missing" + os.sep + "Pack", "Unserializable"])
+        self.assertTrue(writer.failed[0][1].startswith("FileNotFoundError: "))
+        self.assertFalse(os.path.exists(writer.getPackJsonPath("Unserializable")))
+        self.assertEqual(os.listdir(self.jsonsDir), ["Pack.json"])
+
+if __name__ == '__main__':
+    unittest.main()
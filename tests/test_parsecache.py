@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+from containers.parsecache import CACHE_VERSION, ParseCache, getParseKey, hashFile
+from containers.serializer import readJson, writeJson
+from containers.songpack import SongPack
+import os
+import tempfile
+import unittest
+
+DEFAULT_KEY = getParseKey(["utf-8", "cp1252"])
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ParseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.cachePath = os.path.join(self.tempDirectory.name, "parsecache.json")
+        self.stepfilePath = os.path.join(self.tempDirectory.name, "song.sm")
+        self.writeStepfile("#TITLE:Song;", 1000000000)
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeStepfile(self, contents, mtimeNs):
+        with open(self.stepfilePath, 'w') as smFile:
+            smFile.write(contents)
+        os.utime(self.stepfilePath, ns=(mtimeNs, mtimeNs))
+
+    def makeCache(self, useHash=False, parseKey=DEFAULT_KEY):
+        cache = ParseCache(self.cachePath, useHash, parseKey)
+        cache.load()
+        return cache
+
+    def storeSong(self, useHash=False, parseKey=DEFAULT_KEY):
+        cache = self.makeCache(useHash, parseKey)
+        self.assertIsNone(cache.getSongDict(self.stepfilePath))
+        cache.putSongDict(self.stepfilePath, {'title': "Song"})
+        cache.save()
+
+    def testHitAfterSaveAndLoad(self):
+        self.storeSong()
+        cache = self.makeCache()
+        self.assertEqual(cache.getSongDict(self.stepfilePath), {'title': "Song"})
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def testSizeChangeIsAMiss(self):
+        self.storeSong(useHash=True)
+        self.writeStepfile("#TITLE:Longer song;", 1000000000)
+        cache = self.makeCache(useHash=True)
+        self.assertIsNone(cache.getSongDict(self.stepfilePath))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def testMtimeChangeIsAMissWithoutHash(self):
+        self.storeSong()
+        self.writeStepfile("#TITLE:Song;", 2000000000)
+        self.assertIsNone(self.makeCache().getSongDict(self.stepfilePath))
+
+    def testTouchedFileIsAHitWithHash(self):
+        self.storeSong(useHash=True)
+        self.writeStepfile("#TITLE:Song;", 2000000000)
+        cache = self.makeCache(useHash=True)
+        self.assertEqual(cache.getSongDict(self.stepfilePath), {'title': "Song"})
+        self.assertEqual(cache.songs[self.stepfilePath]['mtime_ns'], 2000000000)
+
+    def testSameSizeNewContentsIsAMissWithHash(self):
+        self.storeSong(useHash=True)
+        self.writeStepfile("#TITLE:Sang;", 2000000000)
+        cache = self.makeCache(useHash=True)
+        self.assertNotEqual(cache.songs[self.stepfilePath]['hash'], hashFile(self.stepfilePath))
+        self.assertIsNone(cache.getSongDict(self.stepfilePath))
+
+    def testOtherParseOptionsAreAMiss(self):
+        self.assertNotEqual(getParseKey(["utf-8"]), getParseKey(["utf-8", "cp1252"]))
+        self.assertNotEqual(getParseKey(["utf-8"], True), getParseKey(["utf-8"], False))
+        self.assertEqual(getParseKey(("utf-8",), True), getParseKey(["utf-8"], True))
+        self.storeSong()
+        self.assertIsNone(self.makeCache(parseKey=getParseKey(["shift_jis"])).getSongDict(self.stepfilePath))
+        self.assertIsNone(self.makeCache(parseKey=getParseKey(["utf-8", "cp1252"], True)).getSongDict(self.stepfilePath))
+        self.assertIsNotNone(self.makeCache().getSongDict(self.stepfilePath))
+
+    def testOldCacheVersionIsThrownAway(self):
+        self.storeSong()
+        manifest = readJson(self.cachePath)
+        manifest['version'] = CACHE_VERSION - 1
+        writeJson(self.cachePath, manifest)
+        cache = self.makeCache()
+        self.assertEqual((cache.songs, cache.packs), ({}, {}))
+        self.assertIsNone(cache.getSongDict(self.stepfilePath))
+
+    def testBrokenOrMissingCacheStartsEmpty(self):
+        self.assertEqual(self.makeCache().songs, {})
+        with open(self.cachePath, 'w') as cacheFile:
+            cacheFile.write("{not json")
+        self.assertEqual(self.makeCache().songs, {})
+
+    def testSavePrunesUnseenSongs(self):
+        self.storeSong()
+        cache = self.makeCache()
+        cache.save(prune=False)
+        self.assertIn(self.stepfilePath, self.makeCache().songs)
+        cache.save()
+        self.assertEqual(self.makeCache().songs, {})
+
+    def testPackSignature(self):
+        self.storeSong()
+        cache = self.makeCache()
+        signature = cache.getPackSignature([self.stepfilePath], "options")
+        self.assertEqual(cache.getPackSignature([self.stepfilePath], "options"), signature)
+        self.assertNotEqual(cache.getPackSignature([self.stepfilePath], "other options"), signature)
+        cache.setPackSignature("Pack", signature)
+        cache.save()
+
+        cache = self.makeCache()
+        self.assertTrue(cache.isPackUnchanged("Pack", signature))
+        self.writeStepfile("#TITLE:Song;", 2000000000)
+        self.assertIsNone(cache.getSongDict(self.stepfilePath))
+        cache.putSongDict(self.stepfilePath, {'title': "Song"})
+        self.assertFalse(cache.isPackUnchanged("Pack", cache.getPackSignature([self.stepfilePath], "options")))
+
+class SongPackCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.packPath = os.path.join(self.tempDirectory.name, "Pack")
+        self.cachePath = os.path.join(self.tempDirectory.name, "parsecache.json")
+        self.stepfilePath = os.path.join(self.packPath, "Song", "Song.sm")
+        os.makedirs(os.path.dirname(self.stepfilePath))
+        self.writeStepfile("Title", 1000000000)
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeStepfile(self, title, mtimeNs):
+        with open(self.stepfilePath, 'w') as smFile:
+            smFile.write("#TITLE:{0};\n#SUBTITLE:;\n#ARTIST:Artist;\n#BANNER:bn.png;\n#BPMS:0.000=150.000;\n".format(title))
+        os.utime(self.stepfilePath, ns=(mtimeNs, mtimeNs))
+
+    def parsePack(self, useHash=False):
+        cache = ParseCache(self.cachePath, useHash, DEFAULT_KEY)
+        cache.load()
+        pack = SongPack(self.packPath)
+        pack.retrieveSongFolders()
+        pack.constructStepfiles()
+        pack.parseStepfiles(cache=cache)
+        cache.save()
+        return pack.getSongs()[0], cache
+
+    def testUnchangedSongComesFromCache(self):
+        song, cache = self.parsePack()
+        self.assertEqual((song['title'], cache.misses), ("Title", 1))
+        cachedSong, cache = self.parsePack()
+        self.assertEqual((cachedSong, cache.hits, cache.misses), (song, 1, 0))
+
+    def testEditedSongIsParsedAgain(self):
+        for useHash in (False, True):
+            self.writeStepfile("Title", 1000000000)
+            self.parsePack(useHash)
+            self.writeStepfile("Eltit", 2000000000)
+            song, cache = self.parsePack(useHash)
+            self.assertEqual((song['title'], cache.hits), ("Eltit", 0))
+
+if __name__ == '__main__':
+    unittest.main()
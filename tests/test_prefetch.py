@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+from containers.prefetch import Prefetcher
+from containers.songpack import discoverSongPacks
+from containers.serializer import dumpsJson
+import os
+import time
+import random
+import tempfile
+import threading
+import unittest
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class CountingPrefetcher(Prefetcher):
+    """
+    A Prefetcher that counts the reads it starts. Each read sleeps for a
+    moment first, longest for the first files, so reads finish out of order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = 0
+        self.countLock = threading.Lock()
+
+    def readFile(self, filePath):
+        with self.countLock:
+            self.started += 1
+            delay = 0.002 * max(10 - self.started, 0)
+        time.sleep(delay)
+        return super().readFile(filePath)
+
+    def waitForBufferedBytes(self, bufferedBytes):
+        deadline = time.time() + 5
+        while self.bufferedBytes != bufferedBytes and time.time() < deadline:
+            time.sleep(0.001)
+
+class PrefetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.filePaths = []
+        for fileNumber in range(10):
+            self.filePaths.append(self.writeFile("file" + str(fileNumber), bytes([fileNumber]) * 100))
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeFile(self, fileName, contents):
+        filePath = os.path.join(self.tempDirectory.name, fileName)
+        with open(filePath, 'wb') as outFile:
+            outFile.write(contents)
+        return filePath
+
+    def testFilesComeInOrder(self):
+        for depth in (1, 3, 16):
+            prefetcher = CountingPrefetcher(self.filePaths, depth)
+            self.assertEqual(list(prefetcher), [(filePath, bytes([fileNumber]) * 100, None)
+                                                for fileNumber, filePath in enumerate(self.filePaths)])
+            self.assertEqual((prefetcher.started, prefetcher.bufferedBytes), (10, 0))
+
+    def testDepthLimit(self):
+        prefetcher = CountingPrefetcher(self.filePaths, depth=3)
+        for fileNumber, (filePath, data, error) in enumerate(prefetcher):
+            # The file being used plus the ones read ahead never go past the depth.
+            self.assertLessEqual(prefetcher.started - fileNumber, 3)
+            if fileNumber == 0:
+                self.assertEqual(prefetcher.started, 3)
+
+    def testByteBudget(self):
+        prefetcher = CountingPrefetcher(self.filePaths, depth=4, byteBudget=250)
+        startedAtYield = []
+        for fileNumber, (filePath, data, error) in enumerate(prefetcher):
+            startedAtYield.append(prefetcher.started)
+            prefetcher.waitForBufferedBytes(100 * (prefetcher.started - fileNumber - 1))
+
+        # The depth alone would start a fifth read once the first file is handed out,
+        # but the three files waiting are over the budget.
+        self.assertEqual(startedAtYield[:2], [4, 4])
+        self.assertEqual(prefetcher.bufferedBytes, 0)
+
+    def testFileBiggerThanTheBudgetGetsThrough(self):
+        prefetcher = Prefetcher(self.filePaths, depth=4, byteBudget=10)
+        self.assertEqual([len(data) for filePath, data, error in prefetcher], [100] * 10)
+
+    def testReadErrorsArePassedOn(self):
+        missingPath = os.path.join(self.tempDirectory.name, "missing")
+        filePaths = self.filePaths[:2] + [missingPath] + self.filePaths[2:]
+        results = list(Prefetcher(filePaths, depth=4))
+        self.assertEqual([filePath for filePath, data, error in results], filePaths)
+        filePath, data, error = results[2]
+        self.assertIsNone(data)
+        self.assertTrue(error.startswith("FileNotFoundError: "))
+        self.assertTrue(all(error is None for filePath, data, error in results[:2] + results[3:]))
+
+    def testStoppingEarly(self):
+        prefetcher = CountingPrefetcher(self.filePaths, depth=2)
+        for filePath, data, error in prefetcher:
+            break
+        self.assertLessEqual(prefetcher.started, 3)
+
+class ReadAheadParseTest(unittest.TestCase):
+
+    def testReadAheadGivesTheSameSongs(self):
+        with tempfile.TemporaryDirectory() as songsDirectory:
+            songOrder = list(range(12))
+            random.Random(4).shuffle(songOrder)
+            for songNumber in songOrder:
+                songPath = os.path.join(songsDirectory, "Pack", "Song" + str(songNumber))
+                os.makedirs(songPath)
+                with open(os.path.join(songPath, "song.sm"), 'w') as smFile:
+                    smFile.write("#TITLE:Song {0};\n#SUBTITLE:;\n#ARTIST:Artist;\n#BANNER:bn.png;\n#BPMS:0.000={1};\n"
+                                 .format(songNumber, 100 + songNumber))
+            packSongs = []
+            for readAhead, readAheadBytes in ((0, 0), (4, 1 << 20), (4, 100)):
+                pack = discoverSongPacks(songsDirectory)[0]
+                pack.parseStepfiles(readAhead=readAhead, readAheadBytes=readAheadBytes)
+                packSongs.append(dumpsJson(pack.getSongs()))
+            self.assertEqual(packSongs[1], packSongs[0])
+            self.assertEqual(packSongs[2], packSongs[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+from containers.searchindex import SearchIndexBuilder, loadSearchIndex, normalizeText
+import os
+import tempfile
+import unittest
+
+SONGS = [{'idNum': 0, 'title': 'Dreamer', 'subtitle': '', 'artist': 'The Band', 'pack': 'Pack One',
+          'folder': 'Dreamer [Someone]'},
+         {'idNum': 1, 'title': 'Café Remix!', 'subtitle': '(Long Ver.)', 'artist': 'Other Band', 'pack': 'Pack One',
+          'folder': 'Cafe Remix'},
+         {'idNum': 2, 'title': 'Theme', 'subtitle': '', 'artist': 'Nobody', 'pack': 'Pack Two',
+          'folder': 'Theme [Nobody]'}]
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class SearchIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        builder = SearchIndexBuilder()
+        for song in SONGS:
+            builder.addSong(song)
+        with tempfile.TemporaryDirectory() as tempDirectory:
+            indexPath = os.path.join(tempDirectory, "searchIndex.json")
+            builder.write(indexPath)
+            cls.index = loadSearchIndex(indexPath)
+
+    def getIds(self, results):
+        return [idNum for idNum, fields in results]
+
+    def testNormalizeText(self):
+        self.assertEqual(normalizeText("Café-Remix!").split(), ["cafe", "remix"])
+
+    def testPrefixSearch(self):
+        self.assertEqual(self.getIds(self.index.search("drea the")), [0])
+        self.assertEqual(self.getIds(self.index.search("band")), [0, 1])
+        self.assertEqual(self.getIds(self.index.search("the")), [0, 2])
+
+    def testAccentsAndPunctuation(self):
+        self.assertEqual(self.getIds(self.index.search("cafe remix")), [1])
+        self.assertEqual(self.getIds(self.index.search("CAFÉ")), [1])
+
+    def testStepArtistFromFolder(self):
+        self.assertEqual(self.getIds(self.index.search("someone")), [0])
+        self.assertEqual(self.index.getDocument(1)['stepartist'], "")
+
+    def testNoMatch(self):
+        self.assertEqual(self.index.search("nothing"), [])
+        self.assertEqual(self.index.search("!!"), [])
+
+    def testFuzzySearch(self):
+        self.assertEqual(self.getIds(self.index.fuzzySearch("dreamr"))[0], 0)
+        self.assertEqual(self.index.fuzzySearch("xyzzy"), [])
+
+    def testLimit(self):
+        self.assertEqual(len(self.index.search("pack", limit=2)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+from containers import serializer
+from containers.serializer import (JsonOutput, decompressJson, dumpsJson, getJsonPath, isJsonFile, loadsJson, readJson,
+                                   writeJson)
+from unittest import mock
+import os
+import gzip
+import tempfile
+import unittest
+
+DATA = {'Pack One': [{'title': "Café ☆ Remix", 'bpm': [120, 240], 'length': 95.25, 'subtitle': "",
+                      'charts': {}, 'music': None, 'flags': [True, False], 'nested': {'a': [{}, []]}}],
+        'Pack Two': [], 'Empty': {}}
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class SerializerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def getPath(self, fileName):
+        return os.path.join(self.tempDirectory.name, fileName)
+
+    def testGetJsonPath(self):
+        self.assertEqual(getJsonPath("jsons/PackA"), "jsons/PackA.json")
+        self.assertEqual(getJsonPath("jsons/PackA", 'gzip'), "jsons/PackA.json.gz")
+        self.assertEqual(getJsonPath("jsons/PackA", 'zstd'), "jsons/PackA.json.zst")
+
+    def testIsJsonFile(self):
+        for fileName in ("PackA.json", "PackA.json.gz", "PackA.json.zst"):
+            self.assertTrue(isJsonFile(fileName), fileName)
+        for fileName in ("PackA.json.tmp", "PackA.gz", "PackA.txt", "json"):
+            self.assertFalse(isJsonFile(fileName), fileName)
+
+    def testRoundTrip(self):
+        for compression in (None, 'gzip', 'zstd'):
+            if compression == 'zstd' and serializer.zstandard is None:
+                continue
+            for compact in (False, True):
+                jsonPath = self.getPath(getJsonPath("data", compression))
+                jsonOut = writeJson(jsonPath, DATA, compact, compression)
+                self.assertEqual(readJson(jsonPath), DATA)
+                self.assertEqual(jsonOut.rawBytes, len(dumpsJson(DATA, compact)))
+                self.assertEqual(jsonOut.bytesWritten, os.path.getsize(jsonPath))
+                self.assertFalse(os.path.exists(jsonPath + ".tmp"))
+
+    def testGzipIsReadable(self):
+        jsonPath = self.getPath("data.json.gz")
+        writeJson(jsonPath, DATA, compression='gzip')
+        with gzip.open(jsonPath, 'rb') as jsonFile:
+            self.assertEqual(jsonFile.read(), dumpsJson(DATA))
+
+    def testZstdWithoutZstandard(self):
+        with mock.patch.object(serializer, 'zstandard', None):
+            with self.assertRaises(ImportError):
+                JsonOutput(self.getPath("data.json.zst"), 'zstd')
+            with self.assertRaises(ImportError):
+                decompressJson(b"\x28\xb5\x2f\xfd" + b"\x00" * 8)
+
+    def testUnknownCompression(self):
+        with self.assertRaises(ValueError):
+            JsonOutput(self.getPath("data.json.xz"), 'xz')
+
+    def testFailedWriteKeepsOldFile(self):
+        jsonPath = self.getPath("data.json")
+        writeJson(jsonPath, DATA)
+        with self.assertRaises(RuntimeError):
+            with JsonOutput(jsonPath) as jsonOut:
+                jsonOut.write(b"{\"half\": ")
+                raise RuntimeError("interrupted")
+        self.assertEqual(readJson(jsonPath), DATA)
+        self.assertEqual(os.listdir(self.tempDirectory.name), ["data.json"])
+
+    def testIndentedOutput(self):
+        self.assertEqual(dumpsJson({'a': [1]}), b'{\n  "a": [\n    1\n  ]\n}')
+        self.assertEqual(dumpsJson({'a': [1]}, compact=True), b'{"a":[1]}')
+
+    def testStdlibFallbackGivesTheSameBytes(self):
+        withEncoder = [dumpsJson(DATA), dumpsJson(DATA, compact=True)]
+        with mock.patch.object(serializer, 'orjson', None):
+            self.assertEqual(serializer.getEncoderName(), "json")
+            self.assertEqual([dumpsJson(DATA), dumpsJson(DATA, compact=True)], withEncoder)
+            self.assertEqual(loadsJson(dumpsJson(DATA)), DATA)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+from containers.serializer import dumpsJson, readJson
+from containers.shards import ShardWriter, getPackEntry, loadShardManifest
+import os
+import tempfile
+import unittest
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makePack(packName, firstId, songCount):
+    return [{'title': packName + " " + str(idNum), 'pack': packName, 'charts': {}, 'idNum': idNum}
+            for idNum in range(firstId, firstId + songCount)]
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ShardWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.shardsDirectory = os.path.join(self.tempDirectory.name, "shards")
+        self.packs = {"PackA": makePack("PackA", 0, 3), "PackB": makePack("PackB", 3, 2),
+                      "PackC": makePack("PackC", 5, 40), "PackD": makePack("PackD", 45, 1)}
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeShards(self, maxShardBytes, compact=False, compression=None):
+        shardWriter = ShardWriter(self.shardsDirectory, maxShardBytes, compact, compression)
+        for packName, songs in self.packs.items():
+            shardWriter.addPack(packName, songs)
+        return shardWriter.finish()
+
+    def readShards(self, manifest):
+        """
+        Returns the songs of every pack, in order, put back together from the shards.
+        """
+        packs = {}
+        for shard in manifest['shards']:
+            for packName, songs in readJson(os.path.join(self.shardsDirectory, shard['file'])).items():
+                packs.setdefault(packName, []).extend(songs)
+        return packs
+
+    def testPackEntryMatchesDumpsJson(self):
+        for compact in (False, True):
+            entries = [getPackEntry(packName, dumpsJson(songs, compact), compact, packName == "PackA")
+                       for packName, songs in self.packs.items()]
+            closing = b"}" if compact else b"\n}"
+            self.assertEqual(b"{" + b"".join(entries) + closing, dumpsJson(self.packs, compact))
+
+    def testShardsHoldEveryPack(self):
+        for compact, compression in ((False, None), (True, None), (False, 'gzip')):
+            manifest = self.writeShards(1500, compact, compression)
+            self.assertEqual(self.readShards(manifest), self.packs)
+            self.assertEqual(manifest['songs'], 46)
+            self.assertEqual(loadShardManifest(self.shardsDirectory), manifest)
+
+    def testBigPackIsSplit(self):
+        manifest = self.writeShards(1500)
+        packCShards = [shard for shard in manifest['shards'] if "PackC" in shard['packs']]
+        self.assertGreater(len(packCShards), 1)
+        self.assertEqual([shard['packs'] for shard in packCShards], [["PackC"]] * len(packCShards))
+        self.assertEqual(packCShards[0]['idRange'][0], 5)
+        self.assertEqual(packCShards[-1]['idRange'][1], 44)
+        for shard, nextShard in zip(packCShards, packCShards[1:]):
+            self.assertEqual(shard['idRange'][1] + 1, nextShard['idRange'][0])
+
+    def testSmallPacksShareAShard(self):
+        manifest = self.writeShards(1024 * 1024)
+        self.assertEqual(len(manifest['shards']), 1)
+        self.assertEqual(manifest['shards'][0]['packs'], list(self.packs))
+        self.assertEqual(manifest['shards'][0]['idRange'], [0, 45])
+
+    def testStaleShardsAreRemoved(self):
+        oldManifest = self.writeShards(1500)
+        del self.packs["PackC"]
+        manifest = self.writeShards(1500)
+        shardFiles = sorted(fileName for fileName in os.listdir(self.shardsDirectory) if fileName != "manifest.json")
+        self.assertEqual(shardFiles, sorted(shard['file'] for shard in manifest['shards']))
+        self.assertNotEqual(oldManifest['shards'], manifest['shards'])
+
+if __name__ == '__main__':
+    unittest.main()
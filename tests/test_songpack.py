@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+from containers.parsecache import ParseCache, getParseKey
+from containers.serializer import dumpsJson
+from containers.songpack import discoverSongPacks, parseSongPacksParallel
+from containers.stepfile import DEFAULT_ENCODINGS
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makeStepfile(title, measures, difficulties=("Easy", "Hard")):
+    """
+    Returns the text of a small stepfile. More measures give a bigger file, so
+    the songs of a pack aren't submitted to the pool in folder order.
+    """
+    notes = ",\n".join("1000\n0100\n0010\n0001\n" for measure in range(measures))
+    charts = "".join("#NOTES:\n     dance-single:\n     Someone:\n     {0}:\n     {1}:\n     0,0,0,0,0:\n{2};\n"
+                     .format(difficulty, rating + 1, notes) for rating, difficulty in enumerate(difficulties))
+    return "#TITLE:{0};\n#SUBTITLE:;\n#ARTIST:Artist;\n#BANNER:bn.png;\n#BPMS:0.000=150.000;\n{1}".format(title, charts)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ParallelParseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.songsDirectory = os.path.join(self.tempDirectory.name, "Songs")
+        measures = [3, 40, 1, 25, 8, 60, 2]
+        for songNumber, songMeasures in enumerate(measures):
+            packName = "Pack" + "AB"[songNumber % 2]
+            self.writeStepfile(packName, "Song" + str(songNumber), makeStepfile("Song " + str(songNumber), songMeasures))
+        self.writeStepfile("PackC", "Only", makeStepfile("Only", 5, ("Challenge",)))
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeStepfile(self, packName, songFolder, contents):
+        songPath = os.path.join(self.songsDirectory, packName, songFolder)
+        os.makedirs(songPath, exist_ok=True)
+        with open(os.path.join(songPath, songFolder + ".sm"), 'w') as smFile:
+            smFile.write(contents)
+
+    def parseSerial(self):
+        packs = discoverSongPacks(self.songsDirectory)
+        for pack in packs:
+            pack.parseStepfiles()
+        return {pack.getPackName(): (pack.getSongTitles(), dumpsJson(pack.getSongs())) for pack in packs}
+
+    def parseParallel(self, jobs, cache=None):
+        packs = parseSongPacksParallel(discoverSongPacks(self.songsDirectory), jobs, cache)
+        return {pack.getPackName(): (pack.getSongTitles(), dumpsJson(pack.getSongs())) for pack in packs}
+
+    def testParallelMatchesSerial(self):
+        serialPacks = self.parseSerial()
+        self.assertEqual(sorted(serialPacks), ["PackA", "PackB", "PackC"])
+        for jobs in (2, 3):
+            self.assertEqual(self.parseParallel(jobs), serialPacks)
+
+    def testParallelWithCacheMatchesSerial(self):
+        serialPacks = self.parseSerial()
+        cachePath = os.path.join(self.tempDirectory.name, "parsecache.json")
+        for expectedHits in (0, 8):
+            cache = ParseCache(cachePath, parseKey=getParseKey(DEFAULT_ENCODINGS))
+            cache.load()
+            self.assertEqual(self.parseParallel(2, cache), serialPacks)
+            self.assertEqual(cache.hits, expectedHits)
+            cache.save()
+
+    def testBrokenSongOnlyDropsItsPack(self):
+        self.writeStepfile("PackB", "Broken", "#TITLE:No subtitle or artist;\n")
+        packs = discoverSongPacks(self.songsDirectory)
+        brokenPack = [pack for pack in packs if pack.getPackName() == "PackB"][0]
+        with self.assertRaises(KeyError):
+            brokenPack.parseStepfiles()
+
+        # The worker's error comes back with the song instead of stopping the pool.
+        parallelPacks = self.parseParallel(2)
+        self.assertEqual(sorted(parallelPacks), ["PackA", "PackC"])
+        shutil.rmtree(os.path.join(self.songsDirectory, "PackB", "Broken"))
+        serialPacks = self.parseSerial()
+        self.assertEqual(parallelPacks, {packName: serialPacks[packName] for packName in ("PackA", "PackC")})
+
+    def testUnreadableSongIsReported(self):
+        packs = discoverSongPacks(self.songsDirectory)
+        os.remove(os.path.join(self.songsDirectory, "PackC", "Only", "Only.sm"))
+        parsedPacks = parseSongPacksParallel(packs, 2)
+        self.assertEqual(sorted(pack.getPackName() for pack in parsedPacks), ["PackA", "PackB"])
+
+    def testScriptWritesTheSameJsons(self):
+        jsonsDirectories = []
+        for jobs in ("1", "2"):
+            songsDirectory = self.songsDirectory + jobs
+            shutil.copytree(self.songsDirectory, songsDirectory)
+            subprocess.run([sys.executable, os.path.join(REPO_DIRECTORY, "parsesongsfolder.py"), "--no-cache", "--jobs", jobs],
+                           input=songsDirectory + "\n", cwd=REPO_DIRECTORY, capture_output=True, text=True, check=True)
+            jsonsDirectories.append(os.path.join(songsDirectory, "jsons"))
+        serialNames, parallelNames = [sorted(os.listdir(jsonsDirectory)) for jsonsDirectory in jsonsDirectories]
+        self.assertEqual(serialNames, ["PackA.json", "PackB.json", "PackC.json"])
+        self.assertEqual(parallelNames, serialNames)
+        for jsonName in serialNames:
+            jsonContents = []
+            for jsonsDirectory in jsonsDirectories:
+                with open(os.path.join(jsonsDirectory, jsonName), 'rb') as jsonFile:
+                    jsonContents.append(jsonFile.read())
+            self.assertEqual(jsonContents[0], jsonContents[1])
+
+if __name__ == '__main__':
+    unittest.main()
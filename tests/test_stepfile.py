@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+from containers.stepfile import (DEFAULT_ENCODINGS, Stepfile, tokenizeStepfile, countStepData, parseBpmString,
+                                  decodeValue, detectEncoding)
+import os
+import codecs
+import tempfile
+import unittest
+
+SIMPLE_CHART = """0000
+1000
+0000
+0000
+,
+0110
+0200
+0300
+M004
+,
+0000
+0030
+0000
+0000
+"""
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class TokenizeStepfileTest(unittest.TestCase):
+
+    def tokenize(self, text):
+        return list(tokenizeStepfile(text.splitlines(True)))
+
+    def testOneRecordPerLine(self):
+        self.assertEqual(self.tokenize("#TITLE:Song;\n#ARTIST:Someone;\n"),
+                         [('TITLE', 'Song'), ('ARTIST', 'Someone')])
+
+    def testSeveralRecordsOnOneLine(self):
+        self.assertEqual(self.tokenize("#TITLE:a;#SUBTITLE:b; #ARTIST:c;\n"),
+                         [('TITLE', 'a'), ('SUBTITLE', 'b'), ('ARTIST', 'c')])
+
+    def testTagsAreUpperCased(self):
+        self.assertEqual(self.tokenize("#title:Song;\n"), [('TITLE', 'Song')])
+
+    def testMultiLineValue(self):
+        self.assertEqual(self.tokenize("#BPMS:0.000=120.000\n ,32.000=240.000;\n"),
+                         [('BPMS', '0.000=120.000\n,32.000=240.000')])
+        self.assertEqual(self.tokenize("#NOTES:\n1000\n;\n"), [('NOTES', '\n1000\n')])
+
+    def testCommentsAreDropped(self):
+        self.assertEqual(self.tokenize("// header\n#TITLE:Song; // the title\n#ARTIST:Some//one;\n"),
+                         [('TITLE', 'Song'), ('ARTIST', 'Some')])
+
+    def testMissingSemicolonEndsAtNextTag(self):
+        self.assertEqual(self.tokenize("#TITLE:Song\n#ARTIST:Someone;\n#CREDIT:Me\n"),
+                         [('TITLE', 'Song'), ('ARTIST', 'Someone'), ('CREDIT', 'Me')])
+
+    def testTextOutsideRecordsIsIgnored(self):
+        self.assertEqual(self.tokenize("junk\n#TITLE:Song;\nmore junk\n"), [('TITLE', 'Song')])
+
+    def testBytesGiveTheSameRecords(self):
+        text = "#TITLE:a;#SUBTITLE:b;\n#BPMS:0=120\n,4=140;\n// comment\n#ARTIST:c\n#NOTES:\n dance-single:\n:\n1000\n;\n"
+        textRecords = self.tokenize(text)
+        byteRecords = list(tokenizeStepfile(text.encode("ascii").splitlines(True)))
+        self.assertEqual([(tag, value.decode("ascii")) for tag, value in byteRecords], textRecords)
+        self.assertTrue(all(isinstance(value, bytes) for tag, value in byteRecords))
+
+class CountStepDataTest(unittest.TestCase):
+
+    def testCounts(self):
+        self.assertEqual(countStepData(SIMPLE_CHART), {'note': 4, 'hold': 1, 'roll': 1, 'mine': 1})
+
+    def testBytesGiveTheSameCounts(self):
+        self.assertEqual(countStepData(SIMPLE_CHART.encode("ascii")), countStepData(SIMPLE_CHART))
+
+    def testJumpsCountOnce(self):
+        self.assertEqual(countStepData("1111\n,\n1100\n")['note'], 2)
+
+    def testSeparatorLinesWithTextAreNotRows(self):
+        self.assertEqual(countStepData("1000\n, // measure 2\n0100\n;\n")['note'], 2)
+
+    def testEmptyChart(self):
+        self.assertEqual(countStepData(""), {'note': 0, 'hold': 0, 'roll': 0, 'mine': 0})
+
+class ParseBpmStringTest(unittest.TestCase):
+
+    def testSingleBpm(self):
+        self.assertEqual(parseBpmString("0.000=150.000"), [150])
+
+    def testBpmRange(self):
+        self.assertEqual(parseBpmString("0.000=120.000,32.000=239.600,"), [120, 240])
+
+    def testInvalidString(self):
+        self.assertIsNone(parseBpmString("nonsense"))
+
+class DecodeValueTest(unittest.TestCase):
+
+    def testAscii(self):
+        self.assertEqual(decodeValue(b"Plain Title"), ("Plain Title", 'ascii'))
+
+    def testFirstEncodingThatFits(self):
+        self.assertEqual(decodeValue("Café".encode("utf-8")), ("Café", 'utf-8'))
+        self.assertEqual(decodeValue("さくら".encode("cp932")), ("さくら", 'cp932'))
+        self.assertEqual(decodeValue("Café Señor".encode("cp1252")), ("Café Señor", 'cp1252'))
+
+    def testEncodingsAreTriedInOrder(self):
+        self.assertEqual(decodeValue("さくら".encode("cp932"), ('cp1252', 'cp932')), ("‚³‚\xad‚ç", 'cp1252'))
+
+    def testLastEncodingReplacesWhatDoesntFit(self):
+        self.assertEqual(decodeValue(b"\xff\xfeA", ('utf-8',)), ("\ufffd\ufffdA", 'utf-8'))
+
+class DetectEncodingTest(unittest.TestCase):
+
+    def testAsciiKeepsTheChain(self):
+        self.assertEqual(detectEncoding(b"#TITLE:Song;\n"), ('ascii', DEFAULT_ENCODINGS))
+
+    def testDetectedEncodingComesFirst(self):
+        self.assertEqual(detectEncoding("#TITLE:さくら;\n".encode("cp932")), ('cp932', ('cp932', 'utf-8', 'cp1252')))
+        self.assertEqual(detectEncoding("#TITLE:Café Señor;\n".encode("cp1252")), ('cp1252', ('cp1252', 'utf-8', 'cp932')))
+
+    def testValuesFallBackWhenTheHeaderIsMixed(self):
+        headerBytes = "#TITLE:さくら;\n".encode("shift_jis") + "#ARTIST:Là;\n".encode("utf-8")
+        encoding, encodings = detectEncoding(headerBytes, ('utf-8', 'shift_jis'))
+        self.assertEqual((encoding, encodings), ('shift_jis', ('shift_jis', 'utf-8')))
+        self.assertEqual(decodeValue("さくら".encode("shift_jis"), encodings), ("さくら", 'shift_jis'))
+        self.assertEqual(decodeValue("Là".encode("utf-8"), encodings), ("Là", 'utf-8'))
+
+class StepfileEncodingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tempDirectory.name, "Pack", "Song"))
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def parseSong(self, smBytes, encodings=DEFAULT_ENCODINGS):
+        with open(os.path.join(self.tempDirectory.name, "Pack", "Song", "song.sm"), 'wb') as smFile:
+            smFile.write(smBytes)
+        songs = []
+        for scan in (False, True):
+            stepfile = Stepfile(os.path.join(self.tempDirectory.name, "Pack"), "Song", "song.sm")
+            stepfile.encodings = encodings
+            if scan:
+                stepfile.scanStepfile(readCharts=True)
+            else:
+                stepfile.parseStepfile()
+            songs.append((stepfile.song.title, stepfile.song.artist, stepfile.song.encoding))
+
+        # The header-only scan has to read the text the same way the full parse does.
+        self.assertEqual(songs[1], songs[0])
+        return songs[0]
+
+    def makeStepfile(self, title, artist="Artist"):
+        return "#TITLE:{0};\n#ARTIST:{1};\n#NOTES:\n dance-single:\n Someone:\n Hard:\n 9:\n 0:\n1000\n;\n".format(title, artist)
+
+    def testShiftJisTitle(self):
+        self.assertEqual(self.parseSong(self.makeStepfile("さくら", "アーティスト").encode("cp932")),
+                         ("さくら", "アーティスト", 'cp932'))
+
+    def testCp1252Title(self):
+        self.assertEqual(self.parseSong(self.makeStepfile("Café Señor").encode("cp1252")), ("Café Señor", "Artist", 'cp1252'))
+
+    def testByteOrderMark(self):
+        smBytes = codecs.BOM_UTF8 + self.makeStepfile("Café").encode("utf-8")
+        self.assertEqual(self.parseSong(smBytes), ("Café", "Artist", 'utf-8'))
+        smBytes = codecs.BOM_UTF8 + self.makeStepfile("Plain").encode("utf-8")
+        self.assertEqual(self.parseSong(smBytes), ("Plain", "Artist", 'ascii'))
+
+    def testEncodingsOverride(self):
+        smBytes = self.makeStepfile("さくら").encode("cp932")
+        self.assertEqual(self.parseSong(smBytes, ('shift_jis',)), ("さくら", "Artist", 'shift_jis'))
+        self.assertEqual(self.parseSong(smBytes, ('cp1252',)), ("‚³‚\xad‚ç", "Artist", 'cp1252'))
+
+if __name__ == '__main__':
+    unittest.main()
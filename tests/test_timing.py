@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+from containers import timing
+from containers.timing import TimingData, analyzeChart, createTimingData, getBreakdown, parseTimingPairs
+from containers.stepfile import countStepData, getChartInfoFromNotes
+from unittest import mock
+import random
+import unittest
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def makeNoteData(measureRows):
+    """
+    Returns the note data of a chart with one measure per entry of measureRows:
+    a tuple of (rows in the measure, rows with a note).
+    """
+    measures = []
+    for rowCount, noteRows in measureRows:
+        measures.append("\n".join("1000" if row < noteRows else "0000" for row in range(rowCount)))
+    return "\n,\n".join(measures) + "\n"
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class TimingDataTest(unittest.TestCase):
+
+    def testParseTimingPairs(self):
+        self.assertEqual(parseTimingPairs("64.000=150.000,\n0.000=120.000,"), [(0.0, 120.0), (64.0, 150.0)])
+        self.assertEqual(parseTimingPairs(""), [])
+
+    def testConstantBpm(self):
+        self.assertEqual(list(TimingData([(0.0, 120.0)]).beatsToSeconds([0.0, 1.0, 4.0, 10.0])), [0.0, 0.5, 2.0, 5.0])
+
+    def testBpmChanges(self):
+        timingData = TimingData([(0.0, 120.0), (4.0, 240.0), (8.0, 60.0)])
+        self.assertEqual(list(timingData.beatsToSeconds([2.0, 4.0, 6.0, 8.0, 9.0])), [1.0, 2.0, 2.5, 3.0, 4.0])
+
+    def testStops(self):
+        timingData = TimingData([(0.0, 120.0)], [(4.0, 1.0), (8.0, 0.5)])
+        # Notes on the stop's beat aren't delayed by it, everything after it is.
+        self.assertEqual(list(timingData.beatsToSeconds([4.0, 5.0, 8.0, 9.0])), [2.0, 3.5, 5.0, 6.0])
+
+    def testOffset(self):
+        timingData = TimingData([(0.0, 120.0)], offset=-0.25)
+        self.assertEqual(list(timingData.beatsToSeconds([0.0, 4.0])), [0.25, 2.25])
+
+    def testWarpsAreDropped(self):
+        timingData = TimingData([(0.0, 120.0), (4.0, -120.0), (8.0, 240.0)])
+        self.assertEqual(list(timingData.beatsToSeconds([6.0, 10.0])), [3.0, 4.5])
+
+    def testCreateTimingData(self):
+        timingData = createTimingData({'BPMS': "0.000=120.000,4.000=240.000", 'STOPS': "4.000=1.000", 'OFFSET': "-0.100"})
+        self.assertAlmostEqual(float(timingData.beatsToSeconds([6.0])[0]), 0.1 + 2.0 + 1.0 + 0.5)
+        self.assertIsNone(createTimingData({'BPMS': "0.000=0.000"}))
+        self.assertIsNone(createTimingData({'BPMS': "nonsense"}))
+
+class BreakdownTest(unittest.TestCase):
+
+    def testBreakdown(self):
+        self.assertEqual(getBreakdown([0, 16, 16, 4, 4, 16, 24, 0, 2]), (4, 2, "2 (2) 2"))
+
+    def testNoStream(self):
+        self.assertEqual(getBreakdown([4, 8, 15]), (0, 0, ""))
+        self.assertEqual(getBreakdown([]), (0, 0, ""))
+
+    def testBreaksOutsideTheStreamDontCount(self):
+        self.assertEqual(getBreakdown([8, 16, 8, 8]), (1, 0, "1"))
+
+class AnalyzeChartTest(unittest.TestCase):
+
+    def testStreamChart(self):
+        timingData = TimingData([(0.0, 120.0)])
+        noteData = makeNoteData([(4, 1), (16, 16), (16, 16), (4, 0), (16, 16)])
+        stepData = countStepData(noteData, timingData)
+        self.assertEqual(stepData['note'], 49)
+        # Every measure takes 2 seconds, the last note is the 16th 16th note of measure 5.
+        self.assertEqual(stepData['length'], round(16.0 * 0.5 + 15 / 16 * 2.0, 3))
+        self.assertEqual(stepData['peakNps'], 8.0)
+        self.assertEqual((stepData['streamMeasures'], stepData['breakMeasures'], stepData['breakdown']), (3, 1, "2 (1) 1"))
+
+    def testPeakNpsFollowsTheBpm(self):
+        timingData = TimingData([(0.0, 120.0), (4.0, 240.0)])
+        stepData = countStepData(makeNoteData([(16, 16), (16, 16)]), timingData)
+        self.assertEqual(stepData['peakNps'], 16.0)
+        self.assertEqual(stepData['length'], round(2.0 + 15 / 16, 3))
+
+    def testEmptyChart(self):
+        self.assertEqual(countStepData(makeNoteData([(4, 0)]), TimingData([(0.0, 120.0)])),
+                         {'note': 0, 'hold': 0, 'roll': 0, 'mine': 0, 'length': 0.0, 'peakNps': 0.0,
+                          'streamMeasures': 0, 'breakMeasures': 0, 'breakdown': ""})
+
+    def testWithoutTiming(self):
+        self.assertEqual(analyzeChart(None, [16], 3.75), {'length': None, 'peakNps': None, 'streamMeasures': None,
+                                                          'breakMeasures': None, 'breakdown': None})
+        self.assertNotIn('length', countStepData(makeNoteData([(4, 1)])))
+
+    def testChartRecordWithoutAnalytics(self):
+        notesValue = "dance-single:Someone:Hard:9::\n" + makeNoteData([(16, 16)])
+        difficultyKey, chartData = getChartInfoFromNotes(notesValue)
+        chart = chartData.toDict()
+        self.assertEqual([chart[field] for field in ('length', 'peakNps', 'streamMeasures', 'breakMeasures', 'breakdown')],
+                         [None] * 5)
+        difficultyKey, chartData = getChartInfoFromNotes(notesValue, TimingData([(0.0, 120.0)]))
+        self.assertEqual((chartData.toDict()['streamMeasures'], chartData.toDict()['breakdown']), (1, "1"))
+
+    def testNumpyAndPythonAgree(self):
+        generator = random.Random(17)
+        for attempt in range(20):
+            bpms = "0.000=" + str(generator.uniform(60, 300))
+            for beat in sorted(generator.sample(range(4, 200, 4), 3)):
+                bpms += "," + str(beat) + ".000=" + str(generator.uniform(60, 300))
+            stops = ",".join(str(beat) + ".000=" + str(generator.uniform(0.1, 2)) for beat in generator.sample(range(200), 2))
+            timingTags = {'BPMS': bpms, 'STOPS': stops, 'OFFSET': str(generator.uniform(-1, 1))}
+            measureRows = [(generator.choice((4, 8, 16, 24, 48)), 0) for measure in range(50)]
+            measureRows = [(rowCount, generator.randint(0, rowCount)) for rowCount, noteRows in measureRows]
+            noteData = makeNoteData(measureRows)
+
+            withNumpy = countStepData(noteData, createTimingData(timingTags))
+            with mock.patch.object(timing, 'numpy', None):
+                withoutNumpy = countStepData(noteData, createTimingData(timingTags))
+            self.assertEqual(withNumpy.keys(), withoutNumpy.keys())
+            for field, value in withNumpy.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(value, withoutNumpy[field], places=2)
+                else:
+                    self.assertEqual(value, withoutNumpy[field])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+from containers.idregistry import IdRegistry
+from containers.serializer import dumpsJson, readJson
+from containers.watcher import InotifyWatcher, PollingWatcher, diffSnapshots, takeSnapshot, waitForChangedPacks
+from watchsongsfolder import patchCombinedJson, writeCombinedJson
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class WatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.songsDirectory = self.tempDirectory.name
+        self.writeStepfile("PackA", "One", "#TITLE:One;")
+        self.writeStepfile("PackA", "Two", "#TITLE:Two;")
+        self.writeStepfile("PackB", "Three", "#TITLE:Three;")
+        os.makedirs(os.path.join(self.songsDirectory, "jsons"))
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeStepfile(self, packName, songFolder, contents):
+        songPath = os.path.join(self.songsDirectory, packName, songFolder)
+        os.makedirs(songPath, exist_ok=True)
+        stepfilePath = os.path.join(songPath, songFolder + ".sm")
+        with open(stepfilePath, 'w') as smFile:
+            smFile.write(contents)
+        return stepfilePath
+
+    def removeStepfile(self, packName, songFolder):
+        os.remove(os.path.join(self.songsDirectory, packName, songFolder, songFolder + ".sm"))
+
+class SnapshotTest(WatcherTestCase):
+
+    def testTakeSnapshot(self):
+        with open(os.path.join(self.songsDirectory, "PackA", "One", "banner.png"), 'wb') as bannerFile:
+            bannerFile.write(b"not a stepfile")
+        os.makedirs(os.path.join(self.songsDirectory, "Empty"))
+        snapshot = takeSnapshot(self.songsDirectory)
+        self.assertEqual(sorted(snapshot), ["Empty", "PackA", "PackB"])
+        self.assertEqual(sorted(os.path.basename(path) for path in snapshot["PackA"]), ["One.sm", "Two.sm"])
+        self.assertEqual(snapshot["Empty"], {})
+        stepfilePath = os.path.join(self.songsDirectory, "PackB", "Three", "Three.sm")
+        self.assertEqual(snapshot["PackB"][stepfilePath][0], len("#TITLE:Three;"))
+
+    def testDiffSnapshots(self):
+        oldSnapshot = takeSnapshot(self.songsDirectory)
+        self.assertEqual(diffSnapshots(oldSnapshot, takeSnapshot(self.songsDirectory)), set())
+        self.writeStepfile("PackA", "One", "#TITLE:One edited;")
+        self.removeStepfile("PackB", "Three")
+        self.writeStepfile("PackC", "Four", "#TITLE:Four;")
+        self.assertEqual(diffSnapshots(oldSnapshot, takeSnapshot(self.songsDirectory)), {"PackA", "PackB", "PackC"})
+
+class PollingWatcherTest(WatcherTestCase):
+
+    def testPackAddedEditedAndRemoved(self):
+        watcher = PollingWatcher(self.songsDirectory, 0.05)
+        self.assertEqual(watcher.getChangedPacks(), set())
+
+        self.writeStepfile("PackC", "Four", "#TITLE:Four;")
+        self.assertEqual(watcher.getChangedPacks(), {"PackC"})
+
+        self.writeStepfile("PackA", "Two", "#TITLE:Two edited;")
+        self.assertEqual(watcher.getChangedPacks(), {"PackA"})
+
+        self.removeStepfile("PackB", "Three")
+        os.rmdir(os.path.join(self.songsDirectory, "PackB", "Three"))
+        os.rmdir(os.path.join(self.songsDirectory, "PackB"))
+        self.assertEqual(watcher.getChangedPacks(), {"PackB"})
+
+        # The jsons folder isn't a pack.
+        with open(os.path.join(self.songsDirectory, "jsons", "PackA.json"), 'w') as jsonFile:
+            jsonFile.write("[]")
+        self.assertEqual(watcher.getChangedPacks(), set())
+
+    def testPollIntervalIsKept(self):
+        watcher = PollingWatcher(self.songsDirectory, 0.5)
+        self.writeStepfile("PackC", "Four", "#TITLE:Four;")
+
+        # Timeouts shorter than the poll interval don't take a snapshot.
+        started = time.monotonic()
+        self.assertEqual(watcher.getChangedPacks(0.05), set())
+        self.assertEqual(watcher.getChangedPacks(0.05), set())
+        self.assertEqual(watcher.getChangedPacks(), {"PackC"})
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+
+    def testWaitForChangedPacks(self):
+        watcher = PollingWatcher(self.songsDirectory, 0.05)
+        self.assertEqual(waitForChangedPacks(watcher, 0.1, timeout=0.2), set())
+        self.writeStepfile("PackA", "One", "#TITLE:One edited;")
+        self.writeStepfile("PackB", "Three", "#TITLE:Three edited;")
+        self.assertEqual(waitForChangedPacks(watcher, 0.1, timeout=5), {"PackA", "PackB"})
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+class InotifyWatcherTest(WatcherTestCase):
+
+    def setUp(self):
+        super().setUp()
+        try:
+            self.watcher = InotifyWatcher(self.songsDirectory)
+        except OSError:
+            self.skipTest("inotify unavailable: " + str(sys.exc_info()[1]))
+
+    def tearDown(self):
+        self.watcher.close()
+        super().tearDown()
+
+    def testEventsMapToPacks(self):
+        self.writeStepfile("PackA", "One", "#TITLE:One edited;")
+        self.assertEqual(waitForChangedPacks(self.watcher, 0.1, timeout=5), {"PackA"})
+
+        # Song folders of a new pack are watched as soon as the pack shows up.
+        os.makedirs(os.path.join(self.songsDirectory, "PackC"))
+        self.assertEqual(waitForChangedPacks(self.watcher, 0.1, timeout=5), {"PackC"})
+        self.writeStepfile("PackC", "Four", "#TITLE:Four;")
+        self.assertEqual(waitForChangedPacks(self.watcher, 0.1, timeout=5), {"PackC"})
+
+        self.removeStepfile("PackB", "Three")
+        self.assertEqual(waitForChangedPacks(self.watcher, 0.1, timeout=5), {"PackB"})
+
+    def testFilesNextToPacksAreIgnored(self):
+        with open(os.path.join(self.songsDirectory, ".songpackcache.json"), 'w') as cacheFile:
+            cacheFile.write("{}")
+        with open(os.path.join(self.songsDirectory, "jsons", "PackA.json"), 'w') as jsonFile:
+            jsonFile.write("[]")
+        self.assertEqual(waitForChangedPacks(self.watcher, 0.1, timeout=0.3), set())
+
+class CombinedJsonTest(unittest.TestCase):
+
+    def testPatchedPacksGiveTheCombinedJson(self):
+        with tempfile.TemporaryDirectory() as tempDirectory:
+            registry = IdRegistry(os.path.join(tempDirectory, "registry.json"))
+            combinedPath = os.path.join(tempDirectory, "allSongPacksJson.json")
+            for compact in (False, True):
+                packJsons = {}
+                allPacksJson = {}
+                for packName in ("PackA", "PackB", "PackC"):
+                    songs = [{'title': packName + " song", 'pack': packName, 'folder': "Song", 'charts': {}}]
+                    patchCombinedJson(packJsons, packName, songs, registry, compact)
+                    allPacksJson[packName] = songs
+                patchCombinedJson(packJsons, "PackB", [], registry, compact)
+                del allPacksJson["PackB"]
+
+                writeCombinedJson(combinedPath, packJsons, compact)
+                with open(combinedPath, 'rb') as combinedFile:
+                    self.assertEqual(combinedFile.read(), dumpsJson(allPacksJson, compact))
+                self.assertEqual([songs[0]['idNum'] for songs in readJson(combinedPath).values()], [0, 2])
+
+                writeCombinedJson(combinedPath, {}, compact)
+                self.assertEqual(readJson(combinedPath), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+
+from containers.songpack import SongPack
+from containers.logconfig import LOG_LEVELS, configureLogging
+from containers.watcher import createWatcher, waitForChangedPacks, takeSnapshot, PollingWatcher
+from containers.serializer import JsonOutput, dumpsJson, getJsonPath, readJson
+from containers.shards import getPackEntry
+from containers.packwriter import PackWriter
+from containers.packbuild import (addPackOptions, getEncodings, openAssetIndex, openParseCache, removePackJsons,
+                                  submitPack)
+from containers.stepfile import DEFAULT_ENCODINGS
+from containers.idregistry import IdRegistry
+import argparse
+import os
+import sys
+import time
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def rebuildPack(songsDirectory, writer, packName, cache, encodings=DEFAULT_ENCODINGS, timingAnalytics=False,
+                assetIndex=None):
+    """
+    Reparses the changed stepfiles of one song pack (unchanged ones come from the
+    cache) and hands its JSON to the PackWriter with submitPack, exactly like
+    parsesongsfolder.py does. A pack that is gone or has no songs left gets its
+    JSON removed.
+
+    Returns the list of song dictionaries of the pack, or [] if it was removed.
+    """
+    packPath = os.path.join(songsDirectory, packName)
+    songs = []
+    if os.path.isdir(packPath):
+        pack = SongPack(packPath, encodings, timingAnalytics)
+        pack.retrieveSongFolders()
+        pack.constructStepfiles(); pack.parseStepfiles(cache=cache)
+        songs = submitPack(writer, pack, cache, assetIndex=assetIndex, scriptName="watchsongsfolder.py")
+
+    if songs == []:
+        if os.path.exists(writer.getPackJsonPath(packName)):
+            print(">>> watchsongsfolder.py: WRITE: Song Pack '" + packName + "' is gone. Removing its JSON.")
+        removePackJsons(os.path.join(writer.jsonsDir, packName))
+        cache.packs.pop(packName, None)
+    return songs
+
+def updatePacks(songsDirectory, jsonsDir, packNames, cache, registry, packJsons, args, encodings, assetIndex=None):
+    """
+    Rebuilds the given song packs with the pack options of args (see
+    containers.packbuild.addPackOptions), writing their JSONs on a PackWriter, then
+    patches them into packJsons, numbered by the IdRegistry, and writes the
+    combined JSON. The packs are only patched in once the writer is done with
+    them, since patching numbers their songs.
+
+    Returns the names of the packs that were patched.
+    """
+    rebuiltPacks = {}
+    writer = PackWriter(jsonsDir, compact=args.compact, compression=args.compress)
+    try:
+        for packName in packNames:
+            try:
+                rebuiltPacks[packName] = rebuildPack(songsDirectory, writer, packName, cache, encodings, args.timing,
+                                                     assetIndex)
+            except:
+                print(">>> watchsongsfolder.py: MAKE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                     str(sys.exc_info()[1])))
+    finally:
+        writer.close()
+    for packName, signature in writer.written:
+        cache.setPackSignature(packName, signature)
+    for packName, error in writer.failed:
+        print(">>> watchsongsfolder.py: WRITE: Song Pack '" + packName + "': " + error)
+
+    for packName, songs in rebuiltPacks.items():
+        patchCombinedJson(packJsons, packName, songs, registry, args.compact)
+    combinedPath = getJsonPath(os.path.join(jsonsDir, "allSongPacksJson"), args.compress)
+    writeCombinedJson(combinedPath, packJsons, args.compact, args.compress)
+    removePackJsons(os.path.join(jsonsDir, "allSongPacksJson"), combinedPath)
+    return list(rebuiltPacks)
+
+def loadCombinedJson(combinedPath, compact=False):
+    """
+    Returns the packs of the combined JSON written by combinejsons.py as a
+    dictionary of pack name -> the JSON bytes of its songs (see patchCombinedJson),
+    or an empty dictionary if there isn't a readable one yet.
+    """
+    try:
+        return {packName: dumpsJson(songs, compact) for packName, songs in readJson(combinedPath).items()}
+    except FileNotFoundError:
+        return {}
+    except:
+        print(">>> watchsongsfolder.py: COMBINE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                               str(sys.exc_info()[1])))
+        return {}
+
+def patchCombinedJson(packJsons, packName, songs, registry, compact=False):
+    """
+    Replaces the JSON of one pack in packJsons, or drops it if songs is empty.
+    Only the serialized songs of every pack are kept, so a change never touches
+    the songs of the other packs. The songs are numbered by the IdRegistry,
+    like combinejsons.py --registry does, so unchanged songs and charts keep
+    their Id's and a later full combine with the same registry hands out the
+    same ones.
+    """
+    if songs == []:
+        packJsons.pop(packName, None)
+        return
+    for song in songs:
+        registry.assignIds(song)
+    packJsons[packName] = dumpsJson(songs, compact)
+
+def writeCombinedJson(combinedPath, packJsons, compact=False, compression=None):
+    """
+    Writes the combined JSON from the JSON of every pack in packJsons, the same
+    as combinejsons.py would write it, without serializing any songs again.
+    """
+    with JsonOutput(combinedPath, compression) as jsonOut:
+        jsonOut.write(b"{")
+        for packIndex, (packName, packJson) in enumerate(packJsons.items()):
+            jsonOut.write(getPackEntry(packName, packJson, compact, packIndex == 0))
+        jsonOut.write(b"}" if compact or packJsons == {} else b"\n}")
+    return jsonOut
+
+def saveRegistry(registry, packNames):
+    """
+    Ends the registry run for the packs that were patched and saves it.
+    Packs that weren't patched (e.g. because they failed to parse) keep their
+    songs in the registry.
+    """
+    delta = registry.finishRun(packNames)
+    registry.save()
+    print(">>> watchsongsfolder.py: REGISTRY: " + str(len(delta['added'])) + " charts added, " + str(len(delta['changed'])) +
+          " changed, " + str(len(delta['removed'])) + " removed.")
+
+# MAIN
+# python3 watchsongsfolder.py C:\dev\cs_site\site_idea\Songs
+if __name__ == "__main__":
+
+    # Command line options.
+    parser = argparse.ArgumentParser(description="Keep the song pack JSONs and the combined JSON of a Stepmania "
+                                                 "Songs directory up to date while packs are added, changed or removed.")
+    parser.add_argument("songsDirectory", nargs="?", default=None,
+                        help="Full path to the Songs directory. Asked for when left out.")
+    parser.add_argument("--debounce", type=float, default=1.0,
+                        help="Seconds without new file events before changed packs are rebuilt. Defaults to 1.")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="Seconds between directory snapshots when inotify isn't available. Defaults to 2.")
+    parser.add_argument("--polling", action="store_true",
+                        help="Always poll with directory snapshots, even where inotify is available.")
+    parser.add_argument("--log-level", default="WARNING", type=str.upper, choices=LOG_LEVELS,
+                        help="Logging level of the container modules, one of %(choices)s. Defaults to WARNING.")
+    parser.add_argument("--log-file", default=None,
+                        help="Also write the container modules' log to this file.")
+    parser.add_argument("--registry", default=None,
+                        help="Path of the Id registry songs and charts are numbered with. Defaults to "
+                             "'.songpackregistry.json' in the Songs directory. Give combinejsons.py the same "
+                             "--registry so both hand out the same Id's.")
+    addPackOptions(parser)
+    args = parser.parse_args()
+    configureLogging(args.log_level, args.log_file)
+    encodings = getEncodings(parser, args)
+
+    print(">>> watchsongsfolder.py keeps the JSONs of a Stepmania Songs directory up to date, "
+          "reparsing only the song packs that change.")
+
+    songsDirectory = args.songsDirectory
+    while True:
+        try:
+            if songsDirectory is None:
+                songsDirectory = (input(">>> Input full path to directory of Songs directory: ")).strip()
+            jsonsDir = os.path.join(songsDirectory, "jsons")
+            if not os.path.isdir(songsDirectory):
+                raise FileNotFoundError("No such directory: '" + songsDirectory + "'")
+            os.makedirs(jsonsDir, exist_ok=True)
+            break
+        except:
+            print(">>> watchsongsfolder.py: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                           str(sys.exc_info()[1])))
+            songsDirectory = None
+
+    # Same parse cache, asset cache and options as parsesongsfolder.py, so neither undoes the other's work.
+    cache = openParseCache(args, songsDirectory, encodings)
+    assetIndex = openAssetIndex(args, cache)
+    registryPath = args.registry
+    if registryPath is None:
+        registryPath = os.path.join(songsDirectory, ".songpackregistry.json")
+    registry = IdRegistry(registryPath)
+    try:
+        registry.load()
+    except:
+        print(">>> watchsongsfolder.py: REGISTRY: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                  str(sys.exc_info()[1])))
+        sys.exit(1)
+    combinedPath = getJsonPath(os.path.join(jsonsDir, "allSongPacksJson"), args.compress)
+
+    # Start the watcher before the first refresh so nothing that changes during it is missed.
+    if args.polling:
+        watcher = PollingWatcher(songsDirectory, args.poll_interval)
+    else:
+        watcher = createWatcher(songsDirectory, args.poll_interval)
+    print(">>> watchsongsfolder.py: WATCH: Using " + type(watcher).__name__ + ".")
+
+    # Bring everything up to date once. Unchanged stepfiles come from the cache.
+    start = time.time()
+    packNames = sorted(takeSnapshot(songsDirectory))
+    packJsons = loadCombinedJson(combinedPath, args.compact)
+    patchedPacks = updatePacks(songsDirectory, jsonsDir, packNames + sorted(set(packJsons) - set(packNames)), cache,
+                               registry, packJsons, args, encodings, assetIndex)
+    saveRegistry(registry, patchedPacks)
+    cache.save()
+    if assetIndex is not None:
+        assetIndex.cache.save()
+    print(">>> watchsongsfolder.py: MAKE: " + str(len(packJsons)) + " Song Packs up to date in " +
+          str(round(time.time() - start, 3)) + " seconds. " + str(cache.hits) + " songs from cache, " +
+          str(cache.misses) + " parsed.")
+
+    # Rebuild only the packs that change from now on.
+    print(">>> watchsongsfolder.py: WATCH: Watching '" + songsDirectory + "'. Press Ctrl+C to stop.")
+    try:
+        while True:
+            changedPacks = waitForChangedPacks(watcher, args.debounce)
+            start = time.time()
+            hits, misses = cache.hits, cache.misses
+            try:
+                patchedPacks = updatePacks(songsDirectory, jsonsDir, sorted(changedPacks), cache, registry, packJsons,
+                                           args, encodings, assetIndex)
+                saveRegistry(registry, patchedPacks)
+                # Other packs weren't looked at, so their cache entries have to stay.
+                cache.save(prune=False)
+                if assetIndex is not None:
+                    assetIndex.cache.save(prune=False)
+            except:
+                print(">>> watchsongsfolder.py: WRITE: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                      str(sys.exc_info()[1])))
+            print(">>> watchsongsfolder.py: WATCH: Updated " + str(len(changedPacks)) + " Song Packs (" +
+                  str(cache.misses - misses) + " songs parsed, " + str(cache.hits - hits) + " from cache) in " +
+                  str(round(time.time() - start, 3)) + " seconds.")
+    except KeyboardInterrupt:
+        print(">>> watchsongsfolder.py: WATCH: Stopped.")
+    finally:
+        watcher.close()